@@ -0,0 +1,276 @@
+# bench_convergence.py
+"""Benchmark de convergência em topologias simuladas (transport.VirtualNetwork).
+
+Monta uma topologia (line, ring, grid ou random) com N roteadores num processo
+só, com relógio virtual, e mede em fases:
+  - start:  partida a frio de todos os roteadores
+  - link:   queda de um enlace escolhido ao acaso
+  - router: falha de um roteador escolhido ao acaso
+Para cada fase: tempo até a última mudança de tabela (virtual), se a rede
+estabilizou antes do fim da janela, mensagens/bytes trocados, datagramas
+perdidos, CPU por roteador e rotas erradas em relação ao menor caminho (BFS).
+
+Uso:
+  python bench_convergence.py --topology grid ring --sizes 16 64 --json resultado.json
+  python bench_convergence.py --topology random --sizes 200 --degree 4 --json -
+A ordem de iteração dos sets depende de PYTHONHASHSEED; sem ele definido o
+script se reexecuta com PYTHONHASHSEED=0 para que os resultados se repitam.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+from collections import deque
+from typing import Dict, List, Optional, Set, Tuple
+
+from constants import INFINITY_METRIC, ROUTE_ANNOUNCE_INTERVAL, LOOP_PREVENTION, HOLDDOWN_TIME, ECMP_MAX_PATHS
+from logging_utils import log, ERROR
+from roteador import Router
+from transport import VirtualNetwork
+from utils import int_to_ip, ip_to_int, LOOP_PREVENTION_MODES
+
+TOPOLOGIES = ("line", "ring", "grid", "random")
+FAILURES = ("link", "router")
+BASE_IP = ip_to_int("10.0.0.0")
+
+Edge = Tuple[int, int]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Convergência do roteador em topologias simuladas")
+    parser.add_argument("--topology", nargs="+", choices=TOPOLOGIES, default=["line", "ring", "grid", "random"])
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10, 50], help="roteadores por topologia (10..1000)")
+    parser.add_argument("--degree", type=float, default=3.0, help="grau médio da topologia random")
+    parser.add_argument("--failures", nargs="*", choices=FAILURES, default=list(FAILURES),
+                        help="falhas injetadas depois da partida, em ordem")
+    parser.add_argument("--settle", type=float, default=120.0, help="segundos virtuais de cada fase")
+    parser.add_argument("--latency", type=float, default=0.001, help="latência dos enlaces (s)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--delta", action="store_true", help="roteadores com anúncios incrementais")
+    parser.add_argument("--binary", action="store_true", help="roteadores com formato binário")
+    parser.add_argument("--loop-prevention", choices=LOOP_PREVENTION_MODES, default=LOOP_PREVENTION,
+                        help="prevenção de laços dos roteadores")
+    parser.add_argument("--infinity", type=int, default=INFINITY_METRIC, help="métrica infinita")
+    parser.add_argument("--max-paths", type=int, default=ECMP_MAX_PATHS, help="caminhos de mesmo custo (ECMP)")
+    parser.add_argument("--holddown", type=float, default=HOLDDOWN_TIME, help="hold-down em segundos (0 = desligado)")
+    parser.add_argument("--per-router", action="store_true", help="inclui a CPU de cada roteador no JSON")
+    parser.add_argument("--json", metavar="ARQUIVO", help="grava os resultados em JSON ('-' = stdout)")
+    return parser.parse_args()
+
+
+# ------------------------
+# Topologias
+# ------------------------
+def build_edges(kind: str, n: int, degree: float, rng: random.Random) -> List[Edge]:
+    if kind == "line":
+        return [(i, i + 1) for i in range(n - 1)]
+    if kind == "ring":
+        return [(i, (i + 1) % n) for i in range(n)] if n > 2 else [(0, 1)][:n - 1]
+    if kind == "grid":
+        cols = math.ceil(math.sqrt(n))
+        edges = []
+        for i in range(n):
+            if (i + 1) % cols and i + 1 < n:
+                edges.append((i, i + 1))
+            if i + cols < n:
+                edges.append((i, i + cols))
+        return edges
+    # random: árvore aleatória (conexa) + enlaces extras até o grau médio pedido
+    edges = {(rng.randrange(i), i) for i in range(1, n)}
+    target = max(len(edges), int(degree * n / 2))
+    max_edges = n * (n - 1) // 2
+    while len(edges) < min(target, max_edges):
+        a, b = rng.sample(range(n), 2)
+        edges.add((min(a, b), max(a, b)))
+    return sorted(edges)
+
+
+def shortest_hops(n: int, edges: List[Edge], src: int) -> Dict[int, int]:
+    adj: Dict[int, List[int]] = {i: [] for i in range(n)}
+    for a, b in edges:
+        adj[a].append(b)
+        adj[b].append(a)
+    dist = {src: 0}
+    queue = deque([src])
+    while queue:
+        u = queue.popleft()
+        for v in adj[u]:
+            if v not in dist:
+                dist[v] = dist[u] + 1
+                queue.append(v)
+    return dist
+
+
+# ------------------------
+# Simulação
+# ------------------------
+class Experiment:
+    def __init__(self, n: int, edges: List[Edge], args):
+        self.n = n
+        self.infinity = args.infinity
+        self.edges = list(edges)
+        self.ips = [int_to_ip(BASE_IP + i + 1) for i in range(n)]
+        self.net = VirtualNetwork(latency=args.latency)
+        neighbors: Dict[int, Set[str]] = {i: set() for i in range(n)}
+        for a, b in edges:
+            neighbors[a].add(self.ips[b])
+            neighbors[b].add(self.ips[a])
+            self.net.add_link(self.ips[a], self.ips[b])
+        self.routers: List[Router] = []
+        for i, ip in enumerate(self.ips):
+            router = Router(ip, neighbors[i], delta_updates=args.delta, binary_wire=args.binary,
+                            scheduler=self.net.scheduler_for(ip), transport=self.net.transport_for(ip),
+                            loop_prevention=args.loop_prevention, infinity=args.infinity,
+                            holddown=args.holddown, max_paths=args.max_paths)
+            self.net.add_router(router)
+            self.routers.append(router)
+        self.down_routers: Set[int] = set()
+        self.down_edges: Set[Edge] = set()
+        self._versions = {r.ip: r.table.version for r in self.routers}
+        self.last_change = 0.0
+        self.net.on_event = self._on_event
+
+    def _on_event(self, ip: str, now: float):
+        version = self.net.routers[ip].table.version
+        if version != self._versions[ip]:
+            self._versions[ip] = version
+            self.last_change = now
+
+    def run_phase(self, name: str, settle: float, action=None) -> dict:
+        net = self.net
+        t0 = net.clock.now
+        sent0 = {ip: s for ip, s in net.sent.items()}
+        cpu0 = dict(net.cpu)
+        dropped0 = net.dropped
+        self.last_change = t0
+        wall0 = time.perf_counter()
+        if action is not None:
+            action()
+        events = net.run_until(t0 + settle)
+        wall = time.perf_counter() - wall0
+
+        cpu = {ip: net.cpu[ip] - cpu0.get(ip, 0.0) for ip in net.cpu}
+        messages = sum(net.sent[ip][0] - sent0.get(ip, (0, 0))[0] for ip in net.sent)
+        nbytes = sum(net.sent[ip][1] - sent0.get(ip, (0, 0))[1] for ip in net.sent)
+        up_cpu = sorted(cpu[self.ips[i]] for i in range(self.n) if i not in self.down_routers)
+        # estabilizou se a última mudança ficou longe do fim da janela
+        quiet = t0 + settle - self.last_change
+        result = {
+            "phase": name,
+            "convergence_s": round(self.last_change - t0, 6),
+            "converged": quiet >= 2 * ROUTE_ANNOUNCE_INTERVAL,
+            "messages": messages,
+            "bytes": nbytes,
+            "dropped": net.dropped - dropped0,
+            "events": events,
+            "wall_s": round(wall, 4),
+            "cpu_total_s": round(sum(up_cpu), 6),
+            "cpu_per_router_mean_ms": round(1000 * sum(up_cpu) / max(1, len(up_cpu)), 4),
+            "cpu_per_router_max_ms": round(1000 * (up_cpu[-1] if up_cpu else 0.0), 4),
+        }
+        result.update(self.check_routes())
+        result["cpu_per_router_ms"] = {ip: round(1000 * c, 4) for ip, c in cpu.items()}
+        return result
+
+    def check_routes(self) -> dict:
+        """Compara as tabelas com o menor caminho (em saltos) na topologia atual."""
+        edges = [(a, b) for a, b in self.edges
+                 if (a, b) not in self.down_edges
+                 and a not in self.down_routers and b not in self.down_routers]
+        wrong = missing = extra = 0
+        for i, router in enumerate(self.routers):
+            if i in self.down_routers:
+                continue
+            dist = shortest_hops(self.n, edges, i)
+            with router.lock:
+                for j, ip in enumerate(self.ips):
+                    if j == i:
+                        continue
+                    route = router.table.get(ip_to_int(ip))
+                    expected = dist.get(j)
+                    if expected is None or expected >= self.infinity:
+                        if route is not None and route.metric < self.infinity:
+                            extra += 1
+                    elif route is None:
+                        missing += 1
+                    elif route.metric != expected:
+                        wrong += 1
+        return {"wrong_routes": wrong, "missing_routes": missing, "extra_routes": extra}
+
+    def fail_link(self, rng: random.Random) -> Optional[Edge]:
+        candidates = [e for e in self.edges if e not in self.down_edges
+                      and e[0] not in self.down_routers and e[1] not in self.down_routers]
+        if not candidates:
+            return None
+        edge = rng.choice(candidates)
+        self.down_edges.add(edge)
+        self.net.set_link(self.ips[edge[0]], self.ips[edge[1]], up=False)
+        return edge
+
+    def fail_router(self, rng: random.Random) -> Optional[int]:
+        candidates = [i for i in range(self.n) if i not in self.down_routers]
+        if len(candidates) < 2:
+            return None
+        i = rng.choice(candidates)
+        self.down_routers.add(i)
+        self.net.set_router(self.ips[i], up=False)
+        return i
+
+
+def run_experiment(kind: str, n: int, args) -> dict:
+    rng = random.Random(f"{args.seed}:{kind}:{n}")
+    random.seed(args.seed)
+    edges = build_edges(kind, n, args.degree, rng)
+    exp = Experiment(n, edges, args)
+    phases = [exp.run_phase("start", args.settle,
+                            lambda: [exp.net.start_router(r) for r in exp.routers])]
+    for failure in args.failures:
+        target = {}
+        if failure == "link":
+            action = lambda: target.update(link=exp.fail_link(rng))
+        else:
+            action = lambda: target.update(router=exp.fail_router(rng))
+        phase = exp.run_phase(failure, args.settle, action)
+        if "link" in target and target["link"] is not None:
+            phase["failed"] = [exp.ips[target["link"][0]], exp.ips[target["link"][1]]]
+        elif target.get("router") is not None:
+            phase["failed"] = exp.ips[target["router"]]
+        phases.append(phase)
+    if not args.per_router:
+        for phase in phases:
+            del phase["cpu_per_router_ms"]
+    return {"topology": kind, "routers": n, "links": len(edges), "phases": phases}
+
+
+def main():
+    if "PYTHONHASHSEED" not in os.environ:
+        os.environ["PYTHONHASHSEED"] = "0"
+        os.execv(sys.executable, [sys.executable] + sys.argv)
+    args = parse_args()
+    log.set_level(ERROR)
+    results = {
+        "config": {k: v for k, v in vars(args).items() if k != "json"},
+        "runs": [run_experiment(kind, n, args) for kind in args.topology for n in args.sizes],
+    }
+    if args.json:
+        text = json.dumps(results, indent=2)
+        if args.json == "-":
+            print(text)
+            return
+        with open(args.json, "w") as f:
+            f.write(text + "\n")
+    print(f"{'topologia':<10}{'N':>6}{'fase':>8}{'conv (s)':>10}{'estável':>9}{'msgs':>9}{'bytes':>11}"
+          f"{'CPU/rot (ms)':>14}{'erradas':>9}{'faltando':>10}{'sobrando':>10}{'real (s)':>10}")
+    for run in results["runs"]:
+        for p in run["phases"]:
+            print(f"{run['topology']:<10}{run['routers']:>6}{p['phase']:>8}{p['convergence_s']:>10.3f}"
+                  f"{'sim' if p['converged'] else 'não':>9}{p['messages']:>9}{p['bytes']:>11}"
+                  f"{p['cpu_per_router_mean_ms']:>14.3f}{p['wrong_routes']:>9}{p['missing_routes']:>10}"
+                  f"{p['extra_routes']:>10}{p['wall_s']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# bench_forwarding.py
+"""Benchmark do encaminhamento com a tabela mudando ao mesmo tempo.
+
+Uma thread fica processando anúncios de dois vizinhos que fazem as rotas
+trocarem de next_hop e sumirem (churn), enquanto outras threads consultam o
+next hop de destinos aleatórios. Mede consultas/s e latência (p50/p99/p99.9/máx) em
+dois modos:
+  - fib:  Router.next_hop_for (FIB publicada, sem lock)
+  - lock: consulta à tabela segurando router.lock (como era antes da FIB)
+
+Uso: python bench_forwarding.py [--routes N] [--duration S] [--readers N] [--json]
+O benchmark cria um Router em 127.0.0.1 (porta PORT), sem iniciar as threads.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from array import array
+from typing import Dict, List
+
+from logging_utils import log, ERROR
+from roteador import Router
+from utils import int_to_ip, ip_to_int
+
+SELF_IP = "127.0.0.1"
+NEIGHBOR_A = "127.0.0.2"
+NEIGHBOR_B = "127.0.0.3"
+BASE_DEST = ip_to_int("10.0.0.0")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Consultas de next hop sob churn de rotas")
+    parser.add_argument("--routes", type=int, default=5000, help="destinos anunciados")
+    parser.add_argument("--duration", type=float, default=2.0, help="segundos por modo")
+    parser.add_argument("--readers", type=int, default=1, help="threads consultando")
+    parser.add_argument("--json", action="store_true", help="saída em JSON")
+    return parser.parse_args()
+
+
+def announcement(dests: List[str], metric: int) -> str:
+    return "".join(f"*{d};{metric}" for d in dests)
+
+
+def churn(router: Router, dests: List[str], stop: threading.Event, counter: List[int]):
+    """A anuncia tudo, B anuncia métrica melhor (troca o next_hop), B retira tudo."""
+    via_a = announcement(dests, 2)
+    via_b = announcement(dests, 1)
+    while not stop.is_set():
+        router.handle_route_announcement(NEIGHBOR_A, via_a)
+        router.handle_route_announcement(NEIGHBOR_B, via_b)
+        router.handle_route_announcement(NEIGHBOR_B, "")
+        counter[0] += 3
+
+
+def lookup_fib(router: Router, dest: str):
+    return router.next_hop_for(dest)
+
+
+def lookup_lock(router: Router, dest: str):
+    with router.lock:
+        route = router.table.get(ip_to_int(dest))
+        return route.next_hop if route else None
+
+
+def reader(router: Router, lookup, dests: List[str], stop: threading.Event, out: array):
+    rng = random.Random()
+    clock = time.perf_counter_ns
+    while not stop.is_set():
+        dest = dests[rng.randrange(len(dests))]
+        t0 = clock()
+        lookup(router, dest)
+        out.append(clock() - t0)
+
+
+def percentile(sorted_values: List[int], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(round(p / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[idx] / 1000.0
+
+
+def run_mode(router: Router, lookup, dests: List[str], duration: float, readers: int) -> Dict[str, float]:
+    stop = threading.Event()
+    announcements = [0]
+    samples = [array("q") for _ in range(readers)]
+    threads = [threading.Thread(target=churn, args=(router, dests, stop, announcements), daemon=True)]
+    threads += [threading.Thread(target=reader, args=(router, lookup, dests, stop, out), daemon=True)
+                for out in samples]
+    for t in threads:
+        t.start()
+    time.sleep(duration)
+    stop.set()
+    for t in threads:
+        t.join()
+    lat = sorted(v for out in samples for v in out)
+    return {
+        "lookups": len(lat),
+        "lookups_per_sec": len(lat) / duration,
+        "p50_us": percentile(lat, 50),
+        "p99_us": percentile(lat, 99),
+        "p999_us": percentile(lat, 99.9),
+        "max_us": percentile(lat, 100),
+        "announcements": announcements[0],
+    }
+
+
+def main():
+    args = parse_args()
+    dests = [int_to_ip(BASE_DEST + i) for i in range(args.routes)]
+    results = {"routes": args.routes, "duration": args.duration, "readers": args.readers, "modes": {}}
+
+    # os handlers logam cada rota alterada: só erros durante as medições
+    log.set_level(ERROR)
+    router = Router(SELF_IP, {NEIGHBOR_A, NEIGHBOR_B})
+    router.send_to = lambda dest_ip, message: None
+    try:
+        for name, lookup in (("fib", lookup_fib), ("lock", lookup_lock)):
+            results["modes"][name] = run_mode(router, lookup, dests, args.duration, args.readers)
+    finally:
+        router.transport.close()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{args.routes} rotas, {args.readers} thread(s) consultando, {args.duration}s por modo")
+    print(f"{'modo':<6}{'consultas/s':>14}{'p50 (us)':>11}{'p99 (us)':>11}{'p99.9 (us)':>12}{'máx (us)':>12}{'anúncios':>10}")
+    for name, r in results["modes"].items():
+        print(f"{name:<6}{r['lookups_per_sec']:>14.0f}{r['p50_us']:>11.2f}{r['p99_us']:>11.2f}{r['p999_us']:>12.2f}"
+              f"{r['max_us']:>12.1f}{r['announcements']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+# bench_hotpaths.py
+"""Microbenchmarks dos caminhos quentes do roteamento em função do tamanho da tabela.
+
+Cada caso roda com tabelas sintéticas de --sizes rotas (destinos /32
+consecutivos a partir de 10.0.0.0) e --neighbors vizinhos, num Router com um
+transporte falso (StubTransport: só conta o que seria enviado, sem rede nem
+threads):
+  - serialize_text / serialize_binary: utils.serialize_table_for_neighbor
+  - parse_text / parse_binary: utils.parse_route_announcement e
+    parse_binary_announcement de todos os datagramas da tabela
+  - handle_changed: Router.handle_route_announcement com a tabela inteira
+    mudando de métrica a cada chamada (merge completo e update disparado)
+  - handle_unchanged: o mesmo anúncio repetido (só o digest)
+  - handle_single / handle_sharded: como handle_changed, mas com a tabela num
+    único anúncio (sem fragmentos, o único caso em que o sharding entra), sem e
+    com --shards processos (sharding.py, experimental)
+  - broadcast_cold / broadcast_cached: Router.broadcast_routes para todos os
+    vizinhos, reserializando (cache de payload limpo antes de cada chamada) ou
+    reaproveitando o cache
+  - format_table / table_text: logging_utils.format_table e Router.table_text
+    (o texto que Router.print_table loga)
+Uma chamada de parse/handle processa todos os datagramas da tabela.
+
+Relata chamadas por segundo, latência por chamada (média, p50 da melhor
+rodada, p99) e o pico
+de memória alocada durante uma chamada (tracemalloc, numa chamada separada
+das cronometradas; só o processo principal). --json grava os resultados; --baseline compara com um
+JSON gravado antes e sai com status 1 se algum caso ficou mais de
+--threshold mais lento (p50) ou usou mais memória.
+
+Uso:
+  python bench_hotpaths.py --json base.json
+  python bench_hotpaths.py --baseline base.json --threshold 0.25
+  python bench_hotpaths.py --cases parse_text handle_changed --sizes 1000 100000
+"""
+import argparse
+import gc
+import json
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional, Tuple
+
+from constants import MAX_DATAGRAM_PAYLOAD
+from logging_utils import format_table, log, ERROR
+from roteador import Router
+from utils import (int_to_ip, ip_to_int, serialize_table_for_neighbor, parse_route_announcement,
+                   parse_binary_announcement)
+
+SELF_IP = "10.255.0.1"
+BASE_DEST = ip_to_int("10.0.0.0")
+BASE_NEIGHBOR = ip_to_int("172.16.0.1")
+
+# roteadores com processos de sharding, encerrados depois da medição do caso
+_SHARDED: List[Router] = []
+
+# (chamada cronometrada, preparação não cronometrada antes de cada chamada)
+Bench = Tuple[Callable[[], object], Optional[Callable[[], None]]]
+
+
+class StubTransport:
+    """Transporte que só conta os datagramas enviados."""
+
+    def __init__(self):
+        self.closed = False
+        self.packets = 0
+        self.bytes = 0
+
+    def sendto(self, data, dest_ip: str):
+        self.packets += 1
+        self.bytes += len(data)
+
+    def recv_into(self, buf: bytearray):
+        raise OSError("transporte falso: não recebe datagramas")
+
+    def open(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Microbenchmarks dos caminhos quentes do roteamento")
+    parser.add_argument("--cases", nargs="+", choices=sorted(CASES), default=list(CASES))
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10, 100, 1000, 10000, 100000],
+                        help="rotas na tabela")
+    parser.add_argument("--neighbors", type=int, default=8, help="vizinhos do roteador")
+    parser.add_argument("--shards", type=int, default=2, help="processos do caso handle_sharded")
+    parser.add_argument("--min-time", type=float, default=0.2, help="segundos mínimos de cada rodada")
+    parser.add_argument("--rounds", type=int, default=3, help="rodadas por caso (o p50 é o da melhor)")
+    parser.add_argument("--min-calls", type=int, default=3, help="chamadas mínimas por caso")
+    parser.add_argument("--json", metavar="ARQUIVO", help="grava os resultados em JSON ('-' = stdout)")
+    parser.add_argument("--baseline", metavar="ARQUIVO", help="JSON de uma execução anterior para comparar")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="piora relativa tolerada no p50 e no pico de memória (0.25 = 25%%)")
+    return parser.parse_args()
+
+
+# ------------------------
+# Tabelas sintéticas
+# ------------------------
+def neighbor_ips(count: int) -> List[str]:
+    return [int_to_ip(BASE_NEIGHBOR + i) for i in range(count)]
+
+
+def table_rows(size: int, neighbors: List[str], metric: int = 2):
+    """Linhas (dest, metric, next_hop, origin) com os next hops distribuídos entre os vizinhos."""
+    return [(BASE_DEST + i, metric, neighbors[i % len(neighbors)], 'learned') for i in range(size)]
+
+
+def announcement(size: int, metric: int, binary: bool, max_size: int = MAX_DATAGRAM_PAYLOAD):
+    """Datagramas de uma tabela completa de size rotas, como um vizinho a enviaria."""
+    rows = [(BASE_DEST + i, metric, "", 'local') for i in range(size)]
+    return serialize_table_for_neighbor(rows, SELF_IP, "172.31.0.1", binary=binary, max_size=max_size)
+
+
+def make_router(neighbors: List[str], binary: bool = False, shards: int = 0) -> Router:
+    router = Router(SELF_IP, set(neighbors), binary_wire=binary, transport=StubTransport(), shards=shards)
+    if router.shards is not None:
+        _SHARDED.append(router)
+    if binary:
+        router.binary_peers.update(neighbors)
+    return router
+
+
+def feed(router: Router, neighbor: str, datagrams):
+    for d in datagrams:
+        router.handle_route_announcement(neighbor, memoryview(d) if isinstance(d, bytes) else d)
+
+
+# ------------------------
+# Casos
+# ------------------------
+def case_serialize(size: int, args, binary: bool) -> Bench:
+    neighbors = neighbor_ips(args.neighbors)
+    rows = table_rows(size, neighbors)
+    # anunciado a um vizinho de fora: nenhuma rota cai no Split Horizon
+    return (lambda: serialize_table_for_neighbor(rows, "172.31.0.1", SELF_IP, binary=binary)), None
+
+
+def case_parse(size: int, args, binary: bool) -> Bench:
+    datagrams = announcement(size, 1, binary)
+    if binary:
+        views = [memoryview(d) for d in datagrams]
+        return (lambda: [parse_binary_announcement(v) for v in views]), None
+    return (lambda: [parse_route_announcement(d) for d in datagrams]), None
+
+
+def case_handle(size: int, args, changed: bool, shards: Optional[int] = None) -> Bench:
+    # só o vizinho que anuncia: os updates disparados não reserializam a tabela para os outros
+    neighbor = neighbor_ips(1)[0]
+    # shards informado (mesmo 0): a tabela vai num anúncio só, sem fragmentos
+    max_size = MAX_DATAGRAM_PAYLOAD if shards is None else 1 << 30
+    router = make_router([neighbor], shards=shards or 0)
+    tables = [announcement(size, 1, False, max_size), announcement(size, 2, False, max_size)]
+    feed(router, neighbor, tables[0])
+    turn = [0]
+
+    def call():
+        if changed:
+            turn[0] ^= 1
+        feed(router, neighbor, tables[turn[0]])
+    return call, None
+
+
+def case_broadcast(size: int, args, cached: bool) -> Bench:
+    neighbors = neighbor_ips(args.neighbors)
+    router = make_router(neighbors)
+    feed(router, neighbors[0], announcement(size, 1, False))
+    router.broadcast_routes()
+    before = None if cached else router._payload_cache.clear
+    return router.broadcast_routes, before
+
+
+def case_format_table(size: int, args) -> Bench:
+    rows = table_rows(size, neighbor_ips(args.neighbors))
+    return (lambda: format_table(rows, SELF_IP)), None
+
+
+def case_table_text(size: int, args) -> Bench:
+    neighbors = neighbor_ips(args.neighbors)
+    router = make_router(neighbors)
+    feed(router, neighbors[0], announcement(size, 1, False))
+    return router.table_text, None
+
+
+CASES: Dict[str, Callable[[int, argparse.Namespace], Bench]] = {
+    "serialize_text": lambda size, args: case_serialize(size, args, False),
+    "serialize_binary": lambda size, args: case_serialize(size, args, True),
+    "parse_text": lambda size, args: case_parse(size, args, False),
+    "parse_binary": lambda size, args: case_parse(size, args, True),
+    "handle_changed": lambda size, args: case_handle(size, args, True),
+    "handle_unchanged": lambda size, args: case_handle(size, args, False),
+    "handle_single": lambda size, args: case_handle(size, args, True, 0),
+    "handle_sharded": lambda size, args: case_handle(size, args, True, args.shards),
+    "broadcast_cold": lambda size, args: case_broadcast(size, args, False),
+    "broadcast_cached": lambda size, args: case_broadcast(size, args, True),
+    "format_table": case_format_table,
+    "table_text": case_table_text,
+}
+
+
+# ------------------------
+# Medição
+# ------------------------
+def percentile(sorted_values: List[int], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(round(p / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[idx] / 1000.0
+
+
+def measure(call: Callable[[], object], before: Optional[Callable[[], None]], args) -> Dict[str, float]:
+    """Cronometra call em --rounds rodadas de pelo menos --min-time segundos.
+    O p50 relatado é o menor entre as rodadas (como o min() do timeit: ruído
+    da máquina só deixa mais lento), o resto usa todas as chamadas."""
+    clock = time.perf_counter_ns
+    samples: List[int] = []
+    round_p50: List[float] = []
+    for _ in range(max(1, args.rounds)):
+        current: List[int] = []
+        # como o timeit: sem coletas do gc no meio das medições
+        gc.collect()
+        gc.disable()
+        try:
+            deadline = time.perf_counter() + args.min_time
+            while len(current) < args.min_calls or time.perf_counter() < deadline:
+                if before is not None:
+                    before()
+                t0 = clock()
+                call()
+                current.append(clock() - t0)
+        finally:
+            gc.enable()
+        current.sort()
+        round_p50.append(percentile(current, 50))
+        samples.extend(current)
+    # memória numa chamada à parte: tracemalloc deixa as alocações bem mais lentas
+    if before is not None:
+        before()
+    tracemalloc.start()
+    try:
+        call()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    total = sum(samples)
+    samples.sort()
+    return {
+        "calls": len(samples),
+        "ops_per_sec": len(samples) / (total / 1e9) if total else 0.0,
+        "mean_us": total / len(samples) / 1000.0,
+        "p50_us": min(round_p50),
+        "p99_us": percentile(samples, 99),
+        "peak_kib": peak / 1024.0,
+    }
+
+
+def compare(results: List[Dict], baseline: List[Dict], threshold: float) -> List[str]:
+    """Casos que pioraram mais que threshold (p50 ou pico de memória) em relação ao baseline."""
+    base = {(r["case"], r["size"]): r for r in baseline}
+    regressions = []
+    for r in results:
+        b = base.get((r["case"], r["size"]))
+        if b is None:
+            continue
+        for key, label in (("p50_us", "p50"), ("peak_kib", "memória")):
+            if b[key] > 0 and r[key] > b[key] * (1 + threshold):
+                regressions.append(f"{r['case']} ({r['size']} rotas): {label} {b[key]:.1f} -> {r[key]:.1f} "
+                                   f"({(r[key] / b[key] - 1) * 100:+.0f}%)")
+    return regressions
+
+
+def main():
+    args = parse_args()
+    # os handlers logam cada rota alterada: só erros durante as medições
+    log.set_level(ERROR)
+    verbose = args.json != "-"
+    if verbose:
+        print(f"{'caso':<18}{'rotas':>8}{'chamadas/s':>12}{'média (us)':>12}{'p50 (us)':>12}"
+              f"{'p99 (us)':>12}{'pico (KiB)':>12}")
+    results = []
+    for case in args.cases:
+        for size in args.sizes:
+            call, before = CASES[case](size, args)
+            row = {"case": case, "size": size}
+            row.update(measure(call, before, args))
+            while _SHARDED:
+                _SHARDED.pop().shards.close()
+            results.append(row)
+            if verbose:
+                print(f"{case:<18}{size:>8}{row['ops_per_sec']:>12.1f}{row['mean_us']:>12.1f}"
+                      f"{row['p50_us']:>12.1f}{row['p99_us']:>12.1f}{row['peak_kib']:>12.1f}", flush=True)
+
+    output = {"config": {k: v for k, v in vars(args).items() if k not in ("json", "baseline")},
+              "results": results}
+    regressions: List[str] = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f)["results"], args.threshold)
+        output["baseline"] = args.baseline
+        output["regressions"] = regressions
+    if args.json:
+        text = json.dumps(output, indent=2)
+        if args.json == "-":
+            print(text)
+        else:
+            with open(args.json, "w") as f:
+                f.write(text + "\n")
+    if args.baseline and verbose:
+        if regressions:
+            print(f"Regressões em relação a {args.baseline} (tolerância {args.threshold * 100:.0f}%):")
+            for line in regressions:
+                print(f"  {line}")
+        else:
+            print(f"Sem regressões em relação a {args.baseline} (tolerância {args.threshold * 100:.0f}%).")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# capture.py
+"""Captura dos datagramas do roteador em um arquivo de trace binário.
+
+O arquivo só cresce (modo append) e é uma sequência de registros:
+
+  segmento  'S', magic 'DVTR', versão, IP do roteador e relógio do roteador
+            na abertura; cada execução que abre o arquivo começa um segmento
+  datagrama 'R' (recebido) ou 'T' (enviado), instante (relógio do roteador:
+            time.time() ou o virtual da simulação), tipo (TRACE_TYPES),
+            IPv4 de origem e de destino, tamanho e os bytes do datagrama
+
+20 bytes de cabeçalho por datagrama. Um registro cortado no fim do arquivo
+(processo morto no meio da gravação) é ignorado pela leitura e descartado
+quando o arquivo é aberto de novo para gravar. replay.py lê o trace e reenvia
+os datagramas recebidos aos handlers de um Router.
+"""
+import os
+import struct
+import threading
+from typing import BinaryIO, Iterator, Optional, Tuple, Union
+from logging_utils import log
+from utils import ip_to_int, int_to_ip
+
+TRACE_MAGIC = b"DVTR"
+TRACE_VERSION = 1
+_SEGMENT = struct.Struct("!c4sBId")
+_RECORD = struct.Struct("!cdBIIH")
+
+SEGMENT = b"S"
+RX = b"R"
+TX = b"T"
+
+# tipo do datagrama pelo primeiro byte (mesmos nomes das métricas de rx/tx do Router)
+TRACE_TYPES = ("route", "hello", "message")
+_TYPE_CODE = {ord("@"): 1, ord("!"): 2}
+
+Datagram = Union[bytes, bytearray, memoryview]
+
+# (direção RX/TX, instante, tipo, origem, destino, datagrama)
+TraceRecord = Tuple[bytes, float, str, str, str, bytes]
+
+
+class TraceWriter:
+    """Grava os datagramas de um roteador no fim do arquivo. Seguro entre
+    threads; ao passar de max_bytes (0 = sem limite) para de gravar."""
+
+    def __init__(self, path: str, router_ip: str, now: float, max_bytes: int = 0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.records = 0
+        self.truncated = False
+        self._lock = threading.Lock()
+        if os.path.exists(path) and os.path.getsize(path):
+            # continua um trace existente a partir do último registro inteiro
+            with open(path, "r+b") as f:
+                end = 0
+                for end, _, _ in _walk(f):
+                    pass
+                f.truncate(end)
+        self._file: Optional[BinaryIO] = open(path, "ab")
+        self.size = self._file.tell()
+        self._write(_SEGMENT.pack(SEGMENT, TRACE_MAGIC, TRACE_VERSION, ip_to_int(router_ip), now))
+
+    def record(self, direction: bytes, now: float, src_ip: str, dest_ip: str, data: Datagram):
+        data = bytes(data)
+        rec = _RECORD.pack(direction, now, _TYPE_CODE.get(data[0], 0) if data else 0,
+                           ip_to_int(src_ip), ip_to_int(dest_ip), len(data)) + data
+        with self._lock:
+            if self._file is None:
+                return
+            if self.max_bytes and self.size + len(rec) > self.max_bytes:
+                if not self.truncated:
+                    self.truncated = True
+                    log.warn("system", "[CAPTURE] %s chegou a %d bytes: captura interrompida", self.path, self.size)
+                return
+            self._write(rec)
+            self.records += 1
+
+    def _write(self, data: bytes):
+        self._file.write(data)
+        self.size += len(data)
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            f, self._file = self._file, None
+        if f is not None:
+            f.close()
+
+
+def read_trace(path: str) -> Iterator[Union[Tuple[bytes, float, str], TraceRecord]]:
+    """Lê um trace em ordem. Segmentos saem como (SEGMENT, relógio na
+    abertura, IP do roteador); datagramas como TraceRecord. Levanta ValueError
+    se o arquivo não for um trace ou tiver um registro inválido."""
+    with open(path, "rb") as f:
+        for _, fields, data in _walk(f):
+            if fields[0] == SEGMENT:
+                _, _, _, router, opened = fields
+                yield SEGMENT, opened, int_to_ip(router)
+            else:
+                kind, ts, code, src, dest, _ = fields
+                yield kind, ts, TRACE_TYPES[code], int_to_ip(src), int_to_ip(dest), data
+
+
+def _walk(f: BinaryIO) -> Iterator[Tuple[int, tuple, bytes]]:
+    """Registros inteiros do arquivo: (posição do fim, campos do cabeçalho, datagrama)."""
+    first = True
+    while True:
+        kind = f.read(1)
+        if not kind:
+            return
+        if kind == SEGMENT:
+            head = kind + f.read(_SEGMENT.size - 1)
+            if len(head) < _SEGMENT.size:
+                return
+            fields = _SEGMENT.unpack(head)
+            if fields[1] != TRACE_MAGIC:
+                raise ValueError("não é um trace do roteador")
+            if fields[2] != TRACE_VERSION:
+                raise ValueError(f"versão de trace não suportada: {fields[2]}")
+            first = False
+            yield f.tell(), fields, b""
+        elif first:
+            raise ValueError("não é um trace do roteador")
+        elif kind in (RX, TX):
+            head = kind + f.read(_RECORD.size - 1)
+            if len(head) < _RECORD.size:
+                return
+            fields = _RECORD.unpack(head)
+            if fields[2] >= len(TRACE_TYPES):
+                raise ValueError(f"tipo de datagrama inválido: {fields[2]}")
+            data = f.read(fields[5])
+            if len(data) < fields[5]:
+                return
+            yield f.tell(), fields, data
+        else:
+            raise ValueError(f"registro inválido no byte {f.tell() - 1}")
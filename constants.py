@@ -2,4 +2,50 @@
 PORT = 6000
 ROUTE_ANNOUNCE_INTERVAL = 10.0  # segundos
 NEIGHBOR_TIMEOUT = 15.0  # segundos
+ANNOUNCE_MAX_INTERVAL = 80.0  # segundos: teto do intervalo entre tabelas completas com a tabela estável (dobra a cada anúncio sem mudança)
+ANNOUNCE_JITTER = 0.15  # fração sorteada para mais ou para menos em cada intervalo de anúncio (dessincroniza roteadores)
+HELLO_INTERVAL = ROUTE_ANNOUNCE_INTERVAL  # segundos sem enviar nada a um vizinho até mandar um hello '@' (mantém o vizinho vivo)
+ROUTE_TIMEOUT = 3 * ROUTE_ANNOUNCE_INTERVAL  # segundos sem renovação até uma rota aprendida expirar
 TABLE_PRINT_INTERVAL = 60.0  # segundos
+INFINITY_METRIC = 16  # métrica que indica destino inalcançável (retirada de rota); igual em toda a rede
+LOOP_PREVENTION = "split"  # rotas aprendidas de um vizinho voltam para ele: 'none', 'split' (omitidas) ou 'poison' (infinitas)
+SUMMARIZE_ROUTES = False  # anúncios completos juntam prefixos contíguos de mesma métrica (ex.: dois /25 -> um /24)
+ECMP_MAX_PATHS = 4  # next hops de mesma métrica guardados por destino (1 = sem multipath)
+HOLDDOWN_TIME = 0.0  # segundos em que um destino que perdeu a rota só aceita rotas melhores que a perdida (0 = desligado)
+DELTA_UPDATES = False  # anúncios disparados por mudança levam só as rotas alteradas
+TRIGGERED_UPDATE_DELAY = 0.5  # segundos: janela que junta vários gatilhos em um envio
+BINARY_WIRE = False  # anúncios binários (negociados por vizinho; texto continua aceito)
+MAX_DATAGRAM_PAYLOAD = 1400  # bytes por datagrama de anúncio (cabe num quadro Ethernet sem fragmentação IP)
+RECV_BUFFER_SIZE = 65535  # maior datagrama UDP aceito na recepção
+SOCKET_RCVBUF = 4 * 1024 * 1024  # buffer do kernel para rajadas de fragmentos
+CONVERGENCE_QUIET_PERIOD = 2.0  # segundos sem mudanças na tabela para considerar a rede convergida (métrica)
+METRICS_PORT = 0  # porta do endpoint HTTP de métricas em 127.0.0.1 (0 = desligado)
+LOG_LEVEL = "INFO"  # nível inicial de log (DEBUG, INFO, WARN, ERROR); ajustável pela CLI
+LOG_QUEUE_SIZE = 10000  # registros pendentes para a thread de escrita (excedentes são descartados)
+LOG_RING_SIZE = 2000  # últimos registros guardados em memória (comando 'dump' da CLI)
+SHARD_WORKERS = 0  # processos que dividem o merge de anúncios grandes por destino (0 = desligado; experimental)
+SHARD_MIN_ROUTES = 512  # anúncios menores que isso são processados no próprio processo
+SNAPSHOT_INTERVAL = 30.0  # segundos entre gravações do snapshot da tabela (warm start), se houver mudança
+WARM_START_TTL = NEIGHBOR_TIMEOUT  # segundos de validade das rotas carregadas do snapshot até um anúncio confirmá-las
+WARM_START_MAX_AGE = 120.0  # snapshots mais velhos que isso são ignorados na partida
+TRANSFER_FRAGMENT_SIZE = 1200  # bytes de dados por fragmento de transferência (cabe em MAX_DATAGRAM_PAYLOAD com o cabeçalho)
+TRANSFER_WINDOW = 32  # fragmentos enviados e ainda sem ack por transferência
+TRANSFER_RTO_INITIAL = 1.0  # segundos até a primeira retransmissão, antes de medir o RTT
+TRANSFER_RTO_MIN = 0.2  # limites do prazo de retransmissão (segundos)
+TRANSFER_RTO_MAX = 10.0
+TRANSFER_MAX_RETRIES = 8  # prazos seguidos sem nenhum ack novo até a transferência falhar
+TRANSFER_RX_TIMEOUT = 60.0  # segundos sem fragmentos até o destino descartar uma transferência
+TRANSFER_MAX_BYTES = 64 * 1024 * 1024  # maior transferência aceita
+TRANSFER_DIR = "recebidos"  # diretório onde os arquivos recebidos são gravados
+CONTROL_QUEUE_SIZE = 4096  # datagramas de controle (anúncios, '@') esperando processamento
+DATA_QUEUE_SIZE = 1024  # datagramas de dados ('!') esperando processamento; excedentes são descartados
+DATA_RATE_NEIGHBOR = 20000.0  # mensagens '!' por segundo repassadas de / enviadas para cada vizinho (0 = sem limite)
+DATA_BURST_NEIGHBOR = 2000  # rajada acima da taxa aceita por vizinho
+DATA_RATE_ORIGIN = 10000.0  # mensagens '!' por segundo repassadas de cada origem (0 = sem limite)
+DATA_BURST_ORIGIN = 1000  # rajada acima da taxa aceita por origem
+RX_DRAIN_BATCH = 64  # datagramas processados por vez no motor asyncio antes de devolver a vez ao loop
+PROBE_TIMEOUT = 2.0  # segundos de espera pelas respostas depois da última sonda (ping, traceroute, carga)
+PROBE_TICK = 0.01  # segundos entre os pacotes de envio do gerador de carga
+PING_COUNT = 4  # pings por comando, se não informado
+PING_INTERVAL = 1.0  # segundos entre pings, se não informado
+CAPTURE_MAX_BYTES = 256 * 1024 * 1024  # a captura (--capture) para de gravar quando o trace chega a esse tamanho
@@ -1,24 +1,174 @@
 # logging_utils.py
+"""Log do roteador e formatação da tabela.
+
+Cada registro tem uma categoria (rx, tx, route, cli, system) e um nível. O
+nível de cada categoria pode ser mudado em tempo de execução; registros abaixo
+dele são descartados antes de qualquer formatação. Os aceitos vão para uma fila
+limitada e uma thread de escrita formata (msg % args), escreve no stdout em
+lotes (um flush por lote) e guarda as últimas linhas num buffer circular.
+Com a fila cheia, o registro é descartado e contado, sem bloquear quem loga.
+
+Os argumentos são formatados depois, na thread de escrita: passe valores
+imutáveis (nunca memoryviews do buffer de recepção).
+"""
+import queue
 import sys
 import threading
-from typing import Dict, Tuple
-from utils import now_ts
+import time
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, TextIO, Tuple
+from constants import LOG_LEVEL, LOG_QUEUE_SIZE, LOG_RING_SIZE
+from utils import RouteRow, format_dest, split_key
 
 print_lock = threading.Lock()
 
-RouteEntry = Tuple[int, str, float, str]
+DEBUG, INFO, WARN, ERROR = 10, 20, 30, 40
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARN: "WARN", ERROR: "ERROR"}
+CATEGORIES = ("rx", "tx", "route", "cli", "system")
+
+# (timestamp, nível, categoria, mensagem, argumentos)
+LogRecord = Tuple[float, int, str, str, tuple]
+
+_WRITE_BATCH = 256
+
+def parse_level(name: str) -> int:
+    """'debug' / 'INFO' / ... -> nível. Levanta ValueError se não existir."""
+    for level, level_name in LEVEL_NAMES.items():
+        if level_name == name.strip().upper():
+            return level
+    raise ValueError(f"nível de log inválido: {name!r} (use {', '.join(LEVEL_NAMES.values())})")
 
 def safe_print(*args, **kwargs):
+    """Saída direta (respostas da CLI), sem passar pelo filtro de níveis."""
     with print_lock:
         print(*args, **kwargs)
         sys.stdout.flush()
 
-def format_table(table: Dict[str, RouteEntry], self_ip: str) -> str:
+
+class Logger:
+    def __init__(self, level: int = INFO, queue_size: int = LOG_QUEUE_SIZE,
+                 ring_size: int = LOG_RING_SIZE, stream: Optional[TextIO] = None):
+        self._levels: Dict[str, int] = {c: level for c in CATEGORIES}
+        self._queue: "queue.Queue[LogRecord]" = queue.Queue(maxsize=queue_size)
+        self._ring: Deque[str] = deque(maxlen=ring_size)
+        # None: usa o sys.stdout do momento da escrita
+        self._stream = stream
+        self.dropped = 0
+        self._reported_dropped = 0
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+
+    # ------------------------
+    # Níveis
+    # ------------------------
+    def enabled(self, category: str, level: int) -> bool:
+        return level >= self._levels[category]
+
+    def set_level(self, level: int, category: Optional[str] = None):
+        """Muda o nível de uma categoria (ou de todas, se category for None)."""
+        if category is None:
+            for c in self._levels:
+                self._levels[c] = level
+        elif category in self._levels:
+            self._levels[category] = level
+        else:
+            raise ValueError(f"categoria de log inválida: {category!r} (use {', '.join(CATEGORIES)})")
+
+    def levels(self) -> Dict[str, str]:
+        return {c: LEVEL_NAMES[l] for c, l in self._levels.items()}
+
+    # ------------------------
+    # Registro
+    # ------------------------
+    def log(self, category: str, level: int, msg: str, *args):
+        if level < self._levels[category]:
+            return
+        try:
+            self._queue.put_nowait((time.time(), level, category, msg, args))
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self._thread is None:
+            self._start_writer()
+
+    def debug(self, category: str, msg: str, *args):
+        self.log(category, DEBUG, msg, *args)
+
+    def info(self, category: str, msg: str, *args):
+        self.log(category, INFO, msg, *args)
+
+    def warn(self, category: str, msg: str, *args):
+        self.log(category, WARN, msg, *args)
+
+    def error(self, category: str, msg: str, *args):
+        self.log(category, ERROR, msg, *args)
+
+    def dump(self, n: Optional[int] = None) -> List[str]:
+        """Últimas n linhas do buffer circular (todas, se n for None)."""
+        lines = list(self._ring)
+        return lines if n is None else lines[-n:]
+
+    def flush(self, timeout: float = 2.0):
+        """Espera a thread de escrita esvaziar a fila (até timeout segundos)."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    # ------------------------
+    # Thread de escrita
+    # ------------------------
+    def _start_writer(self):
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._writer_loop, name="log-writer", daemon=True)
+                self._thread.start()
+
+    def _format(self, record: LogRecord) -> str:
+        ts, level, category, msg, args = record
+        if args:
+            try:
+                text = msg % args
+            except Exception:
+                text = f"{msg} {args!r}"
+        else:
+            text = msg
+        stamp = time.strftime("%H:%M:%S", time.localtime(ts)) + f".{int(ts * 1000) % 1000:03d}"
+        self._ring.append(f"{stamp} {LEVEL_NAMES[level]:<5} {category:<6} {text}")
+        return text
+
+    def _writer_loop(self):
+        q = self._queue
+        while True:
+            batch = [q.get()]
+            try:
+                while len(batch) < _WRITE_BATCH:
+                    batch.append(q.get_nowait())
+            except queue.Empty:
+                pass
+            lines = [self._format(record) for record in batch]
+            if self.dropped != self._reported_dropped:
+                lines.append(f"[LOG] {self.dropped - self._reported_dropped} registro(s) descartado(s) (fila cheia)")
+                self._reported_dropped = self.dropped
+            stream = self._stream or sys.stdout
+            try:
+                with print_lock:
+                    stream.write("\n".join(lines) + "\n")
+                    stream.flush()
+            except (OSError, ValueError):
+                pass
+            for _ in batch:
+                q.task_done()
+
+
+# logger único do processo
+log = Logger(parse_level(LOG_LEVEL))
+
+def format_table(routes: Iterable[RouteRow], self_ip: str) -> str:
     lines = []
     lines.append("=== TABELA DE ROTEAMENTO ===")
     lines.append(f"Roteador: {self_ip}")
-    lines.append(f"{'Destino':<16} {'Métrica':<7} {'Saída':<16} {'Origem':<8}")
-    for dest, (metric, next_hop, ts, origin) in sorted(table.items()):
-        lines.append(f"{dest:<16} {metric:<7} {next_hop:<16} {origin:<8}")
+    lines.append(f"{'Destino':<18} {'Métrica':<7} {'Saída':<16} {'Origem':<8}")
+    for dest, metric, next_hop, origin in sorted(routes, key=lambda row: split_key(row[0])):
+        lines.append(f"{format_dest(dest):<18} {metric:<7} {next_hop:<16} {origin:<8}")
     lines.append("===========================")
     return "\n".join(lines)
@@ -1,12 +1,65 @@
 # main.py
+import argparse
 import queue
 import socket
 import threading
 from roteador import Router
-from logging_utils import safe_print
+from roteador_async import AsyncRouter
+from logging_utils import safe_print, log, parse_level, CATEGORIES
+from constants import (LOG_LEVEL, METRICS_PORT, SHARD_WORKERS, LOOP_PREVENTION, INFINITY_METRIC,
+                       HOLDDOWN_TIME, SUMMARIZE_ROUTES, ECMP_MAX_PATHS,
+                       DATA_RATE_NEIGHBOR, DATA_RATE_ORIGIN, ROUTE_ANNOUNCE_INTERVAL, ANNOUNCE_MAX_INTERVAL,
+                       PING_COUNT, PING_INTERVAL)
+from utils import LOOP_PREVENTION_MODES
+import metrics
 
 ROUTERS_FILENAME = "roteadores.txt"
 
+# motores disponíveis (selecionados com --engine)
+ENGINES = {
+    "threads": Router,
+    "asyncio": AsyncRouter,
+}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Roteador por vetor de distâncias (UDP)")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="threads",
+                        help="motor de execução: threads (padrão) ou asyncio (um único event loop)")
+    parser.add_argument("--delta", action="store_true",
+                        help="anúncios disparados por mudança levam só as rotas alteradas (agrupadas)")
+    parser.add_argument("--binary", action="store_true",
+                        help="usa o formato binário de anúncios com vizinhos que também o suportam")
+    parser.add_argument("--loop-prevention", choices=LOOP_PREVENTION_MODES, default=LOOP_PREVENTION,
+                        help="rotas aprendidas de um vizinho: none (anuncia), split (omite) ou poison (métrica infinita)")
+    parser.add_argument("--infinity", type=int, default=INFINITY_METRIC,
+                        help=f"métrica de destino inalcançável, igual em todos os roteadores (padrão {INFINITY_METRIC})")
+    parser.add_argument("--holddown", type=float, default=HOLDDOWN_TIME,
+                        help="segundos de hold-down de um destino que perdeu a rota (0 = desligado)")
+    parser.add_argument("--network", action="append", default=[], metavar="PREFIXO",
+                        help="rede conectada a este roteador, ex. 10.1.0.0/16 (pode repetir)")
+    parser.add_argument("--summarize", action="store_true", default=SUMMARIZE_ROUTES,
+                        help="junta prefixos contíguos de mesma métrica nos anúncios completos")
+    parser.add_argument("--max-paths", type=int, default=ECMP_MAX_PATHS,
+                        help=f"caminhos de mesmo custo por destino, escolhidos por fluxo (1 = sem ECMP; padrão {ECMP_MAX_PATHS})")
+    parser.add_argument("--snapshot", metavar="ARQUIVO",
+                        help="grava a tabela nesse arquivo e a recarrega na partida (warm start)")
+    parser.add_argument("--capture", metavar="ARQUIVO",
+                        help="grava os datagramas recebidos e enviados nesse trace (ver replay.py)")
+    parser.add_argument("--announce-max", type=float, default=ANNOUNCE_MAX_INTERVAL,
+                        help=f"teto em segundos do intervalo entre tabelas completas com a rede estável "
+                             f"({ROUTE_ANNOUNCE_INTERVAL:g} = sempre o intervalo base; padrão {ANNOUNCE_MAX_INTERVAL:g})")
+    parser.add_argument("--data-rate", type=float, default=DATA_RATE_NEIGHBOR,
+                        help=f"mensagens '!' por segundo repassadas de/para cada vizinho (0 = sem limite; padrão {DATA_RATE_NEIGHBOR:g})")
+    parser.add_argument("--origin-rate", type=float, default=DATA_RATE_ORIGIN,
+                        help=f"mensagens '!' por segundo repassadas de cada origem (0 = sem limite; padrão {DATA_RATE_ORIGIN:g})")
+    parser.add_argument("--shards", type=int, default=SHARD_WORKERS,
+                        help="processos que dividem o processamento de anúncios grandes (experimental; 0 = desligado)")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                        help="serve as métricas em http://127.0.0.1:PORTA/metrics (0 = desligado)")
+    parser.add_argument("--log-level", type=parse_level, default=parse_level(LOG_LEVEL),
+                        help=f"nível inicial de log: DEBUG, INFO, WARN ou ERROR (padrão {LOG_LEVEL})")
+    return parser.parse_args()
+
 def get_dynamic_ip() -> str:
     # obtem o seu propro ip local
     s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -25,15 +78,80 @@ def load_neighbors(filename: str) -> set:
     neighbors = set()
     try:
         with open(filename, "r") as f:
-            print(f"arquivo f {f} ")
+            log.debug("system", "arquivo f %s ", f)
             for line in f:
-                print(f"resolvendo {line} agora mesmo")
+                log.debug("system", "resolvendo %s agora mesmo", line)
                 ip = line.strip()
                 if ip:
                     neighbors.add(ip)
     except FileNotFoundError:
         safe_print(f"Arquivo {filename} não encontrado. Crie com os IPs dos vizinhos (um por linha).")
     return neighbors
+def log_command(args: list):
+    """'log' mostra os níveis; 'log NIVEL' muda todas as categorias; 'log CATEGORIA NIVEL' muda uma."""
+    try:
+        if len(args) == 1:
+            log.set_level(parse_level(args[0]))
+        elif len(args) == 2:
+            log.set_level(parse_level(args[1]), args[0].lower())
+        elif args:
+            raise ValueError("use: log [CATEGORIA] NIVEL")
+    except ValueError as e:
+        safe_print(f"[CLI] {e}")
+        return
+    levels = " ".join(f"{c}={l}" for c, l in log.levels().items())
+    safe_print(f"[CLI] Níveis de log: {levels} (categorias: {', '.join(CATEGORIES)})")
+
+def dump_command(args: list):
+    """'dump [N]': últimas N linhas do log em memória (padrão 50)."""
+    try:
+        n = int(args[0]) if args else 50
+    except ValueError:
+        safe_print("[CLI] use: dump [N]")
+        return
+    lines = log.dump(n)
+    safe_print(f"[CLI] Últimos {len(lines)} registros do log:")
+    safe_print("\n".join(lines))
+
+def file_command(router: Router, args: list):
+    """'arquivo IP CAMINHO': envia o arquivo; o resultado (vazão e perda) sai no log ao terminar."""
+    if len(args) != 2:
+        safe_print("[CLI] use: arquivo IP CAMINHO")
+        return
+    dest, path = args
+    if router.next_hop_for(dest, router.ip) is None:
+        safe_print(f"Sem rota conhecida para {dest}.")
+        return
+    try:
+        router.transfers.send_file(dest, path)
+    except (OSError, ValueError) as e:
+        safe_print(f"[CLI] Não foi possível enviar {path}: {e}")
+
+def probe_command(router: Router, name: str, args: list):
+    """'ping IP [N] [INTERVALO]', 'traceroute IP' e 'carga IP N TAXA [BYTES]':
+    as respostas e o relatório (RTT, perda, vazão) saem no log."""
+    usage = {"ping": "ping IP [N] [INTERVALO]", "traceroute": "traceroute IP", "carga": "carga IP N TAXA [BYTES]"}
+    limits = {"ping": (1, 3), "traceroute": (1, 1), "carga": (3, 4)}
+    low, high = limits[name]
+    if not low <= len(args) <= high:
+        safe_print(f"[CLI] use: {usage[name]}")
+        return
+    dest = args[0]
+    if router.next_hop_for(dest, router.ip) is None:
+        safe_print(f"Sem rota conhecida para {dest}.")
+        return
+    try:
+        if name == "ping":
+            count = int(args[1]) if len(args) > 1 else PING_COUNT
+            interval = float(args[2]) if len(args) > 2 else PING_INTERVAL
+            router.probes.ping(dest, count, interval)
+        elif name == "traceroute":
+            router.probes.traceroute(dest)
+        else:
+            router.probes.load(dest, int(args[1]), float(args[2]), int(args[3]) if len(args) > 3 else 0)
+    except ValueError as e:
+        safe_print(f"[CLI] {e} (use: {usage[name]})")
+
 def cli_loop(router: Router):
     safe_print("CLI: digite '<IP_destino>;<mensagem>' ou 'sair' para encerrar.")
 
@@ -68,7 +186,40 @@ def cli_loop(router: Router):
             # Comando para imprimir a tabela de roteamento atual
             if line.strip().upper() == 'R':
                 safe_print("[CLI] Tabela de roteamento atual:")
-                router.print_table()
+                safe_print(router.table_text())
+                continue
+
+            # Estatísticas internas do roteador
+            if line.strip().upper() == 'S':
+                router.print_stats()
+                continue
+
+            # Métricas (mesmo texto do endpoint HTTP)
+            if line.strip().upper() == 'M':
+                safe_print(router.metrics.render())
+                continue
+
+            # Níveis de log e buffer de log em memória
+            words = line.split()
+            if words[0].lower() == "log":
+                log_command(words[1:])
+                continue
+            if words[0].lower() == "dump":
+                dump_command(words[1:])
+                continue
+
+            # Transferência de arquivo: arquivo <ip> <caminho>; 'T' mostra as em andamento
+            if words[0].lower() == "arquivo":
+                file_command(router, line.split(None, 2)[1:])
+                continue
+            if line.strip().upper() == 'T':
+                safe_print(router.transfers.status_text())
+                safe_print(router.probes.status_text())
+                continue
+
+            # Ping, traceroute e gerador de carga
+            if words[0].lower() in ("ping", "traceroute", "carga"):
+                probe_command(router, words[0].lower(), words[1:])
                 continue
 
             if line.lower() in ("sair"):
@@ -77,7 +228,10 @@ def cli_loop(router: Router):
                 break
 
             if ";" not in line:
-                safe_print("Formato inválido. Use: 192.168.x.y;mensagem ou 'R' para mostrar a tabela")
+                safe_print("Formato inválido. Use: 192.168.x.y;mensagem, 'R' para mostrar a tabela, 'S' para estatísticas, 'M' para métricas, "
+                           "'log [CATEGORIA] [NIVEL]' para os níveis de log, 'dump [N]' para o log em memória, "
+                           "'arquivo IP CAMINHO' para enviar um arquivo, 'ping IP [N] [INTERVALO]', 'traceroute IP', "
+                           "'carga IP N TAXA [BYTES]' ou 'T' para as transferências e sondas em andamento")
                 continue
             
             dest, text = line.split(";", 1)
@@ -88,16 +242,13 @@ def cli_loop(router: Router):
 
             origin = router.ip
             raw = f"!{origin};{dest};{text}"
-            safe_print('teste2')
             if dest == origin:
                 router.handle_text_message(raw, origin)
             else:
-                with router.lock:
-                    entry = router.table.get(dest)
-                    if not entry:
-                        safe_print(f"Sem rota conhecida para {dest}.")
-                        continue
-                    next_hop = entry[1]
+                next_hop = router.next_hop_for(dest, router.ip)
+                if next_hop is None:
+                    safe_print(f"Sem rota conhecida para {dest}.")
+                    continue
                 router.send_to(next_hop, raw)
                 safe_print(f"Mensagem enviada para {dest} via {next_hop}.")
     finally:
@@ -105,17 +256,44 @@ def cli_loop(router: Router):
         router.stop()
         safe_print("[CLI] Finalizado.")
 def main():
+    args = parse_args()
+    log.set_level(args.log_level)
     ip = get_dynamic_ip()
     safe_print(f"MEU IP: {ip}")
     neighs = load_neighbors(ROUTERS_FILENAME)
     safe_print(f"MEUS VIZINHOS: {neighs}")
-    router = Router(ip, neighs)
+    try:
+        router = ENGINES[args.engine](ip, neighs, delta_updates=args.delta,
+                                         binary_wire=args.binary, shards=args.shards,
+                                         loop_prevention=args.loop_prevention, infinity=args.infinity,
+                                         holddown=args.holddown, networks=args.network,
+                                         summarize=args.summarize, max_paths=args.max_paths,
+                                         snapshot_path=args.snapshot, data_rate=args.data_rate,
+                                         origin_rate=args.origin_rate, announce_max=args.announce_max,
+                                         capture_path=args.capture)
+    except ValueError as e:
+        safe_print(f"Configuração inválida: {e}")
+        return
+    except OSError as e:
+        safe_print(f"Não foi possível iniciar o roteador: {e}")
+        return
+    safe_print(f"MOTOR: {args.engine}")
     router.start()
+    server = None
+    if args.metrics_port:
+        try:
+            server = metrics.serve(router.metrics, args.metrics_port)
+            safe_print(f"MÉTRICAS: http://127.0.0.1:{args.metrics_port}/metrics")
+        except OSError as e:
+            safe_print(f"Não foi possível abrir a porta de métricas {args.metrics_port}: {e}")
     try:
         cli_loop(router)
     finally:
         safe_print("POWER OFF...")
+        if server is not None:
+            server.shutdown()
         router.stop()
+        log.flush()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,188 @@
+# metrics.py
+"""Métricas internas do roteador (contadores, gauges e histogramas).
+
+Cada Router tem um Registry próprio. render() gera o formato texto do
+Prometheus, mostrado pelo comando 'M' da CLI e servido em
+http://127.0.0.1:<porta>/metrics por serve() (main.py --metrics-port).
+
+Os incrementos não usam lock: com o GIL, um += concorrente raramente perde uma
+contagem, o que é aceitável para métricas e mantém o custo por pacote baixo.
+"""
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# limites dos buckets (segundos) para latências de processamento e de lock
+LATENCY_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+# limites dos buckets (segundos) para tempo de convergência
+CONVERGENCE_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, n: float = 1):
+        self.value += n
+
+
+class Gauge:
+    """Valor instantâneo; com fn, é lido na hora de renderizar."""
+    __slots__ = ("value", "fn")
+
+    def __init__(self, fn: Optional[Callable[[], float]] = None):
+        self.value = 0
+        self.fn = fn
+
+    def set(self, value: float):
+        self.value = value
+
+    def get(self) -> float:
+        return self.fn() if self.fn is not None else self.value
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Sequence[float] = LATENCY_BUCKETS):
+        self.bounds = tuple(bounds)
+        # um contador por bucket + o '+Inf'
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # nome -> (tipo, ajuda, {labels: métrica}), na ordem de criação
+        self._families: Dict[str, Tuple[str, str, Dict[Labels, object]]] = {}
+
+    def _get(self, kind: str, name: str, help_text: str, labels: Dict[str, str], factory):
+        key: Labels = tuple(sorted(labels.items()))
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = self._families[name] = (kind, help_text, {})
+            elif family[0] != kind:
+                raise ValueError(f"métrica {name} já registrada como {family[0]}")
+            metric = family[2].get(key)
+            if metric is None:
+                metric = family[2][key] = factory()
+            return metric
+
+    def counter(self, name: str, help_text: str, **labels: str) -> Counter:
+        return self._get("counter", name, help_text, labels, Counter)
+
+    def gauge(self, name: str, help_text: str, fn: Optional[Callable[[], float]] = None, **labels: str) -> Gauge:
+        return self._get("gauge", name, help_text, labels, lambda: Gauge(fn))
+
+    def histogram(self, name: str, help_text: str, bounds: Sequence[float] = LATENCY_BUCKETS,
+                  **labels: str) -> Histogram:
+        return self._get("histogram", name, help_text, labels, lambda: Histogram(bounds))
+
+    def render(self) -> str:
+        """Formato texto do Prometheus (exposition format 0.0.4)."""
+        lines: List[str] = []
+        with self._lock:
+            families = [(name, kind, help_text, list(metrics.items()))
+                        for name, (kind, help_text, metrics) in self._families.items()]
+        for name, kind, help_text, metrics in families:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, metric in metrics:
+                if kind == "counter":
+                    lines.append(f"{name}{_labels(labels)} {_num(metric.value)}")
+                elif kind == "gauge":
+                    lines.append(f"{name}{_labels(labels)} {_num(metric.get())}")
+                else:
+                    cumulative = 0
+                    for bound, n in zip(metric.bounds + (float("inf"),), metric.counts):
+                        cumulative += n
+                        le = "+Inf" if bound == float("inf") else _num(bound)
+                        lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(labels)} {_num(metric.sum)}")
+                    lines.append(f"{name}_count{_labels(labels)} {metric.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+def _num(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class TimedLock:
+    """RLock que registra quanto tempo se esperou para obtê-lo e quanto tempo
+    ele ficou preso (da primeira aquisição até a liberação mais externa)."""
+
+    def __init__(self, wait: Histogram, hold: Histogram):
+        self._lock = threading.RLock()
+        self._wait = wait
+        self._hold = hold
+        # só a thread dona do lock mexe nesses dois
+        self._depth = 0
+        self._since = 0.0
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        t0 = time.perf_counter()
+        ok = self._lock.acquire(blocking, timeout)
+        if ok:
+            if self._depth == 0:
+                self._since = time.perf_counter()
+                self._wait.observe(self._since - t0)
+            self._depth += 1
+        return ok
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            self._hold.observe(time.perf_counter() - self._since)
+        self._lock.release()
+
+    def __enter__(self) -> bool:
+        return self.acquire()
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+# ------------------------
+# Endpoint HTTP (loopback)
+# ------------------------
+def serve(registry: Registry, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve GET /metrics numa thread própria. Feche com server.shutdown()."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
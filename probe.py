@@ -0,0 +1,272 @@
+# probe.py
+"""Ping, traceroute e gerador de carga sobre as mensagens de texto.
+
+Como as transferências (transfer.py), as sondas são mensagens '!orig;dest;TEXTO'
+comuns com o TEXTO começando por '~' e um subtipo:
+
+  ~E<id>;<seq>;<instante>;<enchimento>   echo request: o destino responde com ~R
+  ~R<id>;<seq>;<instante>                echo reply (sem o enchimento)
+  ~P<ttl>;<id>;<seq>;<instante>          sonda com TTL: cada roteador do caminho
+                                         decrementa o TTL; o destino responde com ~R
+  ~X<id>;<seq>;<instante>                TTL esgotado, enviado pelo roteador onde a
+                                         sonda parou (a origem da mensagem é ele)
+
+O instante é o relógio de quem enviou a sonda e volta na resposta, então o
+RTT é calculado sem guardar nada por sonda. Os roteadores do caminho só olham
+'~P' no repasse (Router.handle_text_message); o resto passa como texto comum.
+
+Sessões:
+  - ping:       count echo requests a cada interval segundos; relata mín/méd/p99/máx do RTT
+  - carga:      count echo requests a rate por segundo (com size bytes de
+                enchimento); relata taxa entregue, perda e percentis do RTT
+  - traceroute: uma sonda por TTL (1 até a métrica infinita - 1), todas de uma vez
+Os envios são pacotes de PROBE_TICK segundos agendados no escalonador do
+roteador; a sessão termina PROBE_TIMEOUT depois do último envio ou quando
+todas as respostas chegam, e o relatório sai no log (categoria cli).
+"""
+import itertools
+import random
+import threading
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple
+from constants import PROBE_TIMEOUT, PROBE_TICK, TRANSFER_FRAGMENT_SIZE
+from logging_utils import log
+
+ECHO_TAG = b"~E"
+REPLY_TAG = b"~R"
+PROBE_TAG = b"~P"
+EXPIRED_TAG = b"~X"
+
+
+def _percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(p / 100.0 * (len(sorted_values) - 1))))]
+
+
+class ProbeSession:
+    __slots__ = ("probe_id", "kind", "dest", "count", "rate", "size", "started", "sent", "last_sent",
+                 "replies", "rtts", "last_reply", "hops", "reached", "finished", "on_done")
+
+    def __init__(self, probe_id: int, kind: str, dest: str, count: int, rate: float, size: int,
+                 started: float, on_done: Optional[Callable[["ProbeSession"], None]]):
+        self.probe_id = probe_id
+        self.kind = kind
+        self.dest = dest
+        self.count = count
+        # envios por segundo (0 = todos no primeiro pacote)
+        self.rate = rate
+        self.size = size
+        self.started = started
+        self.sent = 0
+        self.last_sent = started
+        # seqs respondidos e RTTs (segundos, na ordem de chegada)
+        self.replies = set()
+        self.rtts: List[float] = []
+        self.last_reply: Optional[float] = None
+        # traceroute: ttl -> (roteador, RTT) e o menor ttl que chegou ao destino
+        self.hops: Dict[int, Tuple[str, float]] = {}
+        self.reached: Optional[int] = None
+        self.finished = False
+        self.on_done = on_done
+
+    @property
+    def complete(self) -> bool:
+        if self.kind == "traceroute":
+            return self.reached is not None and all(ttl in self.hops for ttl in range(1, self.reached + 1))
+        return self.sent == self.count and len(self.replies) == self.count
+
+    def report(self) -> str:
+        if self.kind == "traceroute":
+            last = self.reached if self.reached is not None else max(self.hops, default=0)
+            lines = [f"[TRACEROUTE] {self.dest}" + ("" if self.reached is not None else " (destino não alcançado)")]
+            for ttl in range(1, last + 1):
+                hop = self.hops.get(ttl)
+                lines.append(f"{ttl:3d}  {hop[0]:<15}  {hop[1] * 1000:.2f} ms" if hop else f"{ttl:3d}  *")
+            return "\n".join(lines)
+        rtts = sorted(self.rtts)
+        received = len(self.replies)
+        loss = 100.0 * (self.sent - received) / self.sent if self.sent else 0.0
+        ms = [v * 1000 for v in rtts]
+        if self.kind == "ping":
+            text = f"[PING] {self.dest}: {self.sent} enviados, {received} recebidos, {loss:.1f}% de perda"
+            if ms:
+                text += (f", RTT mín/méd/p99/máx = {ms[0]:.2f}/{sum(ms) / len(ms):.2f}/"
+                         f"{_percentile(ms, 99):.2f}/{ms[-1]:.2f} ms")
+            return text
+        sending = max(self.last_sent - self.started, 1e-9)
+        delivering = max((self.last_reply or self.started) - self.started, 1e-9)
+        text = (f"[CARGA] {self.dest}: {self.sent} enviados em {sending:.2f}s ({self.sent / sending:.0f}/s, "
+                f"pedido {self.rate:g}/s), {received} entregues ({received / delivering:.0f}/s, "
+                f"{received * self.size / delivering / 1024:.1f} KiB/s de enchimento), {loss:.1f}% de perda")
+        if ms:
+            text += (f", RTT p50/p90/p99/máx = {_percentile(ms, 50):.2f}/{_percentile(ms, 90):.2f}/"
+                     f"{_percentile(ms, 99):.2f}/{ms[-1]:.2f} ms")
+        return text
+
+
+class ProbeManager:
+    """Sessões de ping/traceroute/carga de um roteador e as respostas às sondas dos outros."""
+
+    def __init__(self, router):
+        self.router = router
+        self._lock = threading.Lock()
+        self._ids = itertools.count(random.getrandbits(20))
+        self._sessions: Dict[int, ProbeSession] = {}
+        m = router.metrics
+        self._m_replies = m.counter("router_echo_replies_total", "Echo requests e sondas respondidos")
+        self._m_expired = m.counter("router_probe_ttl_expired_total", "Sondas descartadas com o TTL esgotado")
+
+    # ------------------------
+    # Sessões
+    # ------------------------
+    def ping(self, dest: str, count: int, interval: float,
+             on_done: Optional[Callable[[ProbeSession], None]] = None) -> ProbeSession:
+        if count < 1 or interval <= 0:
+            raise ValueError("use um número de pings positivo e um intervalo maior que zero")
+        return self._start("ping", dest, count, 1.0 / interval, 0, on_done)
+
+    def load(self, dest: str, count: int, rate: float, size: int = 0,
+             on_done: Optional[Callable[[ProbeSession], None]] = None) -> ProbeSession:
+        if count < 1 or rate <= 0:
+            raise ValueError("use um número de mensagens e uma taxa positivos")
+        if not 0 <= size <= TRANSFER_FRAGMENT_SIZE:
+            # mesmo limite dos fragmentos de transferência: cabe num datagrama sem fragmentação IP
+            raise ValueError(f"enchimento deve ter de 0 a {TRANSFER_FRAGMENT_SIZE} bytes")
+        return self._start("carga", dest, count, rate, size, on_done)
+
+    def traceroute(self, dest: str, on_done: Optional[Callable[[ProbeSession], None]] = None) -> ProbeSession:
+        # taxa 0: todas as sondas de uma vez
+        return self._start("traceroute", dest, self.router.infinity - 1, 0.0, 0, on_done)
+
+    def _start(self, kind: str, dest: str, count: int, rate: float, size: int,
+               on_done: Optional[Callable[[ProbeSession], None]]) -> ProbeSession:
+        s = ProbeSession(next(self._ids) & 0xFFFFFFFF, kind, dest, count, rate, size, self.router.clock(), on_done)
+        with self._lock:
+            self._sessions[s.probe_id] = s
+        self._tick(s.probe_id)
+        return s
+
+    def _tick(self, probe_id: int):
+        """Envia as sondas que já deviam ter saído e agenda o próximo pacote."""
+        router = self.router
+        now = router.clock()
+        with self._lock:
+            s = self._sessions.get(probe_id)
+            if s is None:
+                return
+            first = s.sent
+            s.sent = min(s.count, int((now - s.started) * s.rate) + 1) if s.rate else s.count
+            seqs = range(first, s.sent)
+            if seqs:
+                s.last_sent = now
+            done_sending = s.sent == s.count
+        next_hop = router.next_hop_for(s.dest, router.ip)
+        if next_hop is not None and next_hop != router.ip:
+            prefix = f"!{router.ip};{s.dest};"
+            stamp = f"{now:.6f}"
+            if s.kind == "traceroute":
+                for seq in seqs:
+                    router.send_to(next_hop, f"{prefix}~P{seq + 1};{probe_id};{seq + 1};{stamp}")
+            else:
+                fill = "x" * s.size
+                for seq in seqs:
+                    router.send_to(next_hop, f"{prefix}~E{probe_id};{seq};{stamp};{fill}")
+        else:
+            # sem rota: contam como perdidas
+            log.debug("tx", "[PROBE] Sem rota para %s; %d sonda(s) perdidas", s.dest, len(seqs))
+        if done_sending:
+            router.scheduler.schedule(("probe", probe_id), now + PROBE_TIMEOUT, partial(self._finish, probe_id))
+        else:
+            when = max(s.started + s.sent / s.rate, now + PROBE_TICK)
+            router.scheduler.schedule(("probe", probe_id), when, partial(self._tick, probe_id))
+
+    def _on_reply(self, origin: str, tag: bytes, fields: List[str]):
+        probe_id, seq, stamp = int(fields[0]), int(fields[1]), float(fields[2])
+        now = self.router.clock()
+        rtt = max(0.0, now - stamp)
+        with self._lock:
+            s = self._sessions.get(probe_id)
+            if s is None or seq in s.replies:
+                return
+            if s.kind == "traceroute":
+                if tag == REPLY_TAG and origin == s.dest:
+                    s.reached = seq if s.reached is None else min(s.reached, seq)
+                s.hops[seq] = (origin, rtt)
+            elif origin != s.dest or tag != REPLY_TAG:
+                return
+            s.replies.add(seq)
+            s.rtts.append(rtt)
+            s.last_reply = now
+            complete = s.complete
+        if s.kind == "ping":
+            log.info("cli", "[PING] Resposta de %s: seq=%d tempo=%.2f ms", origin, seq, rtt * 1000)
+        if complete:
+            self._finish(probe_id)
+
+    def _finish(self, probe_id: int):
+        with self._lock:
+            s = self._sessions.pop(probe_id, None)
+            if s is None:
+                return
+            s.finished = True
+        self.router.scheduler.cancel(("probe", probe_id))
+        log.info("cli", "%s", s.report())
+        if s.on_done is not None:
+            s.on_done(s)
+
+    def status_text(self) -> str:
+        """Sessões em andamento (comando da CLI)."""
+        with self._lock:
+            lines = [f"[PROBE] {s.kind} {s.dest}: {s.sent}/{s.count} enviadas, {len(s.replies)} respostas"
+                     for s in self._sessions.values()]
+        return "\n".join(lines) if lines else "[PROBE] Nenhuma sessão em andamento."
+
+    # ------------------------
+    # Recepção e repasse
+    # ------------------------
+    def handle(self, origin: str, body: memoryview) -> bool:
+        """Texto de uma mensagem '!origin;<este roteador>;...' que começa com '~'.
+        Retorna False se não for uma sonda (a mensagem segue como texto)."""
+        tag = bytes(body[:2])
+        try:
+            if tag == ECHO_TAG or tag == PROBE_TAG:
+                fields = str(body[2:], 'utf-8', errors='replace').split(";", 4)
+                if tag == PROBE_TAG:
+                    # ttl;id;seq;instante: o destino responde como a um echo request
+                    fields = fields[1:]
+                self._reply(origin, REPLY_TAG, int(fields[0]), int(fields[1]), fields[2])
+            elif tag == REPLY_TAG or tag == EXPIRED_TAG:
+                self._on_reply(origin, tag, str(body[2:], 'ascii').split(";"))
+            else:
+                return False
+        except (ValueError, IndexError, UnicodeDecodeError) as e:
+            log.warn("rx", "[WARN] Sonda inválida de %s: %s", origin, e)
+        return True
+
+    def forward(self, origin: str, data: memoryview, start: int) -> Optional[memoryview]:
+        """Sonda '~P' (começando em data[start:]) sendo repassada: retorna a
+        mensagem com o TTL decrementado ou None se ele esgotou aqui (e avisa a origem)."""
+        end = bytes(data[start + 2:start + 8]).find(b";")
+        try:
+            ttl = int(bytes(data[start + 2:start + 2 + end])) if end > 0 else 0
+        except ValueError:
+            ttl = 0
+        if ttl > 1:
+            return memoryview(b"".join((data[:start + 2], str(ttl - 1).encode(), data[start + 2 + end:])))
+        if end > 0:
+            fields = str(data[start + 3 + end:], 'utf-8', errors='replace').split(";")
+            try:
+                self._m_expired.inc()
+                self._reply(origin, EXPIRED_TAG, int(fields[0]), int(fields[1]), fields[2])
+            except (ValueError, IndexError):
+                pass
+        return None
+
+    def _reply(self, origin: str, tag: bytes, probe_id: int, seq: int, stamp: str):
+        router = self.router
+        next_hop = router.next_hop_for(origin, router.ip)
+        if next_hop is None or next_hop == router.ip:
+            return
+        self._m_replies.inc()
+        router.send_to(next_hop, f"!{router.ip};{origin};{tag.decode()}{probe_id};{seq};{stamp}")
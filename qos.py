@@ -0,0 +1,130 @@
+# qos.py
+"""Prioridade do tráfego de controle e limites de taxa do tráfego de dados.
+
+Os datagramas recebidos passam por duas filas limitadas: controle (anúncios
+de rotas, binários ou texto, e '@') e dados ('!', mensagens de texto e
+fragmentos de transferência). Quem consome sempre esvazia a fila de controle
+antes de pegar um datagrama de dados, então uma rajada de mensagens
+repassadas não atrasa os anúncios dos vizinhos até NEIGHBOR_TIMEOUT. Fila
+cheia descarta o datagrama que chega (o remetente, no caso dos dados, é quem
+retransmite).
+
+RateLimiter (um TokenBucket por chave) limita o repasse de dados por vizinho e por origem (ver
+Router.handle_text_message e Router.send_to).
+"""
+import threading
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+CONTROL = "control"
+DATA = "data"
+CLASSES = (CONTROL, DATA)
+
+_TEXT = ord("!")
+
+
+def traffic_class(data: bytes) -> str:
+    """Classe de um datagrama recebido pelo primeiro byte: '!' é dado, o resto é controle."""
+    return DATA if len(data) and data[0] == _TEXT else CONTROL
+
+
+class PriorityQueues:
+    """Filas de controle e de dados com prioridade estrita para controle.
+    Seguras entre threads (o listener põe, o worker tira)."""
+
+    def __init__(self, control_size: int, data_size: int):
+        self._queues: Dict[str, Deque[Tuple[bytes, str]]] = {CONTROL: deque(), DATA: deque()}
+        self._limits = {CONTROL: control_size, DATA: data_size}
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def depth(self, cls: str) -> int:
+        return len(self._queues[cls])
+
+    def put(self, data: bytes, src_ip: str) -> Optional[str]:
+        """Enfileira o datagrama. Retorna a classe ou None se a fila dela estava cheia."""
+        cls = traffic_class(data)
+        with self._cond:
+            queue = self._queues[cls]
+            if len(queue) >= self._limits[cls]:
+                return None
+            queue.append((data, src_ip))
+            self._cond.notify()
+        return cls
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Tuple[bytes, str]]:
+        """Próximo datagrama (controle primeiro); espera até timeout se as
+        filas estiverem vazias. None se vazias depois da espera ou fechadas."""
+        control, data = self._queues[CONTROL], self._queues[DATA]
+        with self._cond:
+            if not control and not data and not self._closed:
+                self._cond.wait(timeout)
+            if control:
+                return control.popleft()
+            if data:
+                return data.popleft()
+            return None
+
+    def close(self):
+        """Acorda quem estiver esperando em get()."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def reopen(self):
+        with self._cond:
+            self._closed = False
+
+
+class TokenBucket:
+    """rate fichas por segundo, acumulando até burst. Sem lock: cada balde é
+    usado com o lock de quem o guarda (ver RateLimiter)."""
+    __slots__ = ("rate", "burst", "tokens", "last")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = now
+
+    def allow(self, now: float, cost: float = 1.0) -> bool:
+        elapsed = now - self.last
+        if elapsed > 0:
+            self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+            self.last = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return True
+        return False
+
+
+class RateLimiter:
+    """Um TokenBucket por chave (IP do vizinho ou da origem), criados sob
+    demanda. rate <= 0 desliga o limite. Baldes cheios há muito tempo são
+    descartados quando passam de max_keys (voltariam cheios de qualquer jeito)."""
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 4096):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def allow(self, key: str, now: float) -> bool:
+        if self.rate <= 0:
+            return True
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys:
+                    self._evict(now)
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.burst, now)
+            return bucket.allow(now)
+
+    def _evict(self, now: float):
+        # baldes que já teriam voltado a ficar cheios
+        full = self.burst / self.rate
+        for key in [k for k, b in self._buckets.items() if now - b.last >= full]:
+            del self._buckets[key]
+        if len(self._buckets) >= self.max_keys:
+            self._buckets.clear()
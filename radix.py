@@ -0,0 +1,100 @@
+# radix.py
+"""Trie binária (radix 2) de prefixos IPv4 para longest-prefix match.
+
+Os nós são tuplas imutáveis (filho do bit 0, filho do bit 1, valor), então a
+árvore é persistente: insert() e remove() devolvem uma trie nova copiando só o
+caminho até o prefixo alterado (no máximo 33 nós) e compartilham o resto com a
+anterior. Quem estiver consultando a versão antiga continua vendo uma árvore
+consistente, sem lock, como a FIB publicada em route_table.
+
+A profundidade de uma consulta é o comprimento do prefixo mais longo que cobre
+o endereço; ramos sem prefixo nenhum não existem.
+"""
+from typing import Any, Iterator, Optional, Tuple
+
+# (filho 0, filho 1, valor ou None)
+Node = Tuple[Optional["Node"], Optional["Node"], Any]
+
+_EMPTY: Node = (None, None, None)
+
+
+def _insert(node: Optional[Node], addr: int, length: int, depth: int, value: Any) -> Node:
+    if node is None:
+        node = _EMPTY
+    if depth == length:
+        return (node[0], node[1], value)
+    if (addr >> (31 - depth)) & 1:
+        return (node[0], _insert(node[1], addr, length, depth + 1, value), node[2])
+    return (_insert(node[0], addr, length, depth + 1, value), node[1], node[2])
+
+
+def _remove(node: Optional[Node], addr: int, length: int, depth: int) -> Optional[Node]:
+    if node is None:
+        return None
+    if depth == length:
+        zero, one, value = node[0], node[1], None
+    elif (addr >> (31 - depth)) & 1:
+        zero, one, value = node[0], _remove(node[1], addr, length, depth + 1), node[2]
+    else:
+        zero, one, value = _remove(node[0], addr, length, depth + 1), node[1], node[2]
+    if zero is None and one is None and value is None:
+        # ramo vazio: some da árvore
+        return None
+    return (zero, one, value)
+
+
+class RadixTrie:
+    __slots__ = ("_root", "_size")
+
+    def __init__(self, root: Optional[Node] = None, size: int = 0):
+        self._root = root
+        self._size = size
+
+    def __len__(self) -> int:
+        return self._size
+
+    def get(self, addr: int, length: int) -> Any:
+        """Valor do prefixo exato addr/length (None se não existir)."""
+        node = self._root
+        depth = 0
+        while node is not None and depth < length:
+            node = node[(addr >> (31 - depth)) & 1]
+            depth += 1
+        return node[2] if node is not None else None
+
+    def insert(self, addr: int, length: int, value: Any) -> "RadixTrie":
+        """Nova trie com addr/length -> value (value não pode ser None)."""
+        size = self._size if self.get(addr, length) is not None else self._size + 1
+        return RadixTrie(_insert(self._root, addr, length, 0, value), size)
+
+    def remove(self, addr: int, length: int) -> "RadixTrie":
+        if self.get(addr, length) is None:
+            return self
+        return RadixTrie(_remove(self._root, addr, length, 0), self._size - 1)
+
+    def lookup(self, addr: int) -> Any:
+        """Valor do prefixo mais longo que contém addr (None se nenhum)."""
+        node = self._root
+        best = None
+        depth = 0
+        while node is not None:
+            if node[2] is not None:
+                best = node[2]
+            if depth == 32:
+                break
+            node = node[(addr >> (31 - depth)) & 1]
+            depth += 1
+        return best
+
+    def items(self) -> Iterator[Tuple[int, int, Any]]:
+        """(endereço, comprimento, valor) de todos os prefixos, em ordem de endereço."""
+        stack = [(self._root, 0, 0)]
+        while stack:
+            node, addr, depth = stack.pop()
+            if node is None:
+                continue
+            if node[2] is not None:
+                yield addr, depth, node[2]
+            if depth < 32:
+                stack.append((node[1], addr | (1 << (31 - depth)), depth + 1))
+                stack.append((node[0], addr, depth + 1))
@@ -0,0 +1,204 @@
+# replay.py
+"""Reenvia um trace de captura (main.py --capture, ver capture.py) a um Router.
+
+Os datagramas recebidos no trace passam por Router.dispatch, que chama
+handle_route_announcement, handle_router_announcement ou handle_text_message,
+e cada chamada é cronometrada. O roteador roda numa transport.VirtualNetwork
+sem enlaces: o relógio dele segue os instantes do trace (prazos de vizinhos,
+rotas e anúncios vencem como na captura) e o que ele envia é só contado.
+Segmentos do trace (execuções diferentes) são emendados sem intervalo.
+
+Modos:
+  - padrão:     o mais rápido possível
+  - --realtime: respeita os intervalos do trace (divididos por --speed)
+
+Relata, por handler: datagramas, tempo total, vazão (datagramas por segundo
+de handler) e latência p50/p99/máx; também o tempo gasto nos prazos e quantos
+datagramas o roteador enviou contra os que foram gravados.
+
+Uso:
+  python replay.py trace.bin
+  python replay.py trace.bin --realtime --speed 4
+  python replay.py trace.bin --repeat 5 --json resultado.json
+"""
+import argparse
+import json
+import time
+from typing import Dict, List, Tuple
+
+from constants import INFINITY_METRIC, LOOP_PREVENTION, HOLDDOWN_TIME, ECMP_MAX_PATHS, SHARD_WORKERS
+from capture import read_trace, SEGMENT, TX
+from logging_utils import log, ERROR
+from roteador import Router
+from transport import VirtualNetwork
+from utils import LOOP_PREVENTION_MODES
+
+# handler chamado pelo dispatch para cada tipo de datagrama
+HANDLERS = {
+    "route": "handle_route_announcement",
+    "hello": "handle_router_announcement",
+    "message": "handle_text_message",
+}
+
+# (instante no relógio do replay, tipo, origem, datagrama)
+Arrival = Tuple[float, str, str, bytes]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Reenvia um trace de captura aos handlers do roteador")
+    parser.add_argument("trace", help="arquivo gravado com main.py --capture")
+    parser.add_argument("--realtime", action="store_true", help="respeita os intervalos entre os datagramas")
+    parser.add_argument("--speed", type=float, default=1.0, help="fator de aceleração do --realtime")
+    parser.add_argument("--repeat", type=int, default=1, help="passadas do trace (roteador novo a cada uma)")
+    parser.add_argument("--ip", help="IP do roteador (padrão: o do trace)")
+    parser.add_argument("--delta", action="store_true", help="roteador com anúncios incrementais")
+    parser.add_argument("--binary", action="store_true", help="roteador com formato binário")
+    parser.add_argument("--loop-prevention", choices=LOOP_PREVENTION_MODES, default=LOOP_PREVENTION,
+                        help="prevenção de laços do roteador")
+    parser.add_argument("--infinity", type=int, default=INFINITY_METRIC, help="métrica infinita")
+    parser.add_argument("--max-paths", type=int, default=ECMP_MAX_PATHS, help="caminhos de mesmo custo (ECMP)")
+    parser.add_argument("--holddown", type=float, default=HOLDDOWN_TIME, help="hold-down em segundos (0 = desligado)")
+    parser.add_argument("--shards", type=int, default=SHARD_WORKERS,
+                        help="processos que dividem o processamento de anúncios grandes (experimental; 0 = desligado)")
+    parser.add_argument("--json", metavar="ARQUIVO", help="grava os resultados em JSON ('-' = stdout)")
+    return parser.parse_args()
+
+
+def load_trace(path: str) -> Tuple[str, List[Arrival], int]:
+    """IP do roteador (primeiro segmento), datagramas recebidos com os
+    instantes emendados entre segmentos e quantos datagramas foram enviados."""
+    router_ip = ""
+    arrivals: List[Arrival] = []
+    sent = 0
+    now = 0.0
+    offset = 0.0
+    for rec in read_trace(path):
+        if rec[0] == SEGMENT:
+            _, opened, ip = rec
+            router_ip = router_ip or ip
+            # o segmento continua de onde o anterior parou
+            offset = (now if arrivals else opened) - opened
+            continue
+        kind, ts, kind_name, src, _, data = rec
+        if kind == TX:
+            sent += 1
+            continue
+        now = max(now, ts + offset)
+        arrivals.append((now, kind_name, src, data))
+    return router_ip, arrivals, sent
+
+
+def percentile(sorted_values: List[int], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(round(p / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[idx] / 1000.0
+
+
+def replay_once(args, router_ip: str, arrivals: List[Arrival]) -> Tuple[Dict[str, List[int]], float, float, int]:
+    """Uma passada do trace num roteador novo. Retorna as latências (ns) por
+    tipo, o tempo nos prazos, o tempo total e quantos datagramas ele enviou."""
+    net = VirtualNetwork()
+    net.clock.now = arrivals[0][0] if arrivals else 0.0
+    # vizinhos: quem mandou anúncios ou hellos no trace
+    neighbors = {src for _, kind, src, _ in arrivals if kind != "message" and src != router_ip}
+    router = Router(router_ip, neighbors, delta_updates=args.delta, binary_wire=args.binary,
+                    scheduler=net.scheduler_for(router_ip), transport=net.transport_for(router_ip),
+                    shards=args.shards, loop_prevention=args.loop_prevention, infinity=args.infinity,
+                    holddown=args.holddown, max_paths=args.max_paths)
+    net.add_router(router)
+    latencies: Dict[str, List[int]] = {kind: [] for kind in HANDLERS}
+    timers = 0.0
+    clock = time.perf_counter_ns
+    try:
+        wall0 = time.perf_counter()
+        net.start_router(router)
+        t_first = net.clock.now
+        for when, kind, src, data in arrivals:
+            if args.realtime:
+                delay = wall0 + (when - t_first) / args.speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            t0 = time.perf_counter()
+            net.run_until(when)
+            timers += time.perf_counter() - t0
+            t0 = clock()
+            router.dispatch(data, src)
+            latencies[kind].append(clock() - t0)
+        elapsed = time.perf_counter() - wall0
+    finally:
+        if router.shards is not None:
+            router.shards.close()
+    return latencies, timers, elapsed, net.sent[router_ip][0]
+
+
+def main():
+    args = parse_args()
+    # os handlers logam cada rota alterada: só erros durante as medições
+    log.set_level(ERROR)
+    router_ip, arrivals, recorded_tx = load_trace(args.trace)
+    router_ip = args.ip or router_ip
+    if not arrivals:
+        print(f"{args.trace}: nenhum datagrama recebido no trace")
+        return
+
+    samples: Dict[str, List[int]] = {kind: [] for kind in HANDLERS}
+    timers = elapsed = 0.0
+    sent = 0
+    for _ in range(max(1, args.repeat)):
+        lat, t, e, s = replay_once(args, router_ip, arrivals)
+        for kind, values in lat.items():
+            samples[kind].extend(values)
+        timers += t
+        elapsed += e
+        sent += s
+    passes = max(1, args.repeat)
+
+    handlers = {}
+    for kind, values in samples.items():
+        if not values:
+            continue
+        values.sort()
+        total = sum(values) / 1e9
+        handlers[HANDLERS[kind]] = {
+            "datagrams": len(values),
+            "seconds": total,
+            "per_sec": len(values) / total if total else 0.0,
+            "p50_us": percentile(values, 50),
+            "p99_us": percentile(values, 99),
+            "max_us": percentile(values, 100),
+        }
+    results = {
+        "trace": args.trace,
+        "router": router_ip,
+        "mode": f"realtime x{args.speed:g}" if args.realtime else "max",
+        "passes": passes,
+        "received": len(arrivals),
+        "trace_seconds": arrivals[-1][0] - arrivals[0][0],
+        "elapsed": elapsed / passes,
+        "timers_seconds": timers / passes,
+        "sent": sent / passes,
+        "recorded_sent": recorded_tx,
+        "handlers": handlers,
+    }
+
+    if args.json:
+        text = json.dumps(results, indent=2)
+        if args.json == "-":
+            print(text)
+        else:
+            with open(args.json, "w") as f:
+                f.write(text + "\n")
+        return
+    print(f"{args.trace}: roteador {router_ip}, {len(arrivals)} datagramas recebidos em "
+          f"{results['trace_seconds']:.1f}s de trace, modo {results['mode']}, {passes} passada(s)")
+    print(f"{'handler':<28}{'datagramas':>11}{'tempo (s)':>11}{'por seg':>11}{'p50 (us)':>10}{'p99 (us)':>10}{'máx (us)':>11}")
+    for name, r in handlers.items():
+        print(f"{name:<28}{r['datagrams']:>11}{r['seconds']:>11.3f}{r['per_sec']:>11.0f}"
+              f"{r['p50_us']:>10.1f}{r['p99_us']:>10.1f}{r['max_us']:>11.1f}")
+    print(f"prazos: {results['timers_seconds']:.3f}s | duração: {results['elapsed']:.3f}s por passada | "
+          f"enviados: {results['sent']:.0f} (gravados: {recorded_tx})")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,286 @@
+import hashlib
+import random
 import socket
 import threading
 import time
-from typing import Dict, Tuple, Set, Optional
-from constants import PORT, ROUTE_ANNOUNCE_INTERVAL, NEIGHBOR_TIMEOUT, TABLE_PRINT_INTERVAL
-from utils import now_ts, serialize_table_for_neighbor, parse_route_announcement
-from logging_utils import format_table
+import zlib
+from functools import partial
+from typing import Callable, Dict, Iterable, List, Tuple, Set, Optional, Union
+from constants import (PORT, ROUTE_ANNOUNCE_INTERVAL, NEIGHBOR_TIMEOUT, TABLE_PRINT_INTERVAL, ROUTE_TIMEOUT,
+                       INFINITY_METRIC, DELTA_UPDATES, TRIGGERED_UPDATE_DELAY, BINARY_WIRE,
+                       RECV_BUFFER_SIZE, CONVERGENCE_QUIET_PERIOD, SHARD_WORKERS,
+                       LOOP_PREVENTION, HOLDDOWN_TIME, SUMMARIZE_ROUTES, ECMP_MAX_PATHS,
+                       SNAPSHOT_INTERVAL, WARM_START_TTL, WARM_START_MAX_AGE,
+                       CONTROL_QUEUE_SIZE, DATA_QUEUE_SIZE, DATA_RATE_NEIGHBOR, DATA_BURST_NEIGHBOR,
+                       DATA_RATE_ORIGIN, DATA_BURST_ORIGIN, ANNOUNCE_MAX_INTERVAL, ANNOUNCE_JITTER,
+                       HELLO_INTERVAL, CAPTURE_MAX_BYTES)
+from utils import (serialize_table_for_neighbor, serialize_delta_for_neighbor,
+                   parse_route_announcement, parse_binary_announcement, binary_hello_capable,
+                   parse_chunk_header, describe_datagram, ip_to_int, format_dest, parse_dest,
+                   format_hello, parse_hello,
+                   BINARY_MAGIC, DELTA_PREFIX, CAPABILITY_TOKEN, HELLO_CAPABILITY_TOKEN,
+                   LOOP_PREVENTION_MODES, ChunkInfo)
+from logging_utils import format_table, safe_print, log, DEBUG, INFO
+from metrics import Registry, TimedLock, CONVERGENCE_BUCKETS
+from route_table import RouteTable, RouteChange, merge_announcement, drop_next_hop
+from sharding import ShardPool
+from transfer import TransferManager
+from probe import ProbeManager, PROBE_TAG
+from qos import PriorityQueues, RateLimiter, traffic_class, CLASSES
+from capture import TraceWriter, RX, TX
+from snapshot import read_snapshot, write_snapshot, NEIGHBOR_ACTIVE, NEIGHBOR_BINARY, NEIGHBOR_HELLO
+from scheduler import Scheduler
+from transport import UdpTransport
+
+# Datagramas recebidos chegam ao dispatch como memoryview do buffer de recepção
+Datagram = Union[bytes, bytearray, memoryview]
+
+_HELLO = ord("@")
+_TEXT = ord("!")
+# '!' + dois IPv4 + dois ';' cabem nisso; o resto da mensagem não é decodificado
+_TEXT_HEADER_MAX = 1 + 2 * len("255.255.255.255") + 2
+
+# tipo de mensagem (label das métricas de rx/tx) pelo primeiro byte; o resto é anúncio de rotas
+MESSAGE_TYPES = ("hello", "message", "route")
+_MESSAGE_TYPE = {_HELLO: "hello", _TEXT: "message"}
+
+# a métrica vai num byte no formato binário
+_MAX_INFINITY = 255
+
+
+def _digest(payload: Union[str, Datagram]) -> bytes:
+    """Digest de um anúncio recebido, para reconhecer repetições sem decodificá-lo."""
+    return hashlib.blake2b(payload.encode() if isinstance(payload, str) else payload, digest_size=16).digest()
+
+
+class _AdvCache:
+    """Tabela completa de um vizinho já aplicada: digests dos datagramas
+    (um só ou os fragmentos da geração) e, sem fragmentos, as rotas recebidas
+    (destino -> métrica), base para processar só a diferença do próximo anúncio."""
+    __slots__ = ("generation", "digests", "complete", "parsed")
+
+    def __init__(self, generation: Optional[int], complete: bool, parsed: Optional[Dict[int, int]] = None):
+        self.generation = generation
+        self.digests: Set[bytes] = set()
+        # fragmentos: só pula repetições depois que a geração chegou inteira
+        self.complete = complete
+        self.parsed = parsed
 
 class Router:
-    def __init__(self, ip: str, neighbors: Set[str]):
+    def __init__(self, ip: str, neighbors: Set[str], delta_updates: bool = DELTA_UPDATES,
+                 binary_wire: bool = BINARY_WIRE, scheduler: Optional[Scheduler] = None,
+                 transport=None, shards: int = SHARD_WORKERS,
+                 loop_prevention: str = LOOP_PREVENTION, infinity: int = INFINITY_METRIC,
+                 holddown: float = HOLDDOWN_TIME, networks: Iterable[str] = (),
+                 summarize: bool = SUMMARIZE_ROUTES, max_paths: int = ECMP_MAX_PATHS,
+                 snapshot_path: Optional[str] = None, data_rate: float = DATA_RATE_NEIGHBOR,
+                 origin_rate: float = DATA_RATE_ORIGIN, announce_max: float = ANNOUNCE_MAX_INTERVAL,
+                 capture_path: Optional[str] = None):
+        if loop_prevention not in LOOP_PREVENTION_MODES:
+            raise ValueError(f"prevenção de laços inválida: {loop_prevention!r} "
+                             f"(use {', '.join(LOOP_PREVENTION_MODES)})")
+        if not 2 <= infinity <= _MAX_INFINITY:
+            raise ValueError(f"métrica infinita deve estar entre 2 e {_MAX_INFINITY}: {infinity}")
+        if max_paths < 1:
+            raise ValueError(f"max_paths deve ser pelo menos 1: {max_paths}")
+        # redes diretamente conectadas ('a.b.c.d/len'); levanta ValueError se inválidas
+        local_networks = [parse_dest(net) for net in networks]
         self.ip = ip
         self.neighbors = neighbors  # ips (strings)
-        # tabela: dest_ip -> (metric:int, next_hop:str, last_updated_ts:float, origin:str)
+        # todos os prazos (vizinhos, envelhecimento de rotas, anúncios, impressão);
+        # o relógio do escalonador é o relógio do roteador (virtual na simulação)
+        self.scheduler = scheduler if scheduler is not None else Scheduler()
+        self.clock = self.scheduler.clock
+
+        # contadores/histogramas do roteador (CLI 'M' e endpoint HTTP, ver metrics.py)
+        self.metrics = Registry()
+        self._init_metrics()
+
+        # tabela: dest (prefixo IPv4, ver utils.prefix_key) -> Route(metric, next_hop:str, ts, origin)
         # origin: 'local' (configuração direta / vizinho físico) ou 'learned' (recebida de anúncio)
-        self.table: Dict[str, Tuple[int, str, float, str]] = {}
+        self.table = RouteTable(lock=TimedLock(
+            self.metrics.histogram("router_lock_wait_seconds", "Espera para obter o lock do roteador"),
+            self.metrics.histogram("router_lock_hold_seconds", "Tempo com o lock do roteador preso")))
+        # o lock da tabela (RLock) é o lock global do roteador
+        self.lock = self.table.lock
         # não incluir rota para ele mesmo
         # inicializar tabela com vizinhos (métrica 1)
         for n in self.neighbors:
             if n != self.ip:
-                self.table[n] = (1, n, now_ts(), 'local')
+                self.table.set(ip_to_int(n), 1, n, self.clock(), 'local')
+        # redes conectadas: métrica 0 e next_hop = o próprio roteador (entrega local)
+        for dest in local_networks:
+            self.table.set(dest, 0, self.ip, self.clock(), 'local')
+        self.table.publish_fib()
 
-        # dados por vizinho: o último conjunto de rotas que esse vizinho anunciou
-        self.neigh_adv: Dict[str, Set[str]] = {n: set() for n in self.neighbors}
+        # dados por vizinho: o último conjunto de rotas (destinos int) que esse vizinho anunciou
+        self.neigh_adv: Dict[str, Set[int]] = {n: set() for n in self.neighbors}
         self.neigh_last_heard: Dict[str, float] = {n: 0.0 for n in self.neighbors}
-        self.lock = threading.Lock()
+        # última vez que chegou uma tabela completa do vizinho: renova todas as
+        # rotas via ele que estão em neigh_adv (ver _route_expired), sem
+        # mexer em cada entrada quando o anúncio se repete
+        self.neigh_fresh: Dict[str, float] = {}
+        # anúncios completos já aplicados, por vizinho (ver _AdvCache); vale
+        # enquanto nenhuma rota foi perdida ou piorou (_forget_adv_cache)
+        self._adv_cache: Dict[str, _AdvCache] = {}
 
-        # socket UDP usado para enviar/receber na porta definida
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.sock.bind((self.ip, PORT))
-        self.sock.settimeout(1.0)
+        # atualizações incrementais: destinos alterados desde o último envio,
+        # acumulados durante TRIGGERED_UPDATE_DELAY antes de virar um único datagrama
+        self.delta_updates = delta_updates
+        self._pending_delta: Set[int] = set()
+        self._delta_timer_armed = False
+        # envios da tabela inteira disparados por mudança (sem delta_updates ou
+        # a pedido de um vizinho): o primeiro sai na hora e os seguintes dentro
+        # de TRIGGERED_UPDATE_DELAY viram um só no fim da janela (nome -> último, armado)
+        self._damping: Dict[str, Tuple[float, bool]] = {}
+        # pedir as tabelas dos vizinhos ('*REQ') junto com o próximo envio disparado
+        self._request_tables = False
+
+        # formato binário: só é usado com vizinhos que também o anunciaram
+        # (CAPABILITY_TOKEN no anúncio em texto ou um anúncio binário recebido)
+        self.binary_wire = binary_wire
+        self.binary_peers: Set[str] = set()
+        # hellos '@IP*IVL=N' e '*REQ': só para vizinhos que anunciaram
+        # HELLO_CAPABILITY_TOKEN; os demais recebem '@IP'
+        self.hello_peers: Set[str] = set()
+
+        # prevenção de laços: rotas aprendidas de um vizinho não voltam para ele
+        # ('split') ou voltam com métrica infinita ('poison'); métricas que chegam
+        # a self.infinity são inalcançáveis (precisa ser igual em todos os roteadores)
+        self.loop_prevention = loop_prevention
+        self.infinity = infinity
+        # anúncios completos com prefixos contíguos de mesma métrica agregados
+        self.summarize = summarize
+        # ECMP: até max_paths next hops de mesma métrica por destino (1 = desligado);
+        # o encaminhamento escolhe um por fluxo (origem, destino)
+        self.max_paths = max_paths
+        # hold-down: destino que perdeu a rota (ou piorou) -> (fim, métrica e
+        # next_hop de antes). Até o fim, só aceita rotas melhores que a de antes
+        # ou vindas do mesmo next_hop, para não reaprender o caminho antigo de um
+        # vizinho que ainda não soube da falha (0 = desligado)
+        self.holddown = holddown
+        self._holddown: Dict[int, Tuple[float, int, str]] = {}
+
+        # anúncios periódicos adaptativos: o intervalo entre tabelas completas
+        # dobra a cada anúncio sem mudança na tabela (até announce_max) e volta a
+        # ROUTE_ANNOUNCE_INTERVAL na primeira mudança. Entre as tabelas, um hello
+        # a cada HELLO_INTERVAL mantém os vizinhos vivos, então a detecção de
+        # falhas continua em NEIGHBOR_TIMEOUT
+        self.announce_max = max(announce_max, ROUTE_ANNOUNCE_INTERVAL)
+        self.announce_interval = ROUTE_ANNOUNCE_INTERVAL
+        self._announce_deadline = 0.0
+        self._announced_version = -1
+        self._advertised_interval: Optional[float] = None
+        # vizinho -> intervalo entre tabelas completas anunciado no hello dele
+        self.neigh_interval: Dict[str, float] = {}
+
+        # warm start: rotas aprendidas e estado dos vizinhos gravados em
+        # snapshot_path a cada SNAPSHOT_INTERVAL (se mudaram) e no stop(); na
+        # partida, as rotas do snapshot entram como provisórias (ver _load_snapshot)
+        self.snapshot_path = snapshot_path
+        self._snapshot_state: Optional[Tuple[int, Tuple[Tuple[str, int], ...]]] = None
+
+        # cache do payload serializado por vizinho: vizinho -> (versão, binário, datagramas).
+        # Cada vizinho tem o seu por causa da prevenção de laços.
+        self._payload_cache: Dict[str, Tuple[int, bool, List[Union[str, bytes]]]] = {}
+        # geração dos anúncios fragmentados = base aleatória + versão da tabela,
+        # para não se confundir com fragmentos de antes de um reinício
+        self._generation_base = random.getrandbits(32)
+        # remontagem dos fragmentos recebidos: vizinho -> (geração, total, seqs, destinos)
+        self._reassembly: Dict[str, Tuple[int, int, Set[int], Set[int]]] = {}
+
+        # filas entre a recepção e o processamento: controle passa na frente dos dados (qos.py)
+        self.rx_queues = PriorityQueues(CONTROL_QUEUE_SIZE, DATA_QUEUE_SIZE)
+        # limites de repasse de mensagens '!': por vizinho de quem chegou, por
+        # origem e por vizinho para onde vai (send_to)
+        self._limit_in = RateLimiter(data_rate, DATA_BURST_NEIGHBOR)
+        self._limit_origin = RateLimiter(origin_rate, DATA_BURST_ORIGIN)
+        self._limit_out = RateLimiter(data_rate, DATA_BURST_NEIGHBOR)
+
+        # convergência: início e última mudança da rajada atual (None = tabela estável)
+        self._burst_start: Optional[float] = None
+        self._burst_last = 0.0
+
+        # transferências de dados grandes sobre as mensagens de texto (transfer.py)
+        self.transfers = TransferManager(self)
+        # ping, traceroute e gerador de carga (probe.py)
+        self.probes = ProbeManager(self)
+
+        # rede: socket UDP na porta definida (padrão) ou transporte virtual (transport.py)
+        self.transport = transport if transport is not None else UdpTransport(ip)
+
+        # captura: datagramas recebidos e enviados gravados em capture_path
+        # (capture.py; replay.py os reenvia aos handlers)
+        self.capture: Optional[TraceWriter] = None
+        if capture_path:
+            try:
+                self.capture = TraceWriter(capture_path, ip, self.clock(), CAPTURE_MAX_BYTES)
+            except OSError:
+                self.transport.close()
+                raise
 
+        # sharding: merge dos anúncios grandes dividido entre processos (ver sharding.py).
+        # Depois do socket e da captura: se eles falharem, não sobram processos rodando
+        self.shards: Optional[ShardPool] = ShardPool(self.table, shards) if shards > 0 else None
 
         # control
         self._stop_event = threading.Event()
+        self.threads = []
+
+        if snapshot_path:
+            self._load_snapshot()
+
+    def _init_metrics(self):
+        m = self.metrics
+        self._m_rx = {t: (m.counter("router_rx_packets_total", "Datagramas recebidos", type=t),
+                          m.counter("router_rx_bytes_total", "Bytes recebidos", type=t))
+                      for t in MESSAGE_TYPES}
+        self._m_tx = {t: (m.counter("router_tx_packets_total", "Datagramas enviados", type=t),
+                          m.counter("router_tx_bytes_total", "Bytes enviados", type=t))
+                      for t in MESSAGE_TYPES}
+        self._m_announce = m.histogram("router_route_announcement_seconds",
+                                       "Tempo de processamento de um anúncio de rotas")
+        self._m_convergence = m.histogram("router_convergence_seconds",
+                                          "Duração de uma rajada de mudanças na tabela até estabilizar",
+                                          CONVERGENCE_BUCKETS)
+        self._m_cache_hits = m.counter("router_payload_cache_hits_total", "Anúncios servidos do cache")
+        self._m_cache_misses = m.counter("router_payload_cache_misses_total", "Anúncios serializados de novo")
+        self._m_neighbor_up = m.counter("router_neighbor_up_total", "Vizinhos que passaram a responder")
+        self._m_neighbor_down = m.counter("router_neighbor_down_total", "Vizinhos considerados inativos")
+        self._m_failover = m.counter("router_ecmp_failover_total",
+                                     "Rotas que passaram para outro caminho de mesmo custo")
+        m.gauge("router_multipath_routes", "Rotas com mais de um next hop",
+                lambda: sum(1 for _, r in list(self.table.items()) if r.alternates))
+        self._m_warm_routes = m.counter("router_warm_start_routes_total",
+                                        "Rotas carregadas do snapshot na partida")
+        self._m_snapshot_writes = m.counter("router_snapshot_writes_total", "Snapshots da tabela gravados")
+        self._m_holddown = m.counter("router_holddown_started_total", "Destinos colocados em hold-down")
+        self._m_adv_unchanged = m.counter("router_announcements_unchanged_total",
+                                          "Anúncios completos iguais ao anterior (só renovam o vizinho)")
+        self._m_holddown_ignored = m.counter("router_holddown_ignored_total",
+                                             "Rotas anunciadas ignoradas por hold-down")
+        self._m_queue_dropped = {c: m.counter("router_rx_queue_dropped_total",
+                                              "Datagramas descartados com a fila de recepção cheia", **{"class": c})
+                                 for c in CLASSES}
+        for c in CLASSES:
+            m.gauge("router_rx_queue_depth", "Datagramas esperando processamento",
+                    partial(lambda c: self.rx_queues.depth(c), c), **{"class": c})
+        self._m_rate_limited = {k: m.counter("router_rate_limited_total",
+                                             "Mensagens '!' descartadas por limite de taxa", limit=k)
+                                for k in ("neighbor", "origin", "egress")}
+        m.gauge("router_announce_interval_seconds", "Intervalo atual entre anúncios completos da tabela",
+                lambda: self.announce_interval)
+        m.gauge("router_routes", "Rotas na tabela", lambda: len(self.table))
+        m.gauge("router_table_version", "Versão da tabela", lambda: self.table.version)
+        m.gauge("router_neighbors_active", "Vizinhos ativos",
+                lambda: sum(1 for t in list(self.neigh_last_heard.values()) if t))
+        m.gauge("router_log_dropped", "Registros de log descartados (fila cheia)", lambda: log.dropped)
+
+    def _count(self, counters, data: Datagram):
+        """Conta um datagrama (já em bytes) nas métricas de rx ou tx."""
+        packets, nbytes = counters[_MESSAGE_TYPE.get(data[0], "route") if len(data) else "route"]
+        packets.inc()
+        nbytes.inc(len(data))
 
     # ------------------------
     # Serialização / Parsers
@@ -40,31 +289,166 @@ class Router:
     # ------------------------
     # Envio de mensagens
     # ------------------------
-    def send_to(self, dest_ip: str, message: str):
+    def _egress_allowed(self, dest_ip: str, message: Datagram) -> bool:
+        """Limite de taxa por vizinho de saída, só para dados ('!'); controle nunca é limitado."""
+        if message[:1] != b"!" or self._limit_out.allow(dest_ip, self.clock()):
+            return True
+        self._m_rate_limited["egress"].inc()
+        log.debug("tx", "[QOS] Mensagem para %s descartada: limite de taxa do vizinho", dest_ip)
+        return False
+
+    def send_to(self, dest_ip: str, message: Union[str, Datagram]):
         try:
-            print(f"[DEBUG] Enviando para ({dest_ip},{PORT}) : => {message}")
-            self.sock.sendto(message.encode('utf-8'), (dest_ip, PORT))
+            if isinstance(message, str):
+                log.debug("tx", "[DEBUG] Enviando para (%s,%s) : => %s", dest_ip, PORT, message)
+                message = message.encode('utf-8')
+            elif log.enabled("tx", DEBUG):
+                log.debug("tx", "[DEBUG] Enviando para (%s,%s) : => %s", dest_ip, PORT, describe_datagram(message))
+            if not self._egress_allowed(dest_ip, message):
+                return
+            self.transport.sendto(message, dest_ip)
+            self._count(self._m_tx, message)
+            if self.capture is not None:
+                self.capture.record(TX, self.clock(), self.ip, dest_ip, message)
         except OSError as e:
-            print(f"[WARN] Erro ao enviar para {dest_ip}: {e}")
+            log.warn("tx", "[WARN] Erro ao enviar para %s: %s", dest_ip, e)
 
     def broadcast_routes(self, immediate=False):
         """
         Envia a tabela atual para todos os vizinhos.
         Se immediate=True, usado quando tabela mudou e precisa notificar imediatamente.
         """
+        neighbors = list(self.neighbors)
         with self.lock:
-            table_copy = dict(self.table)
-        for n in list(self.neighbors):
-            payload = serialize_table_for_neighbor(table_copy, n, self.ip)
+            if not immediate:
+                # a tabela completa já cobre as mudanças pendentes
+                self._pending_delta.clear()
+            version = self.table.version
+            # só tira snapshot se algum vizinho precisar reserializar
+            routes = None
+            via_alternate = {}
+            for n in neighbors:
+                if not self._cached_payload(n, version, self._use_binary(n)):
+                    routes = self.table.snapshot()
+                    via_alternate = {nb: set(self.table.alt_via(nb)) for nb in neighbors}
+                    break
+        for n in neighbors:
+            binary = self._use_binary(n)
+            payloads = self._cached_payload(n, version, binary)
+            if payloads is not None:
+                self._m_cache_hits.inc()
+            else:
+                self._m_cache_misses.inc()
+                payloads = serialize_table_for_neighbor(
+                    routes, n, self.ip, binary=binary,
+                    generation=self._generation_base + version,
+                    advertise_binary=self.binary_wire,
+                    loop_prevention=self.loop_prevention, infinity=self.infinity,
+                    summarize=self.summarize, via_alternate=via_alternate[n])
+                self._payload_cache[n] = (version, binary, payloads)
             # if payload:
             # print(f"mandando para {n}")
-            self.send_to(n, payload)
+            for payload in payloads:
+                self.send_to(n, payload)
             # print(f"enviei : {payload} para o {n}")
             # else:
                 # enviar mensagem vazia (nenhuma rota anunciada) é aceitável — porém enviar string vazia não trafega, então mandamos um marker vazio
                 # self.send_to(n, "")  # socket sendto permite "", será ignorado do outro lado
+        self._schedule_hello()
         if immediate:
-            print("[ROUTER] Enviado anúncio imediato de rotas para vizinhos.")
+            log.debug("tx", "[ROUTER] Enviado anúncio imediato de rotas para vizinhos.")
+
+    def trigger_update(self, changes):
+        """
+        Chamado quando a tabela mudou.
+        Sem delta_updates reenvia a tabela inteira na hora; com delta_updates
+        acumula os destinos alterados e agenda um único envio incremental após
+        TRIGGERED_UPDATE_DELAY, juntando vários gatilhos em um datagrama por vizinho.
+        """
+        self._note_change()
+        if changes.get("removed") or changes.get("worsened"):
+            # rota perdida ou pior: os vizinhos podem estar com os anúncios
+            # espaçados, então pede as tabelas deles (depois do nosso envio, para
+            # que a resposta já leve em conta o que perdemos)
+            with self.lock:
+                self._request_tables = True
+        if not self.delta_updates:
+            # sem a janela, cada anúncio recebido vira um envio para todos os
+            # vizinhos e uma contagem até o infinito se multiplica pela rede
+            self._damped("table", self._send_triggered_table)
+            return
+        dests = [d for d, _, _ in changes.get("added", [])]
+        dests += [d for d, _, _ in changes.get("updated", [])]
+        dests += list(changes.get("removed", []))
+        with self.lock:
+            self._pending_delta.update(dests)
+            if self._delta_timer_armed:
+                return
+            self._delta_timer_armed = True
+        self.scheduler.call_later(TRIGGERED_UPDATE_DELAY, self.flush_triggered_update)
+
+    def _send_triggered_table(self):
+        self.broadcast_routes(immediate=True)
+        self._send_table_request()
+
+    def _send_table_request(self):
+        with self.lock:
+            request, self._request_tables = self._request_tables, False
+        if request:
+            self.send_hello(request=True)
+
+    def _damped(self, name: str, send: Callable[[], None]):
+        """Chama send agora ou, se o mesmo envio saiu há menos de
+        TRIGGERED_UPDATE_DELAY, uma vez só no fim da janela."""
+        now = self.clock()
+        with self.lock:
+            last, armed = self._damping.get(name, (float("-inf"), False))
+            if armed:
+                return
+            wait = last + TRIGGERED_UPDATE_DELAY - now
+            self._damping[name] = (last, True) if wait > 0 else (now, False)
+        if wait > 0:
+            self.scheduler.call_later(wait, partial(self._damped_fire, name, send))
+        else:
+            send()
+
+    def _damped_fire(self, name: str, send: Callable[[], None]):
+        with self.lock:
+            self._damping[name] = (self.clock(), False)
+        send()
+
+    def flush_triggered_update(self):
+        """Envia as rotas alteradas desde o último envio (anúncio incremental '+')."""
+        with self.lock:
+            pending = self._pending_delta
+            self._pending_delta = set()
+            self._delta_timer_armed = False
+            if not pending:
+                return
+            # destinos que saíram da tabela vão como retirada (métrica infinita)
+            routes = self.table.rows(pending, self.infinity)
+            neighbors = list(self.neighbors)
+            via_alternate = {nb: set(self.table.alt_via(nb)) for nb in neighbors}
+        for n in neighbors:
+            binary = self._use_binary(n)
+            for payload in serialize_delta_for_neighbor(routes, n, self.ip, binary=binary,
+                                                        advertise_binary=self.binary_wire,
+                                                        loop_prevention=self.loop_prevention,
+                                                        infinity=self.infinity,
+                                                        via_alternate=via_alternate[n]):
+                self.send_to(n, payload)
+        self._schedule_hello()
+        self._send_table_request()
+        log.debug("tx", "[ROUTER] Enviada atualização incremental de %d rota(s) para vizinhos.", len(pending))
+
+    def _cached_payload(self, neighbor_ip: str, version: int, binary: bool) -> Optional[List[Union[str, bytes]]]:
+        cached = self._payload_cache.get(neighbor_ip)
+        if cached is None or cached[0] != version or cached[1] != binary:
+            return None
+        return cached[2]
+
+    def _use_binary(self, neighbor_ip: str) -> bool:
+        return self.binary_wire and neighbor_ip in self.binary_peers
 
     def send_announcement_self(self):
         """
@@ -73,319 +457,828 @@ class Router:
         msg = f"@{self.ip}"
         for n in list(self.neighbors):
             self.send_to(n, msg)
-        print("[ROUTER] Anúncio @ enviado aos vizinhos.")
+        log.debug("tx", "[ROUTER] Anúncio @ enviado aos vizinhos.")
+
+    def send_hello(self, request: bool = False):
+        """Envia '@<meu_ip>*IVL=<intervalo>' para os vizinhos: mantém o vizinho
+        vivo entre tabelas espaçadas e informa o intervalo atual delas. Com
+        request, pede também a tabela completa de cada vizinho ('*REQ')."""
+        with self.lock:
+            interval = self.announce_interval
+            self._advertised_interval = interval
+        msg = format_hello(self.ip, interval, request)
+        plain = format_hello(self.ip)
+        with self.lock:
+            peers = [(n, n in self.hello_peers) for n in self.neighbors]
+        for n, capable in peers:
+            self.send_to(n, msg if capable else plain)
+        self._schedule_hello()
+        log.debug("tx", "[ROUTER] Hello enviado aos vizinhos (tabela a cada %gs).", interval)
 
     # ------------------------
     # Recepção e processamento
     # ------------------------
-    def handle_route_announcement(self, neighbor_ip: str, payload: str):
+    def handle_route_announcement(self, neighbor_ip: str, payload: Union[str, Datagram]):
+        """Processa um anúncio de rotas, medindo o tempo de processamento."""
+        t0 = time.perf_counter()
+        try:
+            self._process_route_announcement(neighbor_ip, payload)
+        finally:
+            self._m_announce.observe(time.perf_counter() - t0)
+
+    def _process_route_announcement(self, neighbor_ip: str, payload: Union[str, Datagram]):
         """
         Processa um anúncio de rotas recebido de um vizinho (neighbor_ip).
     
-        O payload tem o formato: "*DEST_IP;METRIC..."
+        O payload tem o formato: "*DEST_IP;METRIC..." (tabela completa),
+        "#GEN;SEQ;TOTAL*DEST_IP;METRIC..." (fragmento de uma tabela completa) ou
+        "+*DEST_IP;METRIC..." (incremental: só as rotas alteradas; métrica
+        self.infinity indica rota retirada). Payloads bytes estão no formato
+        binário (ver utils.parse_binary_announcement).
         - Incrementa a métrica em +1 para rotas aprendidas.
-        - Atualiza, adiciona ou remove rotas conforme necessário.
+        - Ignora rotas de destinos em hold-down que não sejam melhores que a perdida.
+        - Atualiza, adiciona ou remove rotas conforme necessário; fragmentos
+          acrescentam rotas na hora, mas só retiram as ausentes quando a geração
+          inteira chegou.
         - Envia atualizações se houver alterações.
+
+        Uma tabela completa idêntica à última já aplicada (mesmo digest) só
+        renova o vizinho e o carimbo neigh_fresh, sem ser decodificada; uma
+        diferente, não fragmentada, passa ao merge só os destinos novos ou com
+        métrica alterada (as retiradas saem da comparação com neigh_adv).
         """
-        parsed = parse_route_announcement(payload)
-        now = now_ts()
+        digest = _digest(payload)
+        now = self.clock()
+        with self.lock:
+            cache = self._adv_cache.get(neighbor_ip)
+            if (cache is not None and cache.complete and digest in cache.digests
+                    and ip_to_int(neighbor_ip) in self.table):
+                self._refresh_neighbor(neighbor_ip, now)
+                self.neigh_fresh[neighbor_ip] = now
+                self._m_adv_unchanged.inc()
+                return
+        try:
+            if isinstance(payload, str):
+                binary_capable = CAPABILITY_TOKEN in payload
+                hello_capable = HELLO_CAPABILITY_TOKEN in payload
+                delta = payload.startswith(DELTA_PREFIX)
+                if delta:
+                    payload = payload[len(DELTA_PREFIX):]
+                chunk = parse_chunk_header(payload)
+                parsed = parse_route_announcement(payload)
+            else:
+                delta, chunk, parsed = parse_binary_announcement(payload)
+                binary_capable = True
+                hello_capable = binary_hello_capable(payload)
+        except ValueError as e:
+            log.warn("rx", "[WARN] Anúncio de rotas inválido de %s: %s", neighbor_ip, e)
+            return
     
         changes = {"added": [], "updated": [], "removed": []}
     
         with self.lock:
+            # Negociação do formato binário com esse vizinho
+            if binary_capable:
+                self.binary_peers.add(neighbor_ip)
+            else:
+                self.binary_peers.discard(neighbor_ip)
+            if hello_capable:
+                self.hello_peers.add(neighbor_ip)
+            else:
+                self.hello_peers.discard(neighbor_ip)
+
             # Atualiza timestamp de último contato do vizinho
-            self.neigh_last_heard[neighbor_ip] = now
+            self._refresh_neighbor(neighbor_ip, now)
     
             # Mantém o conjunto de rotas anunciadas por esse vizinho
+            # (rotas com métrica infinita, como as de poison reverse, não contam)
+            infinity = self.infinity
             previous_adv = self.neigh_adv.get(neighbor_ip, set())
-            current_adv = set(parsed.keys())
+            withdrawn: Set[int] = set()
+            if delta or chunk is not None:
+                # incremental ou fragmento: por enquanto só acrescenta
+                current_adv = set(previous_adv)
+                for dest, recv_metric in parsed.items():
+                    if recv_metric >= infinity:
+                        current_adv.discard(dest)
+                    else:
+                        current_adv.add(dest)
+                if chunk is not None:
+                    cache = self._adv_cache.get(neighbor_ip)
+                    if cache is None or cache.generation != chunk[0]:
+                        cache = self._adv_cache[neighbor_ip] = _AdvCache(chunk[0], False)
+                    cache.digests.add(digest)
+                    complete = self._reassemble(neighbor_ip, chunk, parsed)
+                    if complete is not None:
+                        # geração completa: o que não veio em nenhum fragmento foi retirado
+                        withdrawn = current_adv - complete
+                        current_adv = complete
+                        cache.complete = True
+                        self.neigh_fresh[neighbor_ip] = now
+                else:
+                    # a base da diferença mudou sem passar por aqui
+                    self._adv_cache.pop(neighbor_ip, None)
+            else:
+                current_adv = {dest for dest, recv_metric in parsed.items() if recv_metric < infinity}
+                withdrawn = previous_adv - current_adv
+                self._reassembly.pop(neighbor_ip, None)
+                cache = self._adv_cache.get(neighbor_ip)
+                previous = cache.parsed if cache is not None else None
+                cache = self._adv_cache[neighbor_ip] = _AdvCache(None, True, parsed)
+                cache.digests.add(digest)
+                self.neigh_fresh[neighbor_ip] = now
+                if previous is not None:
+                    # o resto já está aplicado e é renovado por neigh_fresh
+                    parsed = {dest: recv_metric for dest, recv_metric in parsed.items()
+                              if previous.get(dest) != recv_metric}
             self.neigh_adv[neighbor_ip] = current_adv
     
             # Garante que o vizinho esteja registrado na tabela
-            if neighbor_ip not in self.table:
-                print(f"[INFO] Vizinho {neighbor_ip} adicionado à tabela")
-                self.table[neighbor_ip] = (1, neighbor_ip, now, 'learned')
+            neighbor_key = ip_to_int(neighbor_ip)
+            if neighbor_key not in self.table:
+                log.info("route", "[INFO] Vizinho %s adicionado à tabela", neighbor_ip)
+                self.table.set(neighbor_key, 1, neighbor_ip, now, 'learned')
+                self._track_route(neighbor_key, now)
                 self.neighbors.add(neighbor_ip)
-                changes["added"].append((neighbor_ip, 1, neighbor_ip))
+                changes["added"].append((neighbor_key, 1, neighbor_ip))
     
-            # --- Processa cada rota recebida ---
-            for dest, recv_metric in parsed.items():
-                if dest == self.ip:
-                    # Ignora anúncios de rota para si próprio
-                    continue
-                
-                candidate_metric = recv_metric + 1
-                existing_entry = self.table.get(dest)
-    
-                if not existing_entry:
-                    # Rota nova — adiciona
-                    self.table[dest] = (candidate_metric, neighbor_ip, now, 'learned')
-                    print(f"[ADD] Rota {dest} via {neighbor_ip} (métrica {candidate_metric})")
-                    changes["added"].append((dest, candidate_metric, neighbor_ip))
-                    continue
-                
-                cur_metric, cur_next, _, cur_origin = existing_entry
-    
-                if neighbor_ip == cur_next:
-                    # Atualiza rota existente com o mesmo next-hop
-                    if dest not in current_adv:
-                        # Vizinho deixou de anunciar esta rota
-                        print(f"[REMOVE] Rota {dest} perdida via {neighbor_ip}")
-                        del self.table[dest]
-                        changes["removed"].append(dest)
-                        continue
-                    
-                    # Atualiza métrica se melhorar
-                    if candidate_metric < cur_metric:
-                        print(f"[UPDATE] Métrica melhorada para {dest}: {cur_metric} → {candidate_metric}")
-                        self.table[dest] = (candidate_metric, neighbor_ip, now, cur_origin)
-                        changes["updated"].append((dest, candidate_metric, neighbor_ip))
-                    else:
-                        # Apenas renova timestamp
-                        self.table[dest] = (cur_metric, cur_next, now, cur_origin)
-                else:
-                    # Nova rota por outro vizinho — substitui se for melhor
-                    if candidate_metric < cur_metric:
-                        print(f"[UPDATE] Rota para {dest} substituída: via {cur_next} → {neighbor_ip}")
-                        self.table[dest] = (candidate_metric, neighbor_ip, now, 'learned')
-                        changes["updated"].append((dest, candidate_metric, neighbor_ip))
-    
-            # --- Verifica rotas que sumiram deste anúncio ---
-            # (rotas que o vizinho anunciava antes, mas não anuncia mais)
-            missing_routes = previous_adv - current_adv
-            for lost in missing_routes:
-                entry = self.table.get(lost)
-                if entry and entry[1] == neighbor_ip:
-                    print(f"[REMOVE] {lost} não mais anunciado por {neighbor_ip}")
-                    del self.table[lost]
-                    changes["removed"].append(lost)
+            # --- Processa cada rota recebida e as que sumiram deste anúncio ---
+            # (rotas que o vizinho anunciava antes, mas não anuncia mais;
+            #  anúncios incrementais só retiram rotas explicitamente)
+            self_key = ip_to_int(self.ip)
+            if self._holddown:
+                parsed = self._filter_holddown(neighbor_ip, parsed, now)
+            if self.shards is not None:
+                route_changes = self.shards.merge(neighbor_ip, parsed, withdrawn, self_key, now, infinity,
+                                                  self.max_paths)
+            else:
+                route_changes = merge_announcement(self.table, neighbor_ip, parsed, withdrawn, self_key, now,
+                                                   infinity=infinity, max_paths=self.max_paths)
+            self._record_changes(neighbor_ip, route_changes, now, changes)
+            self.table.publish_fib()
         # Se houve mudanças, imprime tabela e envia atualização
         if any(changes.values()):
             self.print_table(changes)
-            self.broadcast_routes(immediate=True)
+            self.trigger_update(changes)
+
+    def _reassemble(self, neighbor_ip: str, chunk: ChunkInfo, parsed: Dict[int, int]) -> Optional[Set[int]]:
+        """Acumula um fragmento da tabela completa do vizinho (chamar com self.lock).
+        Retorna todos os destinos da geração quando o último fragmento chega;
+        fragmentos de uma geração nova descartam a remontagem incompleta anterior."""
+        generation, seq, total = chunk
+        state = self._reassembly.get(neighbor_ip)
+        if state is None or state[0] != generation or state[1] != total:
+            state = (generation, total, set(), set())
+            self._reassembly[neighbor_ip] = state
+        _, _, seqs, dests = state
+        seqs.add(seq)
+        infinity = self.infinity
+        dests.update(dest for dest, metric in parsed.items() if metric < infinity)
+        if len(seqs) < total:
+            return None
+        del self._reassembly[neighbor_ip]
+        return dests
+
+    def _record_changes(self, neighbor_ip: str, route_changes: List[RouteChange], now: float, changes):
+        """Loga as mudanças feitas por merge_announcement, agenda o envelhecimento
+        das rotas novas/alteradas e as junta em changes (chamar com self.lock)."""
+        for kind, dest, metric, next_hop, origin, prev_metric, prev_next in route_changes:
+            if kind == "add":
+                log.info("route", "[ADD] Rota %s via %s (métrica %d)", format_dest(dest), next_hop, metric)
+                changes["added"].append((dest, metric, next_hop))
+            elif kind == "improve":
+                log.info("route", "[UPDATE] Métrica melhorada para %s: %d → %d", format_dest(dest), prev_metric, metric)
+                changes["updated"].append((dest, metric, next_hop))
+            elif kind == "worsen":
+                log.info("route", "[UPDATE] Métrica piorada para %s: %d → %d", format_dest(dest), prev_metric, metric)
+                changes["updated"].append((dest, metric, next_hop))
+                changes.setdefault("worsened", []).append(dest)
+                self._start_holddown(dest, prev_metric, prev_next, now)
+                self._forget_adv_cache()
+            elif kind == "replace":
+                log.info("route", "[UPDATE] Rota para %s substituída: via %s → %s", format_dest(dest), prev_next, next_hop)
+                changes["updated"].append((dest, metric, next_hop))
+            elif kind == "failover":
+                self._m_failover.inc()
+                log.info("route", "[FAILOVER] Rota para %s passou de %s para %s (mesma métrica %d)",
+                         format_dest(dest), prev_next, next_hop, metric)
+                changes["updated"].append((dest, metric, next_hop))
+            elif kind == "ecmp_add":
+                # não dispara anúncio: o Split Horizon para o novo alternate vale
+                # a partir do próximo anúncio periódico
+                log.info("route", "[ECMP] %s também via %s (métrica %d)", format_dest(dest), next_hop, metric)
+                continue
+            elif kind == "ecmp_drop":
+                log.info("route", "[ECMP] %s não passa mais por %s", format_dest(dest), next_hop)
+                self._forget_adv_cache()
+                continue
+            else:
+                if kind == "withdraw":
+                    log.info("route", "[REMOVE] Rota %s retirada por %s", format_dest(dest), neighbor_ip)
+                else:
+                    log.info("route", "[REMOVE] %s não mais anunciado por %s", format_dest(dest), neighbor_ip)
+                changes["removed"].append(dest)
+                self._start_holddown(dest, prev_metric, prev_next, now)
+                self._forget_adv_cache()
+                continue
+            self._track_route(dest, now)
+
+    def _forget_adv_cache(self):
+        """Uma rota foi perdida ou piorou (chamar com self.lock): destinos que
+        os vizinhos anunciam sem mudança podem voltar a valer, então o próximo
+        anúncio completo de cada vizinho é processado inteiro."""
+        self._adv_cache.clear()
+
+    def _start_holddown(self, dest: int, metric: int, next_hop: str, now: float):
+        """Coloca dest em hold-down por self.holddown segundos, lembrando a rota
+        perdida (chamar com self.lock). Uma nova perda durante o hold-down não o
+        estende nem troca a rota de referência."""
+        if self.holddown <= 0 or dest in self._holddown:
+            return
+        self._holddown[dest] = (now + self.holddown, metric, next_hop)
+        self._m_holddown.inc()
+        self.scheduler.schedule(("holddown", dest), now + self.holddown, partial(self._holddown_expired, dest))
 
+    def _filter_holddown(self, neighbor_ip: str, parsed: Dict[int, int], now: float) -> Dict[int, int]:
+        """Tira de parsed as rotas para destinos em hold-down que não sejam
+        melhores que a rota perdida nem venham do next_hop dela (chamar com self.lock)."""
+        holddown = self._holddown
+        infinity = self.infinity
+        ignored = [dest for dest, recv_metric in parsed.items()
+                   if dest in holddown and recv_metric < infinity
+                   and holddown[dest][0] > now and holddown[dest][2] != neighbor_ip
+                   and recv_metric + 1 >= holddown[dest][1]]
+        if not ignored:
+            return parsed
+        self._m_holddown_ignored.inc(len(ignored))
+        log.debug("route", "[HOLDDOWN] %d rota(s) de %s ignoradas (destinos em hold-down)", len(ignored), neighbor_ip)
+        parsed = dict(parsed)
+        for dest in ignored:
+            del parsed[dest]
+        return parsed
 
-    def handle_router_announcement(self, neighbor_ip: str, advertised_ip: str):
+    def _holddown_expired(self, dest: int):
+        with self.lock:
+            self._holddown.pop(dest, None)
+            # rotas ignoradas durante o hold-down já podem ser aceitas
+            self._forget_adv_cache()
+        log.debug("route", "[HOLDDOWN] Fim do hold-down de %s", format_dest(dest))
+
+    def handle_router_announcement(self, neighbor_ip: str, advertised_ip: str,
+                                   interval: Optional[float] = None, request: bool = False):
         """
         Processa uma mensagem '@<ip>' recebida de neighbor_ip,
         indicando que advertised_ip (um roteador) está ativo.
         Se advertised_ip ainda não estiver na tabela, adiciona-o com métrica 1.
+        interval é o intervalo entre tabelas completas do vizinho ('@<ip>*IVL=');
+        request pede a nossa tabela completa ('*REQ').
         """
 
-        now = now_ts()
+        try:
+            advertised_key = ip_to_int(advertised_ip)
+        except OSError:
+            log.warn("rx", "[WARN] Anúncio @ inválido de %s: %r", neighbor_ip, advertised_ip)
+            return
+
+        now = self.clock()
         changes = {"added": [], "updated": [], "removed": []}
 
         with self.lock:
-            print("[DEBUG] Entrando em handle_router_announcement lock")
+            log.debug("route", "[DEBUG] Entrando em handle_router_announcement lock")
 
             # Ignora anúncios do próprio roteador
             if advertised_ip == self.ip:
-                print("[DEBUG] Ignorando anúncio do próprio IP.")
+                log.debug("route", "[DEBUG] Ignorando anúncio do próprio IP.")
             else:
                 # Verifica se precisa inserir ou atualizar rota
-                current_entry = self.table.get(advertised_ip)
-                new_entry = (1, neighbor_ip, now, 'learned')
+                current = self.table.get(advertised_key)
 
-                if current_entry is None:
+                if current is None:
                     # Nova rota descoberta
-                    self.table[advertised_ip] = new_entry
+                    self.table.set(advertised_key, 1, neighbor_ip, now, 'learned')
+                    self._track_route(advertised_key, now)
                     self.neighbors.add(advertised_ip)
-                    changes["added"].append((advertised_ip, 1, neighbor_ip))
-                    print(f"[INFO] Novo vizinho aprendido: {advertised_ip} via {neighbor_ip}")
+                    changes["added"].append((advertised_key, 1, neighbor_ip))
+                    log.info("route", "[INFO] Novo vizinho aprendido: %s via %s", advertised_ip, neighbor_ip)
 
-                elif current_entry[0] != 1 or current_entry[1] != neighbor_ip:
+                elif current.metric != 1 or current.next_hop != neighbor_ip:
                     # Atualização de rota existente
-                    self.table[advertised_ip] = new_entry
-                    changes["updated"].append((advertised_ip, 1, neighbor_ip))
-                    print(f"[INFO] Rota atualizada: {advertised_ip} via {neighbor_ip}")
+                    self.table.set(advertised_key, 1, neighbor_ip, now, 'learned')
+                    self._track_route(advertised_key, now)
+                    changes["updated"].append((advertised_key, 1, neighbor_ip))
+                    log.info("route", "[INFO] Rota atualizada: %s via %s", advertised_ip, neighbor_ip)
+
+                else:
+                    current.ts = now
 
             # Atualiza o timestamp do último contato com o vizinho
-            self.neigh_last_heard[neighbor_ip] = now
+            self._refresh_neighbor(neighbor_ip, now)
+            if interval is not None and advertised_ip == neighbor_ip:
+                self.neigh_interval[neighbor_ip] = interval
+            self.table.publish_fib()
 
-        print("[DEBUG] Saindo do lock")
+        log.debug("route", "[DEBUG] Saindo do lock")
 
         # Caso tenha havido alterações, imprime tabela e propaga atualização
         if any(changes.values()):
-            print("[DEBUG] Mudanças detectadas na tabela de rotas.")
+            log.debug("route", "[DEBUG] Mudanças detectadas na tabela de rotas.")
             self.print_table(changes)
-            self.broadcast_routes(immediate=True)
+            self.trigger_update(changes)
         else:
-            print("[DEBUG] Nenhuma mudança detectada.")
+            log.debug("route", "[DEBUG] Nenhuma mudança detectada.")
+        if request and advertised_ip == neighbor_ip:
+            self._damped("table", partial(self.broadcast_routes, immediate=True))
 
-        print("[DEBUG] Fim de handle_router_announcement\n")
+        log.debug("route", "[DEBUG] Fim de handle_router_announcement\n")
 
 
 
-    def handle_text_message(self, raw_msg: str, from_ip: str):
+    def handle_text_message(self, raw_msg: Union[str, Datagram], from_ip: str):
         """
         Mensagem do tipo: !orig;dest;texto
         If dest==self.ip => print and indicate arrived
         else => forward according to routing table (next_hop)
+        Só o cabeçalho 'orig;dest' é decodificado; o texto só é decodificado se a
+        mensagem for para este roteador, e o repasse reenvia o próprio buffer.
         """
-        try:
-            if not raw_msg.startswith("!"):
-                return
-            body = raw_msg[1:]
-            origin, dest, message = body.split(";", 2)
-        except Exception:
-            print(f"[WARN] Mensagem de texto mal formada de {from_ip}: {raw_msg}")
+        data = memoryview(raw_msg.encode('utf-8')) if isinstance(raw_msg, str) else memoryview(raw_msg)
+        header = bytes(data[:_TEXT_HEADER_MAX])
+        first = header.find(b";")
+        second = header.find(b";", first + 1) if first >= 0 else -1
+        if not header.startswith(b"!") or second < 0:
+            log.warn("rx", "[WARN] Mensagem de texto mal formada de %s: %s", from_ip, describe_datagram(data))
             return
+        origin = header[1:first].decode('utf-8', errors='replace')
+        dest = header[first + 1:second].decode('utf-8', errors='replace')
 
         if dest == self.ip:
-            print(f"[MSG] Recebida mensagem para mim. Origem={origin} | Mensagem='{message}'")
+            # fragmentos e acks de transferência ('~D' / '~A', ver transfer.py)
+            # e sondas ('~E', '~R', '~P', '~X', ver probe.py)
+            if data[second + 1:second + 2] == b"~" and (self.transfers.handle(origin, data[second + 1:])
+                                                         or self.probes.handle(origin, data[second + 1:])):
+                return
+            message = str(data[second + 1:], 'utf-8', errors='replace')
+            log.info("rx", "[MSG] Recebida mensagem para mim. Origem=%s | Mensagem='%s'", origin, message)
             return
 
-        # procurar rota
-        with self.lock:
-            entry = self.table.get(dest)
-            if not entry:
-                print(f"[ROUTE] Sem rota para {dest}. Mensagem descartada. Origem={origin}")
+        # procurar rota (prefixo mais longo; com ECMP, um caminho por fluxo)
+        next_hop = self.next_hop_for(dest, origin)
+        if next_hop is None:
+            log.info("route", "[ROUTE] Sem rota para %s. Mensagem descartada. Origem=%s", dest, origin)
+            return
+        if next_hop == self.ip:
+            # destino numa rede conectada a este roteador
+            message = str(data[second + 1:], 'utf-8', errors='replace')
+            log.info("rx", "[MSG] Mensagem para %s entregue na rede local. Origem=%s | Mensagem='%s'",
+                     dest, origin, message)
+            return
+
+        now = self.clock()
+        if not self._limit_in.allow(from_ip, now):
+            self._m_rate_limited["neighbor"].inc()
+            log.debug("route", "[QOS] Mensagem de %s para %s descartada: limite de taxa do vizinho %s",
+                      origin, dest, from_ip)
+            return
+        if not self._limit_origin.allow(origin, now):
+            self._m_rate_limited["origin"].inc()
+            log.debug("route", "[QOS] Mensagem de %s para %s descartada: limite de taxa da origem", origin, dest)
+            return
+
+        if data[second + 1:second + 3] == PROBE_TAG:
+            # sonda do traceroute: decrementa o TTL ou responde que ele esgotou
+            data = self.probes.forward(origin, data, second + 1)
+            if data is None:
                 return
-            next_hop = entry[1]
 
-        # repassar
-        print(f"[ROUTE] Encaminhando {message} para {dest} via {next_hop} (origem {origin})")
-        self.send_to(next_hop, raw_msg)
+        # repassar (mesmos bytes recebidos, sem decode/encode)
+        log.debug("route", "[ROUTE] Encaminhando %d bytes para %s via %s (origem %s)",
+                  len(data) - second - 1, dest, next_hop, origin)
+        self.send_to(next_hop, data)
+
+    def next_hop_for(self, dest_ip: str, origin_ip: Optional[str] = None) -> Optional[str]:
+        """Next hop para dest_ip segundo a FIB publicada: rota do prefixo mais
+        longo que contém o endereço (None se não houver; self.ip se for uma rede
+        conectada). Se a rota tiver vários caminhos de mesmo custo, escolhe um por
+        hash de (origin_ip, dest_ip): as mensagens de um mesmo fluxo seguem o
+        mesmo caminho (e a mesma ordem) enquanto ele existir.
+        Não usa o lock: encaminhar nunca espera o processamento de anúncios."""
+        try:
+            dest = ip_to_int(dest_ip)
+        except OSError:
+            return None
+        entry = self.table.fib.get(dest)
+        if entry.__class__ is tuple:
+            # crc32 e não hash(): o mesmo fluxo escolhe o mesmo caminho em qualquer processo
+            entry = entry[zlib.crc32(f"{origin_ip or self.ip};{dest_ip}".encode()) % len(entry)]
+        return entry
 
     # ------------------------
     # Thread: listener
     # ------------------------
     def listener_loop(self):
-        print(f"[LISTENER] Escutando em {self.ip}:{PORT} ...")
+        log.info("system", "[LISTENER] Escutando em %s:%s ...", self.ip, PORT)
+        # um buffer só, do tamanho do maior datagrama (recvfrom_into, sem um bytes de 64 KiB por recepção)
+        buf = bytearray(RECV_BUFFER_SIZE)
+        view = memoryview(buf)
         while not self._stop_event.is_set():
             
-            if self.sock is None:
+            if self.transport.closed:
                 # recria o socket
                 # print("recriando o socket")
-                self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-                self.sock.bind((self.ip, PORT))
-                self.sock.settimeout(1.0)
+                try:
+                    self.transport.open()
+                except OSError:
+                    time.sleep(1)
+                    continue
 
             try:
-                data, addr = self.sock.recvfrom(4096)
+                nbytes, src_ip = self.transport.recv_into(buf)
                 # print(f"[debug] (data, addr) : ({data}, {addr})")
             except socket.timeout:
                 # print(f"[SYSTEM] SOCKET TIMEOUT")
                 continue
             except OSError as e:
                 # print(f"[ERROR] SOCKET ERROR :  {e}")
-                try:
-                    self.sock.close()
-                except Exception:
-                    pass
-                self.sock = None
+                self.transport.close()
                 time.sleep(1)
                 continue
 
-            msg = data.decode('utf-8', errors='replace') if data else ""
-            src_ip = addr[0]
-            # decidir tipo
-            if msg.startswith("@"):
-                advertised_ip = msg[1:].strip()
-                print(f"[RECV] Anúncio @ de {src_ip}: {advertised_ip}")
-                self.handle_router_announcement(src_ip, advertised_ip)
-            elif msg.startswith("!"):
-                # mensagem de texto roteadar
-                print(f"[RECV] Mensagem de texto de {src_ip}: {msg}")
-                self.handle_text_message(msg, src_ip)
-            else:
-                # rota announcement (pode ser vazia string)
-                print(f"[RECV] Anúncio de rotas de {src_ip}: '{msg[:80]}'")
-                self.handle_route_announcement(src_ip, msg)
-        print(f"[SYSTEM] Não Tô escutando mais!")
+            # a fila guarda uma cópia só dos bytes recebidos e buf é reusado no próximo
+            # datagrama. Passar buf adiante exigiria um buffer de 64 KiB por posição das
+            # filas (até ~320 MiB); a cópia de um anúncio de 1400 bytes custa ~0,4 µs,
+            # pouco perto do processamento dele no worker
+            self.enqueue(bytes(view[:nbytes]), src_ip)
+        log.info("system", "[SYSTEM] Não Tô escutando mais!")
+
+    def enqueue(self, data: bytes, src_ip: str):
+        """Põe um datagrama recebido na fila da sua classe (controle ou dados)."""
+        if self.rx_queues.put(data, src_ip) is None:
+            self._m_queue_dropped[traffic_class(data)].inc()
+
+    def worker_loop(self):
+        """Processa os datagramas das filas, sempre os de controle primeiro."""
+        while not self._stop_event.is_set():
+            item = self.rx_queues.get(0.5)
+            if item is not None:
+                self.dispatch(*item)
+
+    def dispatch(self, data: Datagram, src_ip: str):
+        """Decide o tipo do datagrama recebido pelo primeiro byte e chama o
+        handler correspondente, que decodifica só o que precisa.
+        Compartilhado entre o motor de threads e o motor asyncio. data pode
+        ser um memoryview de um buffer reusado (ex. a rede virtual): handlers
+        que guardam dados devem copiá-los (ints, str decodificada, bytes(...))."""
+        data = memoryview(data)
+        first = data[0] if data else None
+        self._count(self._m_rx, data)
+        if self.capture is not None:
+            self.capture.record(RX, self.clock(), src_ip, self.ip, data)
+        # decidir tipo
+        if first == BINARY_MAGIC:
+            log.debug("rx", "[RECV] Anúncio binário de rotas de %s: %d bytes", src_ip, len(data))
+            self.handle_route_announcement(src_ip, data)
+        elif first == _HELLO:
+            advertised_ip, interval, request = parse_hello(str(data[1:], 'utf-8', errors='replace').strip())
+            log.debug("rx", "[RECV] Anúncio @ de %s: %s", src_ip, advertised_ip)
+            self.handle_router_announcement(src_ip, advertised_ip, interval, request)
+        elif first == _TEXT:
+            # mensagem de texto roteadar
+            log.debug("rx", "[RECV] Mensagem de texto de %s: %d bytes", src_ip, len(data))
+            self.handle_text_message(data, src_ip)
+        else:
+            msg = str(data, 'utf-8', errors='replace')
+            # rota announcement (pode ser vazia string)
+            log.debug("rx", "[RECV] Anúncio de rotas de %s: '%s'", src_ip, msg[:80])
+            self.handle_route_announcement(src_ip, msg)
     # ------------------------
-    # Thread: periodic announcer
+    # Prazos (executados pelo escalonador)
     # ------------------------
-    def announcer_loop(self):
-        next_send = time.time() + ROUTE_ANNOUNCE_INTERVAL
-        while not self._stop_event.is_set():
-            now = time.time()
-            if now >= next_send:
-                print(f"[ANNOUNCER] Enviando anúncio de rotas.")
-                self.broadcast_routes()
-                next_send = now + ROUTE_ANNOUNCE_INTERVAL
-            time.sleep(0.2)
+    def schedule_timers(self):
+        """Agenda as tarefas periódicas (anúncio da tabela, impressão, snapshot)
+        e os prazos do que já veio do snapshot (vizinhos e rotas provisórias)."""
+        now = self.clock()
+        with self.lock:
+            self._announce_deadline = now + self._jittered(self.announce_interval)
+            self.scheduler.schedule("announce", self._announce_deadline,
+                                    partial(self._announce_tick, self._announce_deadline))
+        self._schedule_hello()
+        self.scheduler.schedule("print_table", now + TABLE_PRINT_INTERVAL,
+                                partial(self._print_tick, now + TABLE_PRINT_INTERVAL))
+        if self.snapshot_path:
+            self.scheduler.schedule("snapshot", now + SNAPSHOT_INTERVAL,
+                                    partial(self._snapshot_tick, now + SNAPSHOT_INTERVAL))
+        with self.lock:
+            for n, last in self.neigh_last_heard.items():
+                if last:
+                    self.scheduler.schedule(("neighbor", n), last + NEIGHBOR_TIMEOUT,
+                                            partial(self._neighbor_expired, n))
+            for dest, route in self.table.items():
+                if route.origin == 'learned':
+                    self.scheduler.schedule(("route", dest), route.ts + ROUTE_TIMEOUT,
+                                            partial(self._route_expired, dest))
+
+    def _announce_tick(self, deadline: float):
+        log.debug("tx", "[ANNOUNCER] Enviando anúncio de rotas.")
+        self.broadcast_routes()
+        with self.lock:
+            version = self.table.version
+            # só espaça se todos os vizinhos ativos recebem o intervalo no hello
+            # (hello_peers) e mandaram o deles: os outros expirariam as rotas em ROUTE_TIMEOUT
+            capable = all(n in self.hello_peers and n in self.neigh_interval
+                          for n, last in self.neigh_last_heard.items() if last)
+            if not capable:
+                self.announce_interval = ROUTE_ANNOUNCE_INTERVAL
+            elif version == self._announced_version:
+                self.announce_interval = min(2 * self.announce_interval, self.announce_max)
+            self._announced_version = version
+            interval = self.announce_interval
+            changed = interval != self._advertised_interval
+            # próximo prazo relativo ao anterior: sem deriva
+            nxt = self._announce_deadline = deadline + self._jittered(interval)
+            self.scheduler.schedule("announce", nxt, partial(self._announce_tick, nxt))
+        if changed:
+            # o novo intervalo vai para os vizinhos antes do próximo anúncio
+            self.send_hello()
+
+    def _jittered(self, interval: float) -> float:
+        return interval * random.uniform(1.0 - ANNOUNCE_JITTER, 1.0 + ANNOUNCE_JITTER)
+
+    def _schedule_hello(self):
+        """Reagenda o hello: sai só se nada for enviado aos vizinhos antes
+        (com o sorteio, no máximo HELLO_INTERVAL * (1 + ANNOUNCE_JITTER), ainda
+        abaixo de NEIGHBOR_TIMEOUT)."""
+        self.scheduler.schedule("hello", self.clock() + self._jittered(HELLO_INTERVAL), self.send_hello)
+
+    def _print_tick(self, deadline: float):
+        self.print_table()
+        nxt = deadline + TABLE_PRINT_INTERVAL
+        self.scheduler.schedule("print_table", nxt, partial(self._print_tick, nxt))
+
+    def _snapshot_tick(self, deadline: float):
+        self.save_snapshot()
+        nxt = deadline + SNAPSHOT_INTERVAL
+        self.scheduler.schedule("snapshot", nxt, partial(self._snapshot_tick, nxt))
 
     # ------------------------
-    # Thread: neighbor monitor (detect failures)
+    # Warm start (snapshot da tabela em disco, ver snapshot.py)
     # ------------------------
-    def monitor_loop(self):
-        while not self._stop_event.is_set():
-            now = now_ts()
-            removed_neighbors = []
+    def save_snapshot(self, force: bool = False) -> bool:
+        """Grava as rotas aprendidas e o estado dos vizinhos em snapshot_path,
+        se mudaram desde a última gravação (ou se force). Retorna True se gravou."""
+        if not self.snapshot_path:
+            return False
+        with self.lock:
+            neighbors = tuple((n, (NEIGHBOR_ACTIVE if self.neigh_last_heard.get(n) else 0)
+                               | (NEIGHBOR_BINARY if n in self.binary_peers else 0)
+                               | (NEIGHBOR_HELLO if n in self.hello_peers else 0))
+                              for n in sorted(self.neighbors))
+            state = (self.table.version, neighbors)
+            if not force and state == self._snapshot_state:
+                return False
+            routes = [(dest, r.metric, r.next_hop) for dest, r in self.table.items() if r.origin == 'learned']
+        # a gravação (fsync) fica fora do lock
+        try:
+            size = write_snapshot(self.snapshot_path, self.ip, dict(neighbors), routes, time.time())
+        except OSError as e:
+            log.warn("system", "[WARN] Não foi possível gravar o snapshot %s: %s", self.snapshot_path, e)
+            return False
+        self._snapshot_state = state
+        self._m_snapshot_writes.inc()
+        log.debug("system", "[SNAPSHOT] %d rota(s) gravadas em %s (%d bytes)", len(routes), self.snapshot_path, size)
+        return True
 
-            with self.lock:
-                for n in list(self.neighbors):
-                    # print(f"[MONITOR] checando se {n} está ativo")
-                    last = self.neigh_last_heard.get(n, 0.0)
-                    # print(f"checando para {n}")
-                    # print(f"{last} != 0.0 and ({now} - {last}) > {NEIGHBOR_TIMEOUT}")
-                    if last != 0.0 and (now - last) > NEIGHBOR_TIMEOUT:
-                        # neighbor considered inactive
-                        removed_neighbors.append(n)
-
-            # para vizinhos inativos: remover rotas que são via eles e marcar last_heard=0
-            for n in removed_neighbors:
-                print(f"[MONITOR] Vizinho {n} considerado INATIVO (sem anúncios há {NEIGHBOR_TIMEOUT}s).")
-                # remover rotas cujo next_hop == n
-                to_del = [dest for dest, (metric, next_hop, _, origin) in self.table.items() if next_hop == n]
-
-                for dest in to_del:
-                    # removendo apenas os learned
-                    if self.table[dest][3] == "learned":
-                        self.neighbors.remove(n)
-                        # print(f"{self.neighbors}  ")
-                    del self.table[dest]
-
-                # limpar o registro do vizinho
-                self.neigh_last_heard[n] = 0.0
-                self.neigh_adv[n] = set()
-                # not removing n from self.neighbors, porque arquivo roteadores.txt define os vizinhos possíveis.
-                if to_del:
-                    # print("teste de exclusão")
-                    self.print_table({"added": [], "updated": [], "removed": to_del})
-                    # notificar vizinhos imediatamente
-                    # print("notificando que um saiu")
-                    self.broadcast_routes(immediate=True)
-                    # print("notifiquei que um saiu")
-                 
-            time.sleep(1.0)
+    def _load_snapshot(self):
+        """Carrega o snapshot de snapshot_path (chamado no __init__, antes da
+        partida). As rotas aprendidas entram como provisórias: o ts delas faz
+        com que expirem em WARM_START_TTL se nenhum anúncio as confirmar, e
+        contam como anunciadas pelo next_hop, então o primeiro anúncio completo
+        dele retira as que não vierem. Vizinhos ativos no snapshot contam como
+        ouvidos agora (caem em NEIGHBOR_TIMEOUT se não responderem)."""
+        try:
+            snap = read_snapshot(self.snapshot_path)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            log.warn("system", "[WARN] Snapshot %s ignorado: %s", self.snapshot_path, e)
+            return
+        age = time.time() - snap.saved_at
+        if snap.router_ip != self.ip:
+            log.warn("system", "[WARN] Snapshot %s é do roteador %s, ignorado", self.snapshot_path, snap.router_ip)
+            return
+        if not 0 <= age <= WARM_START_MAX_AGE:
+            log.info("system", "[SNAPSHOT] Snapshot %s ignorado: gravado há %.0fs", self.snapshot_path, age)
+            return
+        now = self.clock()
+        ts = now - ROUTE_TIMEOUT + WARM_START_TTL
+        self_key = ip_to_int(self.ip)
+        loaded = 0
+        with self.lock:
+            for n, flags in snap.neighbors.items():
+                if n not in self.neighbors:
+                    continue
+                if flags & NEIGHBOR_ACTIVE:
+                    self.neigh_last_heard[n] = now
+                if flags & NEIGHBOR_BINARY and self.binary_wire:
+                    self.binary_peers.add(n)
+                if flags & NEIGHBOR_HELLO:
+                    self.hello_peers.add(n)
+            for dest, metric, next_hop in snap.routes:
+                if (dest == self_key or dest in self.table or metric >= self.infinity
+                        or not self.neigh_last_heard.get(next_hop)):
+                    continue
+                self.table.set(dest, metric, next_hop, ts, 'learned')
+                self.neigh_adv.setdefault(next_hop, set()).add(dest)
+                loaded += 1
+            self.table.publish_fib()
+        self._m_warm_routes.inc(loaded)
+        log.info("system", "[SNAPSHOT] Warm start: %d rota(s) provisória(s) de %s (gravado há %.1fs)",
+                 loaded, self.snapshot_path, age)
+
+    def _refresh_neighbor(self, neighbor_ip: str, now: float):
+        """Registra contato com o vizinho e reagenda o prazo de expiração dele
+        (chamar com self.lock). A rota direta até o vizinho também é renovada."""
+        if not self.neigh_last_heard.get(neighbor_ip):
+            self._m_neighbor_up.inc()
+        self.neigh_last_heard[neighbor_ip] = now
+        route = self.table.get(ip_to_int(neighbor_ip))
+        if route is not None and route.next_hop == neighbor_ip:
+            route.ts = now
+        self.scheduler.schedule(("neighbor", neighbor_ip), now + NEIGHBOR_TIMEOUT,
+                                partial(self._neighbor_expired, neighbor_ip))
+
+    def _track_route(self, dest: int, now: float):
+        """Agenda o envelhecimento de uma rota aprendida (chamar com self.lock).
+        Renovações só mudam route.ts; o prazo é conferido quando vence."""
+        self.scheduler.schedule(("route", dest), now + ROUTE_TIMEOUT, partial(self._route_expired, dest))
+
+    def _neighbor_expired(self, n: str):
+        """
+        Vizinho sem anúncios há NEIGHBOR_TIMEOUT: remove as rotas via ele.
+        """
+        now = self.clock()
+        with self.lock:
+            last = self.neigh_last_heard.get(n, 0.0)
+            if last == 0.0:
+                return
+            deadline = last + NEIGHBOR_TIMEOUT
+            if deadline > now:
+                # renovado depois do agendamento (compara o prazo em si: com
+                # ponto flutuante, now - last < NEIGHBOR_TIMEOUT pode valer com
+                # o prazo já vencido e reagendar para o mesmo instante sem fim)
+                self.scheduler.schedule(("neighbor", n), deadline, partial(self._neighbor_expired, n))
+                return
+
+            self._m_neighbor_down.inc()
+            # remover rotas cujo next_hop == n (índice reverso, sem varrer a tabela);
+            # as que têm caminho de mesmo custo por outro vizinho passam para ele
+            changes = {"added": [], "updated": [], "removed": []}
+            for dest in self.table.via(n):
+                route = self.table.get(dest)
+                origin, metric = route.origin, route.metric
+                change = drop_next_hop(self.table, dest, n, now, "lost", self.infinity)
+                if change[0] == "failover":
+                    self._m_failover.inc()
+                    changes["updated"].append((dest, change[2], change[3]))
+                    self._track_route(dest, now)
+                    continue
+                changes["removed"].append(dest)
+                self._start_holddown(dest, metric, n, now)
+                # removendo apenas os learned
+                if origin == "learned":
+                    self.neighbors.discard(n)
+                    # print(f"{self.neighbors}  ")
+            for dest in self.table.alt_via(n):
+                drop_next_hop(self.table, dest, n, now, "lost", self.infinity)
+
+            self.table.publish_fib()
+
+            # limpar o registro do vizinho
+            self.neigh_last_heard[n] = 0.0
+            self.neigh_adv[n] = set()
+            self.neigh_interval.pop(n, None)
+            self.neigh_fresh.pop(n, None)
+            self._forget_adv_cache()
+            self._reassembly.pop(n, None)
+            # pode voltar como outra versão: renegocia o formato e os hellos
+            self.binary_peers.discard(n)
+            self.hello_peers.discard(n)
+            # not removing n from self.neighbors, porque arquivo roteadores.txt define os vizinhos possíveis.
+
+        log.info("route", "[MONITOR] Vizinho %s considerado INATIVO (sem anúncios há %ss).", n, NEIGHBOR_TIMEOUT)
+        if any(changes.values()):
+            # print("teste de exclusão")
+            self.print_table(changes)
+            # notificar vizinhos imediatamente
+            # print("notificando que um saiu")
+            self.trigger_update(changes)
+            # print("notifiquei que um saiu")
+
+    def _route_timeout(self, next_hop: str) -> float:
+        """ROUTE_TIMEOUT na escala do intervalo entre tabelas do next_hop (chamar com self.lock)."""
+        interval = self.neigh_interval.get(next_hop, ROUTE_ANNOUNCE_INTERVAL)
+        return ROUTE_TIMEOUT * max(interval, ROUTE_ANNOUNCE_INTERVAL) / ROUTE_ANNOUNCE_INTERVAL
+
+    def _route_expired(self, dest: int):
+        """Rota aprendida que não foi renovada no prazo (ROUTE_TIMEOUT, na
+        escala do intervalo de anúncios do next_hop) é removida. Vale a mais
+        recente entre route.ts e a última tabela completa do next_hop, se ela
+        ainda anuncia o destino (neigh_fresh)."""
+        now = self.clock()
+        with self.lock:
+            route = self.table.get(dest)
+            if route is None or route.origin != 'learned':
+                return
+            timeout = self._route_timeout(route.next_hop)
+            ts = route.ts
+            if dest in self.neigh_adv.get(route.next_hop, ()):
+                ts = max(ts, self.neigh_fresh.get(route.next_hop, 0.0))
+            deadline = ts + timeout
+            if deadline > now:
+                # renovada nesse meio tempo: confere de novo no novo prazo
+                self.scheduler.schedule(("route", dest), deadline, partial(self._route_expired, dest))
+                return
+            self.table.remove(dest)
+            self._start_holddown(dest, route.metric, route.next_hop, now)
+            self._forget_adv_cache()
+            self.table.publish_fib()
+        log.info("route", "[MONITOR] Rota %s expirou (sem renovação há %gs).", format_dest(dest), timeout)
+        changes = {"added": [], "updated": [], "removed": [dest]}
+        self.print_table(changes)
+        self.trigger_update(changes)
+
+    def _note_change(self):
+        """Marca uma mudança na tabela para a métrica de convergência: a rajada
+        termina quando a tabela passa CONVERGENCE_QUIET_PERIOD sem mudar."""
+        now = self.clock()
+        with self.lock:
+            if self._burst_start is None:
+                self._burst_start = now
+            self._burst_last = now
+            if self.announce_interval > ROUTE_ANNOUNCE_INTERVAL:
+                # a tabela mudou: volta ao intervalo base (e antecipa o próximo anúncio)
+                self.announce_interval = ROUTE_ANNOUNCE_INTERVAL
+                nxt = now + self._jittered(ROUTE_ANNOUNCE_INTERVAL)
+                if nxt < self._announce_deadline:
+                    self._announce_deadline = nxt
+                    self.scheduler.schedule("announce", nxt, partial(self._announce_tick, nxt))
+        self.scheduler.schedule("converged", now + CONVERGENCE_QUIET_PERIOD, self._converged)
+
+    def _converged(self):
+        with self.lock:
+            start, last = self._burst_start, self._burst_last
+            self._burst_start = None
+        if start is not None:
+            self._m_convergence.observe(last - start)
+            log.debug("route", "[MONITOR] Tabela estável (rajada de %.3fs)", last - start)
 
     # ------------------------
     # Util: exibir tabela e diffs
     # ------------------------
-    def print_table(self, changes=None):
-        # print("posso entrar no self lock pelo print table?")
+    def stats_text(self) -> str:
         with self.lock:
-            # print("ENTREI no self lock pelo print table?")
-            tabelosa = self.table.items()
-            IP_print = self.ip
-        lines = []
-        lines.append("=== TABELA DE ROTEAMENTO ===")
-        lines.append(f"Roteador: {IP_print}")
+            version = self.table.version
+            routes = len(self.table)
+        hits = self._m_cache_hits.value
+        misses = self._m_cache_misses.value
+        total = hits + misses
+        ratio = (100.0 * hits / total) if total else 0.0
+        return (f"[STATS] Versão da tabela: {version} | Rotas: {routes}\n"
+                f"[STATS] Cache de anúncios: {hits} acertos, {misses} falhas ({ratio:.1f}% de acerto)\n"
+                f"[STATS] Log: {log.dropped} registro(s) descartado(s)")
+
+    def print_stats(self):
+        safe_print(self.stats_text())
+
+    def table_text(self, changes=None) -> str:
+        # snapshot() pega o lock sozinho e é reaproveitado enquanto a tabela não mudar
         # Exibição simplificada conforme enunciado (sem coluna de idade)
-        lines.append(f"{'Destino':<16} {'Métrica':<7} {'Saída':<16} {'Origem':<8}")
-        for dest, (metric, next_hop, ts, origin) in sorted(tabelosa):
-            lines.append(f"{dest:<16} {metric:<7} {next_hop:<16} {origin:<8}")
-        lines.append("===========================")
-        # print
-        print("\n".join(lines))
+        lines = [format_table(self.table.snapshot(), self.ip)]
         # se houver mudanças, destacar
         if changes:
             added = changes.get("added", [])
             updated = changes.get("updated", [])
             removed = changes.get("removed", [])
             if added:
-                print("[CHANGE] Adicionadas:")
+                lines.append("[CHANGE] Adicionadas:")
                 for d, m, nh in added:
-                    print(f"  + {d} via {nh} (metric={m})")
+                    lines.append(f"  + {format_dest(d)} via {nh} (metric={m})")
             if updated:
-                print("[CHANGE] Atualizadas:")
+                lines.append("[CHANGE] Atualizadas:")
                 for d, m, nh in updated:
-                    print(f"  ~ {d} via {nh} (metric={m})")
+                    lines.append(f"  ~ {format_dest(d)} via {nh} (metric={m})")
             if removed:
                 for r in removed:
-                    print(f"  - {r}")
+                    lines.append(f"  - {format_dest(r)}")
+        with self.lock:
+            multipath = sorted((dest, (r.next_hop,) + r.alternates) for dest, r in self.table.items() if r.alternates)
+        for dest, hops in multipath:
+            lines.append(f"[ECMP] {format_dest(dest)} via {', '.join(hops)}")
+        return "\n".join(lines)
+
+    def print_table(self, changes=None):
+        # formatar a tabela inteira é caro: só se a categoria estiver ativa
+        if log.enabled("route", INFO):
+            log.info("route", "%s", self.table_text(changes))
 
     # ------------------------
     # Start / Stop
@@ -393,12 +1286,15 @@ class Router:
     def start(self):
         self._stop_event.clear()
         self.threads = []
+        self.scheduler.reset()
+        self.rx_queues.reopen()
+        self.schedule_timers()
         t_listener = threading.Thread(target=self.listener_loop, daemon=True)
-        t_announcer = threading.Thread(target=self.announcer_loop, daemon=True)
-        t_monitor = threading.Thread(target=self.monitor_loop, daemon=True)
-        # thread adicional para impressão periódica da tabela
-        t_table_printer = threading.Thread(target=self.table_printer_loop, daemon=True)
-        self.threads.extend([t_listener, t_announcer, t_monitor, t_table_printer])
+        # o listener só lê o socket e enfileira; o worker processa por prioridade
+        t_worker = threading.Thread(target=self.worker_loop, daemon=True)
+        # uma única thread cuida de todos os prazos (anúncios, vizinhos, rotas, impressão)
+        t_scheduler = threading.Thread(target=self.scheduler.run, daemon=True)
+        self.threads.extend([t_listener, t_worker, t_scheduler])
         for t in self.threads:
             t.start()
 
@@ -409,22 +1305,14 @@ class Router:
 
     def stop(self, timeout=2.0):
         self._stop_event.set()
+        self.scheduler.stop()
+        self.rx_queues.close()
+        self.save_snapshot(force=True)
         # close socket to wake recvfrom
-        try:
-            self.sock.close()
-        except Exception:
-            pass
+        self.transport.close()
+        if self.capture is not None:
+            self.capture.close()
+        if self.shards is not None:
+            self.shards.close()
         for t in self.threads:
             t.join(timeout=0.5)
-
-    # ------------------------
-    # Thread: impressão periódica da tabela
-    # ------------------------
-    def table_printer_loop(self, interval: float = TABLE_PRINT_INTERVAL):
-        next_print = time.time() + interval
-        while not self._stop_event.is_set():
-            now = time.time()
-            if now >= next_print:
-                self.print_table()
-                next_print = now + interval
-            time.sleep(0.5)
@@ -0,0 +1,257 @@
+# roteador_async.py
+"""Motor asyncio do roteador.
+
+Recepção, anúncios periódicos, timeout de vizinhos, envelhecimento de rotas e
+impressão periódica da tabela rodam em um único event loop (em uma thread
+própria, para que a CLI de main.py continue bloqueando em input()). O protocolo
+de rede e os handlers são os mesmos do Router baseado em threads.
+"""
+import asyncio
+import threading
+from typing import Callable, Dict, Hashable, List, Optional, Set, Tuple, Union
+from constants import PORT, RX_DRAIN_BATCH, RECV_BUFFER_SIZE, DATA_QUEUE_SIZE
+from roteador import Router, Datagram
+from qos import CONTROL, DATA
+from capture import TX
+from utils import now_ts, describe_datagram
+from logging_utils import log, DEBUG
+
+
+class AsyncScheduler:
+    """Mesma interface do scheduler.Scheduler, mas cada prazo vira um
+    loop.call_later do asyncio. Prazos agendados antes do loop existir ficam
+    guardados até attach()."""
+
+    def __init__(self, clock: Callable[[], float] = now_ts):
+        self.clock = clock
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread_id: Optional[int] = None
+        self._handles: Dict[Hashable, asyncio.TimerHandle] = {}
+        self._early: List[Tuple[Hashable, float, Callable[[], None]]] = []
+
+    def __len__(self) -> int:
+        return len(self._handles) + len(self._early)
+
+    def attach(self, loop: asyncio.AbstractEventLoop):
+        """Chamar de dentro do loop."""
+        self.loop = loop
+        self._thread_id = threading.get_ident()
+        early, self._early = self._early, []
+        for key, when, callback in early:
+            self.schedule(key, when, callback)
+
+    def schedule(self, key: Hashable, when: float, callback: Callable[[], None]):
+        loop = self.loop
+        if loop is None:
+            self._early.append((key, when, callback))
+            return
+        if threading.get_ident() != self._thread_id:
+            try:
+                loop.call_soon_threadsafe(self.schedule, key, when, callback)
+            except RuntimeError:
+                pass
+            return
+        old = self._handles.pop(key, None)
+        if old is not None:
+            old.cancel()
+        delay = max(0.0, when - self.clock())
+        self._handles[key] = loop.call_later(delay, self._fire, key, callback)
+
+    def call_later(self, delay: float, callback: Callable[[], None], key: Optional[Hashable] = None):
+        if key is None:
+            key = object()
+        self.schedule(key, self.clock() + delay, callback)
+
+    def cancel(self, key: Hashable):
+        loop = self.loop
+        if loop is not None and threading.get_ident() != self._thread_id:
+            loop.call_soon_threadsafe(self.cancel, key)
+            return
+        handle = self._handles.pop(key, None)
+        if handle is not None:
+            handle.cancel()
+
+    def _fire(self, key: Hashable, callback: Callable[[], None]):
+        self._handles.pop(key, None)
+        try:
+            callback()
+        except Exception as e:
+            log.warn("system", "[WARN] Erro em tarefa agendada: %r", e)
+
+    def stop(self):
+        """Chamar de dentro do loop (ou depois que ele terminou)."""
+        for handle in self._handles.values():
+            handle.cancel()
+        self._handles.clear()
+        self.loop = None
+
+    def reset(self):
+        pass
+
+
+class RouterProtocol(asyncio.DatagramProtocol):
+    """Põe cada datagrama recebido na fila do roteador (controle ou dados)."""
+
+    def __init__(self, router: "AsyncRouter"):
+        self.router = router
+
+    def connection_made(self, transport):
+        self.router.datagram_transport = transport
+
+    def datagram_received(self, data: bytes, addr):
+        router = self.router
+        router.enqueue(data, addr[0])
+        # o transporte lê um datagrama por volta do loop; o que já está no socket
+        # é lido aqui (até caber uma fila de dados), para os anúncios entrarem na
+        # fila de controle em vez de esperarem atrás dos dados no buffer do kernel
+        sock = router.transport.sock
+        for _ in range(DATA_QUEUE_SIZE):
+            try:
+                data, addr = sock.recvfrom(RECV_BUFFER_SIZE)
+            except OSError:
+                # BlockingIOError: socket vazio; outros erros ficam para o transporte
+                break
+            router.enqueue(data, addr[0])
+
+    def error_received(self, exc):
+        log.warn("rx", "[WARN] Erro no socket: %s", exc)
+
+
+class AsyncRouter(Router):
+    def __init__(self, ip: str, neighbors: Set[str], **kwargs):
+        kwargs.setdefault("scheduler", AsyncScheduler())
+        super().__init__(ip, neighbors, **kwargs)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.datagram_transport: Optional[asyncio.DatagramTransport] = None
+        self._loop_thread_id: Optional[int] = None
+        self._ready = threading.Event()
+        self._stopping: Optional[asyncio.Event] = None
+        self._drain_scheduled = False
+
+    # ------------------------
+    # Recepção
+    # ------------------------
+    def enqueue(self, data: bytes, src_ip: str):
+        super().enqueue(data, src_ip)
+        if not self._drain_scheduled and self.loop is not None:
+            self._drain_scheduled = True
+            self.loop.call_soon(self._drain)
+
+    def _drain(self):
+        """Processa um lote das filas (controle primeiro) e devolve a vez ao
+        loop, para que timers e novas leituras do socket não fiquem esperando."""
+        queues = self.rx_queues
+        try:
+            for _ in range(RX_DRAIN_BATCH):
+                item = queues.get(0)
+                if item is None:
+                    break
+                self.dispatch(*item)
+        finally:
+            # um handler com erro não pode deixar a fila parada
+            if queues.depth(CONTROL) or queues.depth(DATA):
+                self.loop.call_soon(self._drain)
+            else:
+                self._drain_scheduled = False
+
+    # ------------------------
+    # Envio de mensagens
+    # ------------------------
+    def send_to(self, dest_ip: str, message: Union[str, Datagram]):
+        loop = self.loop
+        if loop is None or self.datagram_transport is None:
+            # event loop ainda não iniciou: usa o socket diretamente
+            return super().send_to(dest_ip, message)
+        if threading.get_ident() != self._loop_thread_id:
+            # chamadas vindas da CLI são repassadas para a thread do loop
+            if isinstance(message, (bytearray, memoryview)):
+                # o buffer pode ser reaproveitado antes do loop enviar
+                message = bytes(message)
+            try:
+                loop.call_soon_threadsafe(self.send_to, dest_ip, message)
+            except RuntimeError:
+                log.warn("tx", "[WARN] Event loop encerrado, mensagem para %s descartada", dest_ip)
+            return
+        try:
+            if isinstance(message, str):
+                log.debug("tx", "[DEBUG] Enviando para (%s,%s) : => %s", dest_ip, PORT, message)
+                message = message.encode('utf-8')
+            elif log.enabled("tx", DEBUG):
+                log.debug("tx", "[DEBUG] Enviando para (%s,%s) : => %s", dest_ip, PORT, describe_datagram(message))
+            if not self._egress_allowed(dest_ip, message):
+                return
+            self.datagram_transport.sendto(message, (dest_ip, PORT))
+            self._count(self._m_tx, message)
+            if self.capture is not None:
+                self.capture.record(TX, self.clock(), self.ip, dest_ip, message)
+        except OSError as e:
+            log.warn("tx", "[WARN] Erro ao enviar para %s: %s", dest_ip, e)
+
+    # ------------------------
+    # Event loop
+    # ------------------------
+    async def _main(self):
+        self._stopping = asyncio.Event()
+        await self.loop.create_datagram_endpoint(lambda: RouterProtocol(self), sock=self.transport.sock)
+        log.info("system", "[LISTENER] Escutando em %s:%s (asyncio) ...", self.ip, PORT)
+        # todos os prazos (anúncios, vizinhos, rotas, impressão) viram timers do loop
+        self.scheduler.attach(self.loop)
+        self._ready.set()
+        try:
+            await self._stopping.wait()
+        finally:
+            self.scheduler.stop()
+            if self.datagram_transport is not None:
+                self.datagram_transport.close()
+        log.info("system", "[SYSTEM] Não Tô escutando mais!")
+
+    def _run_loop(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self.loop = loop
+        self._loop_thread_id = threading.get_ident()
+        try:
+            loop.run_until_complete(self._main())
+        except Exception as e:
+            log.error("system", "[ERROR] Event loop finalizado com erro: %s", e)
+        finally:
+            self._ready.set()
+            self.datagram_transport = None
+            self.loop = None
+            loop.close()
+
+    # ------------------------
+    # Start / Stop
+    # ------------------------
+    def start(self):
+        self._stop_event.clear()
+        self._ready.clear()
+        self._drain_scheduled = False
+        self.rx_queues.reopen()
+        self.schedule_timers()
+        t_loop = threading.Thread(target=self._run_loop, daemon=True)
+        self.threads = [t_loop]
+        t_loop.start()
+        self._ready.wait()
+
+        # announce self when starting
+        self.send_announcement_self()
+        # print initial table
+        self.print_table()
+
+    def stop(self, timeout=2.0):
+        self._stop_event.set()
+        loop = self.loop
+        if loop is not None and self._stopping is not None:
+            try:
+                loop.call_soon_threadsafe(self._stopping.set)
+            except RuntimeError:
+                pass
+        for t in self.threads:
+            t.join(timeout=timeout)
+        self.save_snapshot(force=True)
+        self.transport.close()
+        if self.capture is not None:
+            self.capture.close()
+        if self.shards is not None:
+            self.shards.close()
@@ -0,0 +1,348 @@
+# route_table.py
+"""Tabela de rotas compacta.
+
+Destinos são prefixos IPv4 codificados em int (ver utils.prefix_key; um host
+/32 é o próprio utils.ip_to_int) e cada rota é um objeto com __slots__. Um índice reverso next_hop -> destinos permite achar/remover as rotas
+de um vizinho em O(rotas via esse vizinho), sem varrer a tabela inteira.
+
+Multipath (ECMP): além do next_hop principal, uma rota aprendida pode ter
+alternates, outros vizinhos que anunciaram o mesmo destino com a mesma métrica
+(com índice reverso próprio, alt_via). Os anúncios usam só o next_hop; a FIB
+guarda todos e o encaminhamento escolhe um por fluxo. Quando o vizinho do
+next_hop cai, o primeiro alternate assume na hora (drop_next_hop).
+
+Os métodos de leitura/escrita esperam que o chamador segure self.lock (RLock,
+compartilhado com o Router); snapshot() adquire o lock sozinho e pode ser
+chamado de qualquer thread.
+
+Além da tabela completa (RIB), mantém a FIB usada no encaminhamento (Fib: um
+dict host -> next_hop e uma radix.RadixTrie com os demais prefixos), que nunca
+é alterada depois de publicada. publish_fib() (chamado pelo Router ao fim de
+cada atualização, com o lock) troca a referência self.fib por uma cópia com as
+mudanças; quem encaminha só lê self.fib, sem lock.
+"""
+import threading
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Set, Tuple, Union
+from constants import INFINITY_METRIC
+from radix import RadixTrie
+from utils import RouteRow, split_key
+
+# Mudança feita por merge_announcement:
+# (tipo, destino, métrica, next_hop, origem, métrica anterior, next_hop anterior)
+# tipos: 'add' (rota nova), 'improve' (mesmo next_hop, métrica menor),
+#        'failover' (o next_hop saiu e um alternate de mesma métrica assumiu),
+#        'ecmp_add' / 'ecmp_drop' (alternate incluído / retirado; next_hop é o
+#        alternate em questão),
+#        'worsen' (mesmo next_hop, métrica maior), 'replace' (outro next_hop,
+#        métrica menor), 'withdraw' (retirada explícita com métrica infinita ou
+#        rota que passaria do infinito), 'lost' (não veio no anúncio completo do vizinho)
+RouteChange = Tuple[str, int, int, str, str, int, str]
+
+
+# Entrada da FIB: o next_hop ou, com multipath, a tupla (next_hop, *alternates)
+FibEntry = Union[str, Tuple[str, ...]]
+
+
+class Route:
+    __slots__ = ("metric", "next_hop", "ts", "origin", "alternates")
+
+    def __init__(self, metric: int, next_hop: str, ts: float, origin: str):
+        self.metric = metric
+        self.next_hop = next_hop
+        self.ts = ts
+        self.origin = origin
+        # outros next hops com a mesma métrica (ECMP), em ordem de chegada
+        self.alternates: Tuple[str, ...] = ()
+
+
+class Fib:
+    """FIB imutável: hosts /32 num dict (caso comum, uma consulta) e os demais
+    prefixos numa trie persistente para o longest-prefix match."""
+    __slots__ = ("hosts", "prefixes")
+
+    def __init__(self, hosts: Optional[Dict[int, FibEntry]] = None, prefixes: Optional[RadixTrie] = None):
+        self.hosts: Mapping[int, FibEntry] = hosts if hosts is not None else {}
+        self.prefixes = prefixes if prefixes is not None else RadixTrie()
+
+    def __len__(self) -> int:
+        return len(self.hosts) + len(self.prefixes)
+
+    def get(self, addr: int, default: Optional[FibEntry] = None) -> Optional[FibEntry]:
+        """Entrada do prefixo mais longo que contém o endereço addr: o next hop
+        ou, se a rota tiver caminhos de mesmo custo, a tupla deles."""
+        next_hop = self.hosts.get(addr)
+        if next_hop is not None:
+            return next_hop
+        if self.prefixes:
+            next_hop = self.prefixes.lookup(addr)
+            if next_hop is not None:
+                return next_hop
+        return default
+
+
+class RouteTable:
+    def __init__(self, lock=None):
+        # qualquer lock reentrante (ex.: metrics.TimedLock); padrão threading.RLock
+        self.lock = lock if lock is not None else threading.RLock()
+        # incrementada a cada mudança de conteúdo (métrica, next_hop, alternates ou origem);
+        # renovar só o timestamp não muda a versão
+        self.version = 0
+        self._routes: Dict[int, Route] = {}
+        self._via: Dict[str, Set[int]] = {}
+        self._alt_via: Dict[str, Set[int]] = {}
+        self._snapshot: Optional[Tuple[int, Tuple[RouteRow, ...]]] = None
+        # FIB publicada (imutável) e destinos cujo next_hop mudou desde a publicação
+        self.fib = Fib()
+        self._fib_dirty: Set[int] = set()
+        # destinos com conteúdo alterado (só se track_changes() foi chamado)
+        self._changed: Optional[Set[int]] = None
+
+    def __len__(self) -> int:
+        return len(self._routes)
+
+    def __contains__(self, dest: int) -> bool:
+        return dest in self._routes
+
+    def get(self, dest: int) -> Optional[Route]:
+        return self._routes.get(dest)
+
+    def items(self) -> Iterator[Tuple[int, Route]]:
+        return iter(self._routes.items())
+
+    def via(self, next_hop: str) -> List[int]:
+        """Destinos cujo next_hop é o vizinho informado."""
+        return list(self._via.get(next_hop, ()))
+
+    def alt_via(self, next_hop: str) -> List[int]:
+        """Destinos que têm o vizinho informado entre os alternates."""
+        return list(self._alt_via.get(next_hop, ()))
+
+    def set(self, dest: int, metric: int, next_hop: str, ts: float, origin: str) -> bool:
+        """Insere ou atualiza uma rota. Retorna True se o conteúdo mudou.
+        Mudar a métrica ou o next_hop descarta os alternates."""
+        route = self._routes.get(dest)
+        if route is None:
+            self._routes[dest] = Route(metric, next_hop, ts, origin)
+            self._via.setdefault(next_hop, set()).add(dest)
+            self._fib_dirty.add(dest)
+            self.version += 1
+            if self._changed is not None:
+                self._changed.add(dest)
+            return True
+        changed = route.metric != metric or route.next_hop != next_hop or route.origin != origin
+        if route.alternates and (route.metric != metric or route.next_hop != next_hop):
+            self.set_alternates(dest, ())
+        if route.next_hop != next_hop:
+            self._unindex(dest, route.next_hop)
+            self._via.setdefault(next_hop, set()).add(dest)
+            self._fib_dirty.add(dest)
+        route.metric = metric
+        route.next_hop = next_hop
+        route.ts = ts
+        route.origin = origin
+        if changed:
+            self.version += 1
+            if self._changed is not None:
+                self._changed.add(dest)
+        return changed
+
+    def remove(self, dest: int) -> Optional[Route]:
+        route = self._routes.pop(dest, None)
+        if route is not None:
+            self._unindex(dest, route.next_hop)
+            for alt in route.alternates:
+                self._unindex(dest, alt, self._alt_via)
+            self._fib_dirty.add(dest)
+            self.version += 1
+            if self._changed is not None:
+                self._changed.add(dest)
+        return route
+
+    def set_alternates(self, dest: int, alternates: Tuple[str, ...]):
+        """Troca os alternates (ECMP) de uma rota existente. Muda a versão: os
+        anúncios não levam os alternates, mas Split Horizon depende deles."""
+        route = self._routes[dest]
+        if route.alternates == alternates:
+            return
+        for alt in route.alternates:
+            self._unindex(dest, alt, self._alt_via)
+        for alt in alternates:
+            self._alt_via.setdefault(alt, set()).add(dest)
+        route.alternates = alternates
+        self._fib_dirty.add(dest)
+        self.version += 1
+        if self._changed is not None:
+            self._changed.add(dest)
+
+    def _unindex(self, dest: int, next_hop: str, index: Optional[Dict[str, Set[int]]] = None):
+        if index is None:
+            index = self._via
+        dests = index.get(next_hop)
+        if dests is not None:
+            dests.discard(dest)
+            if not dests:
+                del index[next_hop]
+
+    def track_changes(self, enabled: bool = True):
+        """Liga/desliga o registro dos destinos alterados (take_changed). Ao ligar,
+        começa com todos os destinos atuais, para quem precisa de uma cópia completa."""
+        self._changed = set(self._routes) if enabled else None
+
+    def take_changed(self) -> Set[int]:
+        changed = self._changed
+        if not changed:
+            return set()
+        self._changed = set()
+        return changed
+
+    def publish_fib(self) -> Fib:
+        """Publica uma nova FIB se algum next_hop mudou (copy-on-write: a FIB
+        anterior continua válida para quem já a estava lendo)."""
+        dirty = self._fib_dirty
+        if not dirty:
+            return self.fib
+        hosts = None
+        prefixes = self.fib.prefixes
+        for dest in dirty:
+            route = self._routes.get(dest)
+            entry: Optional[FibEntry] = None
+            if route is not None:
+                entry = (route.next_hop,) + route.alternates if route.alternates else route.next_hop
+            if dest >> 32 == 0:
+                if hosts is None:
+                    hosts = dict(self.fib.hosts)
+                if entry is None:
+                    hosts.pop(dest, None)
+                else:
+                    hosts[dest] = entry
+            else:
+                addr, length = split_key(dest)
+                if entry is None:
+                    prefixes = prefixes.remove(addr, length)
+                else:
+                    prefixes = prefixes.insert(addr, length, entry)
+        dirty.clear()
+        self.fib = Fib(hosts if hosts is not None else self.fib.hosts, prefixes)
+        return self.fib
+
+    def rows(self, dests: Iterable[int], missing_metric: int) -> List[RouteRow]:
+        """Linhas (dest, metric, next_hop, origin) dos destinos pedidos; os que
+        não estão na tabela saem com missing_metric e sem next_hop."""
+        res = []
+        for dest in dests:
+            route = self._routes.get(dest)
+            if route is None:
+                res.append((dest, missing_metric, "", ""))
+            else:
+                res.append((dest, route.metric, route.next_hop, route.origin))
+        return res
+
+    def snapshot(self) -> Tuple[RouteRow, ...]:
+        """Cópia imutável da tabela (dest, metric, next_hop, origin), sem ordem definida.
+        Reaproveitada enquanto a versão não mudar."""
+        with self.lock:
+            cached = self._snapshot
+            if cached is not None and cached[0] == self.version:
+                return cached[1]
+            rows = tuple((dest, r.metric, r.next_hop, r.origin) for dest, r in self._routes.items())
+            self._snapshot = (self.version, rows)
+            return rows
+
+
+def drop_next_hop(table: RouteTable, dest: int, next_hop: str, now: float, kind: str,
+                  infinity: int = INFINITY_METRIC, failover: bool = True) -> Optional[RouteChange]:
+    """next_hop deixou de ser um caminho para dest (chamar com table.lock).
+    Se era o next_hop principal, o primeiro alternate assume ('failover') ou,
+    sem alternates (ou com failover=False), a rota é removida (kind: 'withdraw'
+    ou 'lost'); se era um alternate, só ele sai ('ecmp_drop'). Retorna a
+    mudança (None se nada mudou)."""
+    route = table.get(dest)
+    if route is None:
+        return None
+    if route.next_hop == next_hop:
+        if route.alternates and failover:
+            new_hop, rest = route.alternates[0], route.alternates[1:]
+            table.set(dest, route.metric, new_hop, now, route.origin)
+            table.set_alternates(dest, rest)
+            return ("failover", dest, route.metric, new_hop, route.origin, route.metric, next_hop)
+        table.remove(dest)
+        return (kind, dest, infinity, "", "", route.metric, next_hop)
+    if next_hop in route.alternates:
+        table.set_alternates(dest, tuple(a for a in route.alternates if a != next_hop))
+        return ("ecmp_drop", dest, route.metric, next_hop, route.origin, route.metric, route.next_hop)
+    return None
+
+
+def merge_announcement(table: RouteTable, neighbor_ip: str, parsed: Dict[int, int],
+                       withdrawn: Iterable[int], self_key: int, now: float,
+                       refreshed: Optional[List[int]] = None,
+                       infinity: int = INFINITY_METRIC, max_paths: int = 1) -> List[RouteChange]:
+    """Bellman-Ford das rotas anunciadas por neighbor_ip (chamar com table.lock).
+    parsed: destino -> métrica recebida (infinity = retirada explícita);
+    withdrawn: destinos que o vizinho deixou de anunciar. Aplica as mudanças em
+    table e as retorna; rotas só renovadas vão para refreshed, se informado.
+    Uma rota que chegaria a infinity depois do +1 é tratada como inalcançável,
+    o que limita a contagem até o infinito. Com max_paths > 1, vizinhos que
+    empatam com a métrica de uma rota aprendida viram alternates (até
+    max_paths caminhos no total).
+    Usado tanto pelo Router quanto pelos workers de sharding.py."""
+    changes: List[RouteChange] = []
+    get = table.get
+    for dest, recv_metric in parsed.items():
+        if dest == self_key:
+            # Ignora anúncios de rota para si próprio
+            continue
+        route = get(dest)
+        metric = recv_metric + 1
+        if metric >= infinity:
+            # Retirada explícita (anúncio incremental / poison reverse) ou
+            # destino que ficaria inalcançável por esse vizinho
+            if route is not None:
+                change = drop_next_hop(table, dest, neighbor_ip, now, "withdraw", infinity, False)
+                if change is not None:
+                    changes.append(change)
+            continue
+        if route is None:
+            # Rota nova — adiciona
+            table.set(dest, metric, neighbor_ip, now, 'learned')
+            changes.append(("add", dest, metric, neighbor_ip, 'learned', infinity, ""))
+        elif route.next_hop == neighbor_ip:
+            # Mesmo next-hop: o vizinho é a referência para esse destino, então
+            # a métrica acompanha a dele, para melhor ou para pior
+            if metric < route.metric:
+                prev = route.metric
+                table.set(dest, metric, neighbor_ip, now, route.origin)
+                changes.append(("improve", dest, metric, neighbor_ip, route.origin, prev, neighbor_ip))
+            elif metric > route.metric:
+                prev = route.metric
+                table.set(dest, metric, neighbor_ip, now, route.origin)
+                changes.append(("worsen", dest, metric, neighbor_ip, route.origin, prev, neighbor_ip))
+            else:
+                route.ts = now
+                if refreshed is not None:
+                    refreshed.append(dest)
+        elif metric < route.metric:
+            # Rota por outro vizinho — substitui se for melhor
+            prev, prev_next = route.metric, route.next_hop
+            table.set(dest, metric, neighbor_ip, now, 'learned')
+            changes.append(("replace", dest, metric, neighbor_ip, 'learned', prev, prev_next))
+        elif neighbor_ip in route.alternates:
+            if metric > route.metric:
+                # alternate piorou: deixa de ser caminho de mesmo custo
+                changes.append(drop_next_hop(table, dest, neighbor_ip, now, "withdraw", infinity))
+        elif (metric == route.metric and route.origin == 'learned'
+              and len(route.alternates) + 1 < max_paths):
+            # Mesmo custo por outro vizinho — entra como alternate (ECMP)
+            table.set_alternates(dest, route.alternates + (neighbor_ip,))
+            changes.append(("ecmp_add", dest, metric, neighbor_ip, 'learned', metric, route.next_hop))
+
+    # o next_hop principal perdeu o caminho: os alternates provavelmente
+    # dependem do mesmo trecho e ainda não avisaram, então não há failover
+    # aqui (só quando o vizinho cai, em Router._neighbor_expired); promover
+    # caminhos velhos a cada perda fazia os anúncios imediatos girarem
+    # sem fim na caça de caminhos
+    for dest in withdrawn:
+        change = drop_next_hop(table, dest, neighbor_ip, now, "lost", infinity, False)
+        if change is not None:
+            changes.append(change)
+    return changes
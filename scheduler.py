@@ -0,0 +1,104 @@
+# scheduler.py
+"""Escalonador de prazos do roteador.
+
+Um heap único guarda todos os prazos (expiração de vizinhos, envelhecimento de
+rotas, anúncios periódicos, impressão da tabela, updates disparados). Cada prazo
+tem uma chave: reagendar a mesma chave substitui o prazo anterior (a entrada
+antiga fica no heap e é descartada quando chega ao topo). A thread do
+escalonador dorme até o próximo prazo, sem polling.
+"""
+import heapq
+import itertools
+import threading
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+from utils import now_ts
+from logging_utils import log
+
+
+class Scheduler:
+    def __init__(self, clock: Callable[[], float] = now_ts):
+        self.clock = clock
+        self._heap: List[Tuple[float, int, Hashable]] = []
+        # chave -> (seq, callback); só a entrada do heap com o mesmo seq é válida
+        self._entries: Dict[Hashable, Tuple[int, Callable[[], None]]] = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stopped = False
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def schedule(self, key: Hashable, when: float, callback: Callable[[], None]):
+        """Agenda callback para o instante when (mesmo relógio de self.clock),
+        substituindo qualquer prazo anterior com a mesma chave."""
+        with self._cond:
+            seq = next(self._seq)
+            self._entries[key] = (seq, callback)
+            heapq.heappush(self._heap, (when, seq, key))
+            if self._heap[0][1] == seq:
+                # novo prazo é o mais próximo: acorda a thread para reajustar a espera
+                self._cond.notify()
+
+    def call_later(self, delay: float, callback: Callable[[], None], key: Optional[Hashable] = None):
+        if key is None:
+            key = object()
+        self.schedule(key, self.clock() + delay, callback)
+
+    def cancel(self, key: Hashable):
+        with self._cond:
+            self._entries.pop(key, None)
+
+    def _next_deadline_locked(self) -> Optional[float]:
+        heap = self._heap
+        while heap:
+            when, seq, key = heap[0]
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == seq:
+                return when
+            heapq.heappop(heap)
+        return None
+
+    def next_deadline(self) -> Optional[float]:
+        with self._cond:
+            return self._next_deadline_locked()
+
+    def run_pending(self, now: Optional[float] = None) -> Optional[float]:
+        """Executa os callbacks vencidos até now e retorna o próximo prazo (ou None)."""
+        due = []
+        with self._cond:
+            if now is None:
+                now = self.clock()
+            while True:
+                when = self._next_deadline_locked()
+                if when is None or when > now:
+                    break
+                _, _, key = heapq.heappop(self._heap)
+                due.append(self._entries.pop(key)[1])
+        for callback in due:
+            try:
+                callback()
+            except Exception as e:
+                log.warn("system", "[WARN] Erro em tarefa agendada: %r", e)
+        return self.next_deadline()
+
+    def run(self):
+        """Loop da thread do escalonador: executa os prazos vencidos e dorme até o próximo."""
+        while True:
+            self.run_pending()
+            with self._cond:
+                if self._stopped:
+                    return
+                when = self._next_deadline_locked()
+                timeout = None if when is None else when - self.clock()
+                if timeout is None or timeout > 0:
+                    self._cond.wait(timeout)
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def reset(self):
+        """Permite chamar run() de novo depois de stop()."""
+        with self._cond:
+            self._stopped = False
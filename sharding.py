@@ -0,0 +1,153 @@
+# sharding.py
+"""Merge de anúncios dividido entre processos (modo experimental, --shards N).
+
+Os destinos são particionados por dest % N. Cada worker tem a sua fatia da
+tabela (um RouteTable) e roda o mesmo merge_announcement do Router sobre ela.
+O processo principal continua com a tabela completa (RIB), que é a referência
+para anúncios, FIB, envelhecimento e impressão: para cada anúncio grande ele
+manda a cada worker a fatia das rotas recebidas/retiradas, espera as mudanças
+de todos e as aplica na RIB, com o mesmo resultado do merge feito localmente.
+
+Mudanças feitas na RIB por outros caminhos (anúncios '@', expiração de
+vizinhos e rotas, anúncios pequenos processados localmente) ficam registradas
+pela tabela (track_changes) e seguem para o worker dono junto com o próximo
+anúncio, antes do merge.
+
+Por isso o modo não acelera o roteador: o processo principal ainda faz
+trabalho proporcional às mudanças (reaplicar na RIB e, no Router, registrar e
+agendar o envelhecimento de cada uma), e o merge em si é só ~20% do
+processamento de um anúncio. Compensaria só com os workers donos das suas
+fatias, inclusive dos prazos das rotas. Ver handle_single e handle_sharded
+em bench_hotpaths.py.
+"""
+import multiprocessing
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from constants import INFINITY_METRIC, SHARD_MIN_ROUTES
+from logging_utils import log
+from route_table import RouteTable, RouteChange, merge_announcement
+
+# (destino, métrica, next_hop, origem, alternates) ou (destino, None, '', '', ()) para remoção
+SyncEntry = Tuple[int, Optional[int], str, str, Tuple[str, ...]]
+
+
+def _worker_main(conn):
+    """Loop de um worker: aplica a sincronização e faz o merge da sua fatia."""
+    table = RouteTable()
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            return
+        if msg is None:
+            return
+        sync, neighbor_ip, parsed, withdrawn, self_key, now, infinity, max_paths = msg
+        for dest, metric, next_hop, origin, alternates in sync:
+            if metric is None:
+                table.remove(dest)
+            else:
+                table.set(dest, metric, next_hop, now, origin)
+                table.set_alternates(dest, alternates)
+        refreshed: List[int] = []
+        changes = merge_announcement(table, neighbor_ip, parsed, withdrawn, self_key, now, refreshed,
+                                     infinity, max_paths)
+        # alternates finais dos destinos alterados (as mudanças só dizem o next_hop)
+        alternates = {}
+        for change in changes:
+            route = table.get(change[1])
+            if route is not None:
+                alternates[change[1]] = route.alternates
+        conn.send((changes, refreshed, alternates))
+
+
+class ShardPool:
+    def __init__(self, table: RouteTable, workers: int):
+        self.table = table
+        self.n = workers
+        ctx = multiprocessing.get_context("spawn")
+        self._conns = []
+        self._procs = []
+        for i in range(workers):
+            parent, child = ctx.Pipe()
+            proc = ctx.Process(target=_worker_main, args=(child,), name=f"route-shard-{i}", daemon=True)
+            proc.start()
+            child.close()
+            self._conns.append(parent)
+            self._procs.append(proc)
+        # os workers começam vazios: a primeira sincronização leva a tabela inteira
+        with table.lock:
+            table.track_changes()
+
+    def merge(self, neighbor_ip: str, parsed: Dict[int, int], withdrawn: Iterable[int],
+              self_key: int, now: float, infinity: int = INFINITY_METRIC,
+              max_paths: int = 1) -> List[RouteChange]:
+        """Mesmo efeito de merge_announcement(self.table, ...) (chamar com table.lock)."""
+        table = self.table
+        withdrawn = list(withdrawn)
+        if self._conns is None or len(parsed) + len(withdrawn) < SHARD_MIN_ROUTES:
+            # anúncio pequeno (ou pool encerrado): o IPC custaria mais que o merge
+            return merge_announcement(table, neighbor_ip, parsed, withdrawn, self_key, now,
+                                      infinity=infinity, max_paths=max_paths)
+
+        n = self.n
+        syncs: List[List[SyncEntry]] = [[] for _ in range(n)]
+        for dest in table.take_changed():
+            route = table.get(dest)
+            if route is None:
+                syncs[dest % n].append((dest, None, "", "", ()))
+            else:
+                syncs[dest % n].append((dest, route.metric, route.next_hop, route.origin, route.alternates))
+        parts: List[Dict[int, int]] = [{} for _ in range(n)]
+        for dest, metric in parsed.items():
+            parts[dest % n][dest] = metric
+        lost: List[List[int]] = [[] for _ in range(n)]
+        for dest in withdrawn:
+            lost[dest % n].append(dest)
+
+        try:
+            for i, conn in enumerate(self._conns):
+                conn.send((syncs[i], neighbor_ip, parts[i], lost[i], self_key, now, infinity, max_paths))
+            results = [conn.recv() for conn in self._conns]
+        except (OSError, EOFError) as e:
+            # worker morreu: a RIB ainda não foi tocada, então segue sem sharding
+            log.error("route", "[ERROR] Worker de sharding falhou (%s); merge volta para o processo principal", e)
+            self.close()
+            return merge_announcement(table, neighbor_ip, parsed, withdrawn, self_key, now,
+                                      infinity=infinity, max_paths=max_paths)
+
+        changes: List[RouteChange] = []
+        for worker_changes, refreshed, alternates in results:
+            for change in worker_changes:
+                kind, dest, metric, next_hop, origin = change[:5]
+                if kind in ("withdraw", "lost"):
+                    table.remove(dest)
+                    continue
+                if kind not in ("ecmp_add", "ecmp_drop"):
+                    # em ecmp_* o next_hop da mudança é o alternate, não o principal
+                    table.set(dest, metric, next_hop, now, origin)
+                table.set_alternates(dest, alternates[dest])
+            for dest in refreshed:
+                route = table.get(dest)
+                if route is not None:
+                    route.ts = now
+            changes.extend(worker_changes)
+        # os workers já têm essas mudanças
+        table.take_changed()
+        return changes
+
+    def close(self):
+        conns, self._conns = self._conns, None
+        if conns is None:
+            return
+        with self.table.lock:
+            self.table.track_changes(False)
+        for conn in conns:
+            try:
+                conn.send(None)
+                conn.close()
+            except OSError:
+                pass
+        for proc in self._procs:
+            proc.join(timeout=1.0)
+            if proc.is_alive():
+                proc.terminate()
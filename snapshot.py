@@ -0,0 +1,130 @@
+# snapshot.py
+"""Snapshot da tabela em disco para o warm start do roteador.
+
+Arquivo binário, em colunas como o formato binário dos anúncios (utils), para
+ser lido com poucos struct.unpack_from direto de um mmap:
+
+  cabeçalho  magic 'DVRT', versão, vizinhos (M), gravado em (time.time()),
+             IP do roteador, rotas (N), crc32 do resto do arquivo
+  vizinhos   M IPv4 (uint32) e M flags (1 byte: NEIGHBOR_ACTIVE, NEIGHBOR_BINARY,
+             NEIGHBOR_HELLO)
+  rotas      N endereços (uint32), N índices do next_hop na lista de vizinhos
+             (uint16), N comprimentos de prefixo e N métricas (1 byte cada)
+
+8 bytes por rota. write_snapshot grava num arquivo temporário no mesmo
+diretório e troca com os.replace, então quem lê nunca vê um arquivo pela metade.
+"""
+import mmap
+import os
+import struct
+import zlib
+from typing import Dict, Iterable, List, Tuple
+from utils import ip_to_int, int_to_ip, prefix_key, split_key
+
+SNAPSHOT_MAGIC = b"DVRT"
+SNAPSHOT_VERSION = 1
+_HEADER = struct.Struct("!4sBxHdIII")
+
+NEIGHBOR_ACTIVE = 0x01
+NEIGHBOR_BINARY = 0x02
+NEIGHBOR_HELLO = 0x04
+
+# (destino, métrica, next_hop)
+SnapshotRoute = Tuple[int, int, str]
+
+
+class Snapshot:
+    __slots__ = ("router_ip", "saved_at", "neighbors", "routes")
+
+    def __init__(self, router_ip: str, saved_at: float, neighbors: Dict[str, int], routes: List[SnapshotRoute]):
+        self.router_ip = router_ip
+        self.saved_at = saved_at
+        # vizinho -> flags
+        self.neighbors = neighbors
+        self.routes = routes
+
+
+def write_snapshot(path: str, router_ip: str, neighbors: Dict[str, int],
+                   routes: Iterable[SnapshotRoute], saved_at: float) -> int:
+    """Grava o snapshot de forma atômica e retorna o tamanho em bytes.
+    Rotas cujo next_hop não está em neighbors são ignoradas."""
+    hops = list(neighbors)
+    index = {ip: i for i, ip in enumerate(hops)}
+    addrs: List[int] = []
+    hop_idx: List[int] = []
+    lengths = bytearray()
+    metrics = bytearray()
+    for dest, metric, next_hop in routes:
+        i = index.get(next_hop)
+        if i is None:
+            continue
+        addr, length = split_key(dest)
+        addrs.append(addr)
+        hop_idx.append(i)
+        lengths.append(length)
+        metrics.append(min(metric, 0xFF))
+    n, m = len(addrs), len(hops)
+    body = b"".join((
+        struct.pack(f"!{m}I", *(ip_to_int(ip) for ip in hops)),
+        bytes(neighbors[ip] & 0xFF for ip in hops),
+        struct.pack(f"!{n}I", *addrs),
+        struct.pack(f"!{n}H", *hop_idx),
+        bytes(lengths),
+        bytes(metrics),
+    ))
+    header = _HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, m, saved_at, ip_to_int(router_ip), n,
+                          zlib.crc32(body))
+    tmp = f"{path}.tmp{os.getpid()}"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(header)
+            f.write(body)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except OSError:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    return len(header) + len(body)
+
+
+def read_snapshot(path: str) -> Snapshot:
+    """Lê um snapshot (via mmap). Levanta OSError se não der para abrir o
+    arquivo e ValueError se o conteúdo não for um snapshot válido."""
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < _HEADER.size:
+            raise ValueError(f"snapshot truncado ({size} bytes)")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return _decode(mm, size)
+
+
+def _decode(buf, size: int) -> Snapshot:
+    magic, version, m, saved_at, router, n, crc = _HEADER.unpack_from(buf, 0)
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError("não é um snapshot de rotas")
+    if version != SNAPSHOT_VERSION:
+        raise ValueError(f"versão de snapshot não suportada: {version}")
+    if size != _HEADER.size + 5 * m + 8 * n:
+        raise ValueError(f"tamanho inconsistente: {size} bytes para {m} vizinho(s) e {n} rota(s)")
+    # o mmap só fecha sem views abertas: a do crc é liberada aqui mesmo
+    with memoryview(buf) as view, view[_HEADER.size:] as body:
+        if zlib.crc32(body) != crc:
+            raise ValueError("crc não confere")
+    off = _HEADER.size
+    hops = [int_to_ip(ip) for ip in struct.unpack_from(f"!{m}I", buf, off)]
+    flags = struct.unpack_from(f"{m}B", buf, off + 4 * m)
+    off += 5 * m
+    addrs = struct.unpack_from(f"!{n}I", buf, off)
+    hop_idx = struct.unpack_from(f"!{n}H", buf, off + 4 * n)
+    lengths = struct.unpack_from(f"{n}B", buf, off + 6 * n)
+    metrics = struct.unpack_from(f"{n}B", buf, off + 7 * n)
+    routes = []
+    for addr, i, length, metric in zip(addrs, hop_idx, lengths, metrics):
+        if i >= m:
+            raise ValueError(f"next_hop inválido: índice {i}")
+        routes.append((prefix_key(addr, length), metric, hops[i]))
+    return Snapshot(int_to_ip(router), saved_at, dict(zip(hops, flags)), routes)
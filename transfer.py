@@ -0,0 +1,419 @@
+# transfer.py
+"""Transferência de dados grandes (arquivos) sobre as mensagens de texto.
+
+Cada fragmento é uma mensagem '!orig;dest;TEXTO' comum, então os roteadores do
+caminho repassam sem remontar nada (handle_text_message só lê 'orig;dest' e
+reenvia os mesmos bytes). O TEXTO começa com '~' e um subtipo:
+
+  ~D<id>;<seq>;<total>;<nome>;<bytes>   fragmento seq (0..total-1) da transferência id
+  ~A<id>;<próximo>;<seq>,<seq>,...      ack fim a fim: todos os fragmentos antes de
+                                        'próximo' chegaram, mais os seletivos listados
+
+Quem envia mantém uma janela deslizante de até TRANSFER_WINDOW fragmentos sem
+ack. O prazo de retransmissão (RTO) vem do RTT medido nos acks (estimador de
+Jacobson, sem amostras de fragmentos retransmitidos); quando vence, os
+fragmentos da janela ainda sem ack são reenviados e o RTO dobra. Antes disso,
+um fragmento sem ack é dado como perdido e reenviado na hora quando chega o
+ack de outro enviado depois dele (os fragmentos de uma transferência seguem
+todos pelo mesmo caminho, então não chegam fora de ordem). Depois de
+TRANSFER_MAX_RETRIES prazos seguidos sem progresso a transferência falha.
+
+Quem recebe guarda os fragmentos por (origem, id), responde um ack a cada
+fragmento e, com todos, grava o arquivo em save_dir (ou só o entrega a
+on_receive). Transferências paradas há TRANSFER_RX_TIMEOUT são descartadas.
+"""
+import itertools
+import os
+import random
+import threading
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple
+from constants import (TRANSFER_FRAGMENT_SIZE, TRANSFER_WINDOW, TRANSFER_RTO_INITIAL, TRANSFER_RTO_MIN,
+                       TRANSFER_RTO_MAX, TRANSFER_MAX_RETRIES, TRANSFER_RX_TIMEOUT, TRANSFER_MAX_BYTES,
+                       TRANSFER_DIR)
+from logging_utils import log
+from utils import ip_to_int, int_to_ip
+
+DATA_TAG = b"~D"
+ACK_TAG = b"~A"
+_MAX_NAME = 48
+
+
+def _check_origin(origin: str):
+    """A origem vai para o nome do arquivo salvo: só um IPv4 na forma canônica
+    (inet_aton aceita '10.1' e ignora o que vem depois de um espaço)."""
+    try:
+        valid = int_to_ip(ip_to_int(origin)) == origin
+    except OSError:
+        valid = False
+    if not valid:
+        raise ValueError(f"origem inválida: {origin!r}")
+
+
+def _clean_name(name: str) -> str:
+    """Nome de arquivo sem diretórios nem ';' (separador do cabeçalho)."""
+    name = os.path.basename(name.replace("\\", "/")).replace(";", "_").strip()[:_MAX_NAME]
+    return name if name not in ("", ".", "..") else "dados"
+
+
+class OutgoingTransfer:
+    __slots__ = ("xfer_id", "dest", "name", "size", "fragments", "acked", "base", "next_seq", "sent_at",
+                 "last_sent", "rack", "retries", "srtt", "rttvar", "rto", "started", "finished",
+                 "sent", "retransmits", "ok", "on_done")
+
+    def __init__(self, xfer_id: int, dest: str, name: str, size: int, fragments: List[bytes],
+                 started: float, on_done: Optional[Callable[["OutgoingTransfer"], None]]):
+        self.xfer_id = xfer_id
+        self.dest = dest
+        self.name = name
+        self.size = size
+        # datagramas prontos ('!orig;dest;~D...'), um por fragmento
+        self.fragments = fragments
+        self.acked = bytearray(len(fragments))
+        # primeiro fragmento sem ack e próximo ainda não enviado
+        self.base = 0
+        self.next_seq = 0
+        # seq -> instante do envio (None depois de retransmitido: não vale como amostra de RTT)
+        self.sent_at: Dict[int, Optional[float]] = {}
+        # seq -> último envio (fragmentos sem ack) e o mais recente desses
+        # instantes entre os fragmentos já confirmados
+        self.last_sent: Dict[int, float] = {}
+        self.rack = -1.0
+        self.retries = 0
+        self.srtt: Optional[float] = None
+        self.rttvar = 0.0
+        self.rto = TRANSFER_RTO_INITIAL
+        self.started = started
+        self.finished: Optional[float] = None
+        self.sent = 0
+        self.retransmits = 0
+        self.ok = False
+        self.on_done = on_done
+
+    @property
+    def total(self) -> int:
+        return len(self.fragments)
+
+    def report(self) -> str:
+        elapsed = max((self.finished or self.started) - self.started, 1e-9)
+        loss = 100.0 * self.retransmits / self.sent if self.sent else 0.0
+        status = "concluída" if self.ok else "falhou"
+        return (f"[XFER] Transferência {self.xfer_id} ('{self.name}') para {self.dest} {status}: "
+                f"{self.size} bytes em {elapsed:.2f}s ({self.size / elapsed / 1024:.1f} KiB/s), "
+                f"{self.total} fragmento(s), {self.sent} enviados, {self.retransmits} retransmitidos "
+                f"({loss:.1f}% de perda estimada)")
+
+
+class IncomingTransfer:
+    __slots__ = ("origin", "xfer_id", "name", "chunks", "received", "next_expected", "size", "started",
+                 "last_seen", "done")
+
+    def __init__(self, origin: str, xfer_id: int, name: str, total: int, now: float):
+        self.origin = origin
+        self.xfer_id = xfer_id
+        self.name = name
+        self.chunks: List[Optional[bytes]] = [None] * total
+        self.received = 0
+        self.next_expected = 0
+        self.size = 0
+        self.started = now
+        self.last_seen = now
+        self.done = False
+
+
+class TransferManager:
+    """Transferências de um roteador (enviadas e recebidas)."""
+
+    def __init__(self, router, save_dir: Optional[str] = TRANSFER_DIR):
+        self.router = router
+        self.save_dir = save_dir
+        # chamado com (IncomingTransfer, dados) quando uma transferência termina de chegar
+        self.on_receive: Optional[Callable[[IncomingTransfer, bytes], None]] = None
+        self._lock = threading.Lock()
+        self._ids = itertools.count(random.getrandbits(20))
+        self._outgoing: Dict[int, OutgoingTransfer] = {}
+        self._incoming: Dict[Tuple[str, int], IncomingTransfer] = {}
+        m = router.metrics
+        self._m_frag_tx = m.counter("router_xfer_fragments_sent_total", "Fragmentos de transferência enviados")
+        self._m_retx = m.counter("router_xfer_retransmits_total", "Fragmentos de transferência retransmitidos")
+        self._m_frag_rx = m.counter("router_xfer_fragments_received_total",
+                                    "Fragmentos de transferência recebidos (inclui duplicados)")
+        self._m_done = {d: m.counter("router_xfer_completed_total", "Transferências concluídas", direction=d)
+                        for d in ("tx", "rx")}
+        self._m_failed = m.counter("router_xfer_failed_total", "Transferências enviadas que falharam")
+        m.gauge("router_xfer_active", "Transferências em andamento", lambda: len(self._outgoing) + sum(
+            1 for t in list(self._incoming.values()) if not t.done))
+
+    # ------------------------
+    # Envio
+    # ------------------------
+    def send(self, dest: str, data: bytes, name: str = "dados",
+             on_done: Optional[Callable[[OutgoingTransfer], None]] = None) -> OutgoingTransfer:
+        """Começa a enviar data para dest. on_done é chamado no fim (sucesso ou falha)."""
+        if len(data) > TRANSFER_MAX_BYTES:
+            raise ValueError(f"dados grandes demais: {len(data)} bytes (máximo {TRANSFER_MAX_BYTES})")
+        name = _clean_name(name)
+        xfer_id = next(self._ids) & 0xFFFFFFFF
+        total = max(1, -(-len(data) // TRANSFER_FRAGMENT_SIZE))
+        prefix = f"!{self.router.ip};{dest};"
+        fragments = [f"{prefix}~D{xfer_id};{seq};{total};{name};".encode('utf-8')
+                     + data[seq * TRANSFER_FRAGMENT_SIZE:(seq + 1) * TRANSFER_FRAGMENT_SIZE]
+                     for seq in range(total)]
+        t = OutgoingTransfer(xfer_id, dest, name, len(data), fragments, self.router.clock(), on_done)
+        with self._lock:
+            self._outgoing[xfer_id] = t
+            out = self._fill_window(t)
+        log.info("cli", "[XFER] Enviando '%s' para %s: %d bytes em %d fragmento(s) (transferência %d)",
+                 name, dest, len(data), total, xfer_id)
+        self._transmit(t, out)
+        return t
+
+    def send_file(self, dest: str, path: str,
+                  on_done: Optional[Callable[[OutgoingTransfer], None]] = None) -> OutgoingTransfer:
+        """Lê o arquivo e o envia (levanta OSError se não der para ler)."""
+        with open(path, "rb") as f:
+            data = f.read()
+        return self.send(dest, data, path, on_done)
+
+    def _fill_window(self, t: OutgoingTransfer) -> List[int]:
+        """Fragmentos novos que cabem na janela (chamar com self._lock)."""
+        limit = min(t.total, t.base + TRANSFER_WINDOW)
+        seqs = list(range(t.next_seq, limit))
+        t.next_seq = max(t.next_seq, limit)
+        return seqs
+
+    def _transmit(self, t: OutgoingTransfer, seqs: List[int], retransmit: bool = False):
+        """Envia os fragmentos seqs e (re)arma o prazo de retransmissão."""
+        if not seqs:
+            return
+        router = self.router
+        now = router.clock()
+        next_hop = router.next_hop_for(t.dest, router.ip)
+        with self._lock:
+            for seq in seqs:
+                t.sent_at[seq] = None if retransmit or seq in t.sent_at else now
+                t.last_sent[seq] = now
+            t.sent += len(seqs)
+            if retransmit:
+                t.retransmits += len(seqs)
+            rto = t.rto
+        self._m_frag_tx.inc(len(seqs))
+        if retransmit:
+            self._m_retx.inc(len(seqs))
+        if next_hop is None or next_hop == router.ip:
+            # sem rota: conta como perdido, o prazo tenta de novo
+            log.debug("tx", "[XFER] Sem rota para %s; %d fragmento(s) perdidos", t.dest, len(seqs))
+        else:
+            for seq in seqs:
+                router.send_to(next_hop, t.fragments[seq])
+        self._arm(t, now + rto)
+
+    def _arm(self, t: OutgoingTransfer, when: float):
+        self.router.scheduler.schedule(("xfer", t.xfer_id), when, partial(self._timeout, t.xfer_id))
+
+    def _on_ack(self, origin: str, xfer_id: int, cumulative: int, sacks: List[int]):
+        now = self.router.clock()
+        with self._lock:
+            t = self._outgoing.get(xfer_id)
+            if t is None or t.dest != origin:
+                return
+            progressed = False
+            newly = [seq for seq in range(t.base, min(cumulative, t.total))] + \
+                    [seq for seq in sacks if 0 <= seq < t.total]
+            for seq in newly:
+                if t.acked[seq]:
+                    continue
+                t.acked[seq] = 1
+                progressed = True
+                sent = t.sent_at.pop(seq, None)
+                if sent is not None:
+                    self._sample_rtt(t, now - sent)
+                t.rack = max(t.rack, t.last_sent.pop(seq, -1.0))
+            while t.base < t.total and t.acked[t.base]:
+                t.base += 1
+            if progressed:
+                t.retries = 0
+            # chegou o ack de um fragmento enviado depois desses: se perderam
+            resend = [seq for seq in range(t.base, t.next_seq)
+                      if not t.acked[seq] and t.last_sent.get(seq, now) < t.rack]
+            finished = t.base >= t.total
+            if finished:
+                del self._outgoing[xfer_id]
+                t.ok = True
+                t.finished = now
+                out: List[int] = []
+            else:
+                out = self._fill_window(t)
+            rto = t.rto
+        if finished:
+            self.router.scheduler.cancel(("xfer", xfer_id))
+            self._finish(t)
+            return
+        if progressed:
+            # o prazo conta a partir do último progresso
+            self._arm(t, now + rto)
+        self._transmit(t, resend, retransmit=True)
+        self._transmit(t, out)
+
+    def _sample_rtt(self, t: OutgoingTransfer, rtt: float):
+        # RFC 6298 (chamar com self._lock)
+        if t.srtt is None:
+            t.srtt = rtt
+            t.rttvar = rtt / 2
+        else:
+            t.rttvar = 0.75 * t.rttvar + 0.25 * abs(t.srtt - rtt)
+            t.srtt = 0.875 * t.srtt + 0.125 * rtt
+        t.rto = min(TRANSFER_RTO_MAX, max(TRANSFER_RTO_MIN, t.srtt + 4 * t.rttvar))
+
+    def _timeout(self, xfer_id: int):
+        with self._lock:
+            t = self._outgoing.get(xfer_id)
+            if t is None:
+                return
+            t.retries += 1
+            if t.retries > TRANSFER_MAX_RETRIES:
+                del self._outgoing[xfer_id]
+                t.finished = self.router.clock()
+                failed = True
+            else:
+                failed = False
+                t.rto = min(TRANSFER_RTO_MAX, t.rto * 2)
+                pending = [seq for seq in range(t.base, t.next_seq) if not t.acked[seq]]
+        if failed:
+            self._finish(t)
+            return
+        log.debug("tx", "[XFER] Prazo da transferência %d venceu: reenviando %d fragmento(s)", xfer_id, len(pending))
+        self._transmit(t, pending, retransmit=True)
+
+    def _finish(self, t: OutgoingTransfer):
+        (self._m_done["tx"] if t.ok else self._m_failed).inc()
+        log.info("cli", "%s", t.report())
+        if t.on_done is not None:
+            t.on_done(t)
+
+    # ------------------------
+    # Recepção
+    # ------------------------
+    def handle(self, origin: str, body: memoryview) -> bool:
+        """Texto de uma mensagem '!origin;<este roteador>;...' que começa com '~'.
+        Retorna False se não for de transferência (a mensagem segue como texto)."""
+        tag = bytes(body[:2])
+        try:
+            if tag == DATA_TAG:
+                self._on_data(origin, body)
+            elif tag == ACK_TAG:
+                fields = str(body[2:], 'ascii').split(";")
+                sacks = [int(s) for s in fields[2].split(",") if s] if len(fields) > 2 else []
+                self._on_ack(origin, int(fields[0]), int(fields[1]), sacks)
+            else:
+                return False
+        except (ValueError, IndexError, UnicodeDecodeError) as e:
+            log.warn("rx", "[WARN] Fragmento de transferência inválido de %s: %s", origin, e)
+        return True
+
+    def _on_data(self, origin: str, body: memoryview):
+        # cabeçalho: ~D<id>;<seq>;<total>;<nome>; (o nome não tem ';')
+        _check_origin(origin)
+        head = bytes(body[:96])
+        ends = []
+        pos = 1
+        for _ in range(4):
+            pos = head.index(b";", pos + 1)
+            ends.append(pos)
+        xfer_id = int(head[2:ends[0]])
+        seq = int(head[ends[0] + 1:ends[1]])
+        total = int(head[ends[1] + 1:ends[2]])
+        if not 0 <= seq < total or total * TRANSFER_FRAGMENT_SIZE > TRANSFER_MAX_BYTES + TRANSFER_FRAGMENT_SIZE:
+            raise ValueError(f"fragmento {seq}/{total} fora dos limites")
+        now = self.router.clock()
+        self._m_frag_rx.inc()
+        key = (origin, xfer_id)
+        with self._lock:
+            t = self._incoming.get(key)
+            if t is None:
+                name = _clean_name(head[ends[2] + 1:ends[3]].decode('utf-8', errors='replace'))
+                t = self._incoming[key] = IncomingTransfer(origin, xfer_id, name, total, now)
+            elif len(t.chunks) != total:
+                raise ValueError(f"total {total} diferente do anterior ({len(t.chunks)})")
+            t.last_seen = now
+            complete = False
+            if t.chunks[seq] is None and not t.done:
+                chunk = bytes(body[ends[3] + 1:])
+                t.chunks[seq] = chunk
+                t.received += 1
+                t.size += len(chunk)
+                while t.next_expected < total and t.chunks[t.next_expected] is not None:
+                    t.next_expected += 1
+                complete = t.received == total
+                if complete:
+                    t.done = True
+            if t.done:
+                ack_next, sacks = total, []
+            else:
+                ack_next = t.next_expected
+                sacks = [s for s in range(ack_next + 1, min(total, ack_next + 1 + TRANSFER_WINDOW))
+                         if t.chunks[s] is not None]
+            if complete:
+                data = b"".join(t.chunks)
+                # os fragmentos já não são necessários: só o registro fica, para reconfirmar duplicados
+                t.chunks = [b""] * total
+        self._send_ack(origin, xfer_id, ack_next, sacks)
+        # a expiração é conferida com last_seen, como as rotas
+        self.router.scheduler.schedule(("xfer_rx", origin, xfer_id), now + TRANSFER_RX_TIMEOUT,
+                                       partial(self._rx_expired, key))
+        if complete:
+            self._deliver(t, data)
+
+    def _send_ack(self, origin: str, xfer_id: int, ack_next: int, sacks: List[int]):
+        router = self.router
+        next_hop = router.next_hop_for(origin, router.ip)
+        if next_hop is None or next_hop == router.ip:
+            return
+        router.send_to(next_hop, f"!{router.ip};{origin};~A{xfer_id};{ack_next};{','.join(map(str, sacks))}")
+
+    def _deliver(self, t: IncomingTransfer, data: bytes):
+        elapsed = max(self.router.clock() - t.started, 1e-9)
+        self._m_done["rx"].inc()
+        where = ""
+        if self.save_dir:
+            path = os.path.join(self.save_dir, f"{t.origin}_{t.name}")
+            try:
+                os.makedirs(self.save_dir, exist_ok=True)
+                root = os.path.realpath(self.save_dir)
+                if os.path.dirname(os.path.realpath(path)) != root:
+                    raise OSError(f"caminho fora de {self.save_dir}")
+                with open(path, "wb") as f:
+                    f.write(data)
+                where = f", salvo em {path}"
+            except OSError as e:
+                log.warn("rx", "[WARN] Não foi possível salvar '%s' de %s: %s", t.name, t.origin, e)
+        log.info("rx", "[XFER] '%s' recebido de %s: %d bytes em %.2fs (%.1f KiB/s)%s",
+                 t.name, t.origin, len(data), elapsed, len(data) / elapsed / 1024, where)
+        if self.on_receive is not None:
+            self.on_receive(t, data)
+
+    def _rx_expired(self, key: Tuple[str, int]):
+        now = self.router.clock()
+        with self._lock:
+            t = self._incoming.get(key)
+            if t is None:
+                return
+            deadline = t.last_seen + TRANSFER_RX_TIMEOUT
+            if deadline > now:
+                # compara o prazo em si, como Router._neighbor_expired
+                self.router.scheduler.schedule(("xfer_rx",) + key, deadline, partial(self._rx_expired, key))
+                return
+            del self._incoming[key]
+        if not t.done:
+            log.info("rx", "[XFER] Transferência %d de %s abandonada: %d de %d fragmento(s)",
+                     t.xfer_id, t.origin, t.received, len(t.chunks))
+
+    def status_text(self) -> str:
+        """Transferências em andamento (comando da CLI)."""
+        with self._lock:
+            lines = [f"[XFER] -> {t.dest} '{t.name}': {t.base}/{t.total} fragmento(s) confirmados, "
+                     f"{t.retransmits} retransmitidos, RTO {t.rto:.2f}s" for t in self._outgoing.values()]
+            lines += [f"[XFER] <- {t.origin} '{t.name}': {t.received}/{len(t.chunks)} fragmento(s)"
+                      for t in self._incoming.values() if not t.done]
+        return "\n".join(lines) if lines else "[XFER] Nenhuma transferência em andamento."
+
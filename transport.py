@@ -0,0 +1,252 @@
+# transport.py
+"""Transportes de datagramas do roteador.
+
+O Router só fala com a rede por um transporte: sendto() para enviar e
+recv_into() (usado pelo listener) para receber.
+
+- UdpTransport: socket UDP real em (ip, PORT). É o padrão.
+- VirtualTransport/VirtualNetwork: rede em memória para simular topologias
+  inteiras num processo só. A VirtualNetwork tem relógio virtual e uma fila
+  única de eventos (entregas de datagramas e prazos dos escalonadores dos
+  roteadores); run_until() processa tudo em ordem, sem threads nem sleeps.
+  Empates no mesmo instante são desfeitos por (destino, origem, ordem de
+  envio), então a simulação é determinística (para um mesmo PYTHONHASHSEED,
+  que decide a ordem de iteração dos sets de vizinhos).
+
+Na simulação os roteadores não chamam start(): VirtualNetwork.start_router()
+faz o equivalente sem criar threads.
+"""
+import heapq
+import itertools
+import random
+import socket
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple, Union
+
+from constants import PORT, SOCKET_RCVBUF
+from scheduler import Scheduler
+
+Datagram = Union[bytes, bytearray, memoryview]
+
+
+class UdpTransport:
+    def __init__(self, ip: str, port: int = PORT):
+        self.ip = ip
+        self.port = port
+        self.sock: Optional[socket.socket] = None
+        self.open()
+
+    def open(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            # rajadas de fragmentos de tabelas grandes
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_RCVBUF)
+        except OSError:
+            pass
+        sock.bind((self.ip, self.port))
+        sock.settimeout(1.0)
+        self.sock = sock
+
+    @property
+    def closed(self) -> bool:
+        return self.sock is None
+
+    def sendto(self, data: Datagram, dest_ip: str):
+        self.sock.sendto(data, (dest_ip, self.port))
+
+    def recv_into(self, buf: bytearray) -> Tuple[int, str]:
+        """Bloqueia até chegar um datagrama (ou socket.timeout). Retorna (bytes, ip de origem)."""
+        nbytes, addr = self.sock.recvfrom_into(buf)
+        return nbytes, addr[0]
+
+    def close(self):
+        sock, self.sock = self.sock, None
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+
+# ------------------------
+# Rede virtual
+# ------------------------
+class VirtualClock:
+    def __init__(self, start: float = 0.0):
+        self.now = start
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class SimScheduler(Scheduler):
+    """Escalonador de um roteador simulado. Em vez de uma thread, a
+    VirtualNetwork chama fire() no instante do prazo mais próximo; só um
+    evento por roteador fica armado na fila da rede por vez."""
+
+    def __init__(self, network: "VirtualNetwork", ip: str):
+        super().__init__(clock=network.clock)
+        self._network = network
+        self._ip = ip
+        # instante do evento armado na fila da rede (None = nenhum)
+        self._armed: Optional[float] = None
+
+    def schedule(self, key, when: float, callback: Callable[[], None]):
+        super().schedule(key, when, callback)
+        self._arm(when)
+
+    def _arm(self, when: float):
+        if self._armed is None or when < self._armed:
+            self._armed = when
+            self._network._wake(when, self._ip)
+
+    def fire(self, when: float):
+        if when != self._armed:
+            # evento substituído por um prazo mais próximo
+            return
+        self._armed = None
+        nxt = self.run_pending(when)
+        if nxt is not None:
+            self._arm(nxt)
+
+
+class VirtualTransport:
+    def __init__(self, network: "VirtualNetwork", ip: str):
+        self.network = network
+        self.ip = ip
+        self.closed = False
+
+    def sendto(self, data: Datagram, dest_ip: str):
+        self.network._send(self.ip, dest_ip, bytes(data))
+
+    def recv_into(self, buf: bytearray) -> Tuple[int, str]:
+        raise OSError("transporte virtual: os datagramas são entregues pela VirtualNetwork")
+
+    def open(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class VirtualNetwork:
+    """Rede em memória: enlaces ponto a ponto com latência fixa, que podem
+    cair, e roteadores que podem falhar (param de receber, enviar e processar).
+    loss é a probabilidade de um datagrama se perder em cada enlace (sorteio
+    reprodutível com seed)."""
+
+    def __init__(self, latency: float = 0.001, loss: float = 0.0, seed: Optional[int] = None):
+        self.clock = VirtualClock()
+        self.latency = latency
+        self.loss = loss
+        self._rng = random.Random(seed)
+        self.routers: Dict[str, object] = {}
+        self._links: Set[Tuple[str, str]] = set()
+        self._down_links: Set[Tuple[str, str]] = set()
+        self._down_routers: Set[str] = set()
+        # eventos: (instante, tipo, destino, origem, seq, datagrama). tipo 0 = prazo, 1 = entrega
+        self._events: List[Tuple[float, int, str, str, int, Optional[bytes]]] = []
+        self._seq = itertools.count()
+        # estatísticas da simulação
+        self.sent: Dict[str, Tuple[int, int]] = {}
+        self.dropped = 0
+        self.cpu: Dict[str, float] = {}
+        # chamado depois de cada evento processado por um roteador (ip, instante)
+        self.on_event: Optional[Callable[[str, float], None]] = None
+
+    # ------------------------
+    # Montagem
+    # ------------------------
+    def scheduler_for(self, ip: str) -> SimScheduler:
+        return SimScheduler(self, ip)
+
+    def transport_for(self, ip: str) -> VirtualTransport:
+        return VirtualTransport(self, ip)
+
+    def add_link(self, a: str, b: str):
+        self._links.add((a, b))
+        self._links.add((b, a))
+
+    def add_router(self, router):
+        """router deve ter sido criado com transport_for(ip) e scheduler_for(ip)."""
+        self.routers[router.ip] = router
+        self.sent.setdefault(router.ip, (0, 0))
+        self.cpu.setdefault(router.ip, 0.0)
+
+    def start_router(self, router):
+        """Equivalente a Router.start() sem threads: agenda os prazos e manda o '@'."""
+        self._run(router.ip, lambda: (router.schedule_timers(), router.send_announcement_self()))
+
+    # ------------------------
+    # Falhas
+    # ------------------------
+    def set_link(self, a: str, b: str, up: bool):
+        for pair in ((a, b), (b, a)):
+            if up:
+                self._down_links.discard(pair)
+            else:
+                self._down_links.add(pair)
+
+    def set_router(self, ip: str, up: bool):
+        if up:
+            if ip in self._down_routers:
+                self._down_routers.discard(ip)
+                # os prazos que venceram enquanto estava fora rodam agora
+                sched = self.routers[ip].scheduler
+                sched._armed = None
+                nxt = sched.next_deadline()
+                if nxt is not None:
+                    sched._arm(max(nxt, self.clock.now))
+        else:
+            self._down_routers.add(ip)
+
+    def link_up(self, a: str, b: str) -> bool:
+        return ((a, b) in self._links and (a, b) not in self._down_links
+                and a not in self._down_routers and b not in self._down_routers)
+
+    def router_up(self, ip: str) -> bool:
+        return ip not in self._down_routers
+
+    # ------------------------
+    # Eventos
+    # ------------------------
+    def _wake(self, when: float, ip: str):
+        heapq.heappush(self._events, (when, 0, ip, "", next(self._seq), None))
+
+    def _send(self, src: str, dest: str, data: bytes):
+        packets, nbytes = self.sent.get(src, (0, 0))
+        self.sent[src] = (packets + 1, nbytes + len(data))
+        if not self.link_up(src, dest) or (self.loss and self._rng.random() < self.loss):
+            self.dropped += 1
+            return
+        heapq.heappush(self._events, (self.clock.now + self.latency, 1, dest, src, next(self._seq), data))
+
+    def _run(self, ip: str, fn: Callable[[], None]):
+        t0 = time.process_time()
+        fn()
+        self.cpu[ip] += time.process_time() - t0
+        if self.on_event is not None:
+            self.on_event(ip, self.clock.now)
+
+    def run_until(self, t_end: float) -> int:
+        """Processa todos os eventos até o instante t_end (virtual) e deixa o
+        relógio em t_end. Retorna quantos eventos foram processados."""
+        events = self._events
+        processed = 0
+        while events and events[0][0] <= t_end:
+            when, kind, dest, src, _, data = heapq.heappop(events)
+            self.clock.now = max(self.clock.now, when)
+            router = self.routers.get(dest)
+            if router is None or dest in self._down_routers:
+                continue
+            if kind == 1:
+                if not self.link_up(src, dest):
+                    # enlace caiu com o datagrama em trânsito
+                    self.dropped += 1
+                    continue
+                self._run(dest, lambda: router.dispatch(data, src))
+            else:
+                self._run(dest, lambda: router.scheduler.fire(when))
+            processed += 1
+        self.clock.now = max(self.clock.now, t_end)
+        return processed
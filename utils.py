@@ -1,38 +1,385 @@
 # utils.py
 """Funções utilitárias para roteamento: tempo, serialização e parsing."""
+import socket
+import struct
 import time
-from typing import Dict, Tuple
+from typing import Collection, Dict, Iterable, List, Optional, Tuple, Union
+from constants import MAX_DATAGRAM_PAYLOAD, INFINITY_METRIC
 
-# Tipo da entrada na tabela: (metric:int, next_hop:str, last_updated_ts:float, origin:str)
-RouteEntry = Tuple[int, str, float, str]
+# Linha de um snapshot da tabela: (dest, metric:int, next_hop:str, origin:str)
+RouteRow = Tuple[int, int, str, str]
+
+# Destinos são prefixos IPv4 codificados num int: os 32 bits de baixo são o
+# endereço (com os bits de host zerados) e os de cima, 32 - comprimento. Um
+# endereço /32 é o próprio ip_to_int(ip), então rotas de host continuam com a
+# mesma chave de sempre. Ver prefix_key / split_key / format_dest / parse_dest.
+HOST_PREFIX_LEN = 32
+
+# Prefixo dos anúncios incrementais: '+*IP;METRIC...' (só as rotas alteradas)
+DELTA_PREFIX = "+"
+
+# Tabela completa dividida em vários datagramas: '#GEN;SEQ;TOTAL*IP;METRIC...'.
+# O receptor só considera rotas retiradas depois de ter todos os SEQ da geração.
+# Parsers antigos ignoram o cabeçalho (três campos não formam 'IP;METRIC').
+CHUNK_PREFIX = "#"
+# (geração, índice, total) de um fragmento
+ChunkInfo = Tuple[int, int, int]
+_TEXT_CHUNK_HEADER_MAX = 32
+
+# ------------------------
+# Formato binário dos anúncios de rotas
+# ------------------------
+# Cabeçalho: magic, versão, flags, quantidade de rotas (N), geração, índice e
+# total de fragmentos (total=1: anúncio num único datagrama). Depois, em colunas:
+# N endereços IPv4 (uint32, big-endian) seguidos de N métricas (1 byte cada),
+# 5 bytes por rota. Se algum destino não for /32, FLAG_PREFIX liga uma terceira
+# coluna com os N comprimentos de prefixo (1 byte cada). O layout em colunas
+# permite decodificar tudo com um único struct.unpack_from e fatiar as métricas
+# direto do memoryview.
+# O magic 0xB7 nunca inicia um texto UTF-8 válido, então não colide com
+# '@', '!', '*' nem '+'.
+BINARY_MAGIC = 0xB7
+# versão 3: coluna de prefixos (a versão 2 só tinha hosts /32)
+WIRE_VERSION = 3
+FLAG_DELTA = 0x01
+FLAG_PREFIX = 0x02
+# o remetente entende os hellos com intervalo (o HELLO_CAPABILITY_TOKEN dos anúncios binários)
+FLAG_HELLO = 0x04
+_BIN_HEADER = struct.Struct("!BBBHIHH")
+_BIN_ROUTE_SIZE = 5
+_MAX_BIN_METRIC = 0xFF
+
+# Marcador de capacidade anexado aos anúncios em texto de quem entende o formato
+# binário. Parsers antigos ignoram o pedaço (não tem ';'), então roteadores
+# só-texto continuam interoperando; roteadores com outra versão do formato não
+# reconhecem o marcador e continuam recebendo texto.
+CAPABILITY_TOKEN = f"*CAP=BIN{WIRE_VERSION}"
+# Marcador de suporte aos hellos com intervalo e pedido de tabela (abaixo),
+# anexado a todo anúncio em texto e ignorado pelos parsers antigos do mesmo jeito.
+# Nos anúncios binários o mesmo suporte vai no FLAG_HELLO do cabeçalho.
+HELLO_CAPABILITY_TOKEN = "*CAP=IVL"
+
+# Hello com o intervalo atual entre as tabelas completas do remetente:
+# '@IP*IVL=SEGUNDOS', e '*REQ' no fim para pedir a tabela completa de quem
+# recebe (quem perdeu uma rota não espera o anúncio espaçado dos vizinhos).
+# Quem recebe ajusta o prazo das rotas aprendidas do remetente; quem envia só
+# espaça as tabelas se todos os vizinhos ativos mandaram o seu intervalo.
+# Esse hello só vai para quem anunciou HELLO_CAPABILITY_TOKEN: um roteador
+# antigo não valida o IP do '@' e guardaria '10.0.0.2*IVL=10' como destino e
+# vizinho. Os demais recebem '@IP' e continuam recebendo a tabela no
+# intervalo base.
+INTERVAL_TOKEN = "*IVL="
+REQUEST_TOKEN = "*REQ"
+
+# Prevenção de laços no anúncio para um vizinho das rotas aprendidas por ele:
+# 'none' anuncia tudo, 'split' (Split Horizon) omite essas rotas e 'poison'
+# (Poison Reverse) as anuncia com a métrica infinita.
+LOOP_PREVENTION_MODES = ("none", "split", "poison")
+
+# caches 'a.b.c.d' <-> int (os mesmos destinos se repetem a cada anúncio)
+_IP_STR_CACHE: Dict[int, str] = {}
+_IP_INT_CACHE: Dict[str, int] = {}
+_IP_CACHE_MAX = 1 << 16
 
 def now_ts() -> float:
     return time.time()
 
-def serialize_table_for_neighbor(table: Dict[str, RouteEntry], neighbor_ip: str, self_ip: str) -> str:
-    """Serializa tabela conforme especificação '*IP;METRIC*IP;METRIC...'.
-    Aplica Split Horizon usando flag 'origin':
-      - Não inclui rotas para self_ip.
-      - Não anuncia rotas 'learned' cujo next_hop == neighbor_ip.
-      - Rotas 'local' sempre podem ser anunciadas.
-    """
-    parts = []
-    for dest, (metric, next_hop, _, origin) in table.items():
-        if dest == self_ip:
+def ip_to_int(ip: str) -> int:
+    """'a.b.c.d' -> inteiro de 32 bits. Levanta OSError se não for IPv4."""
+    value = _IP_INT_CACHE.get(ip)
+    if value is None:
+        if len(_IP_INT_CACHE) >= _IP_CACHE_MAX:
+            _IP_INT_CACHE.clear()
+        value = _IP_INT_CACHE[ip] = int.from_bytes(socket.inet_aton(ip), "big")
+    return value
+
+def int_to_ip(value: int) -> str:
+    ip = _IP_STR_CACHE.get(value)
+    if ip is None:
+        if len(_IP_STR_CACHE) >= _IP_CACHE_MAX:
+            _IP_STR_CACHE.clear()
+        ip = _IP_STR_CACHE[value] = socket.inet_ntoa(value.to_bytes(4, "big"))
+    return ip
+
+def prefix_key(addr: int, length: int) -> int:
+    """Chave do prefixo addr/length (bits de host de addr são zerados)."""
+    if not 0 <= length <= HOST_PREFIX_LEN:
+        raise ValueError(f"comprimento de prefixo inválido: {length}")
+    host_bits = HOST_PREFIX_LEN - length
+    return ((addr >> host_bits) << host_bits) | (host_bits << 32)
+
+def split_key(key: int) -> Tuple[int, int]:
+    """Chave -> (endereço, comprimento do prefixo)."""
+    return key & 0xFFFFFFFF, HOST_PREFIX_LEN - (key >> 32)
+
+def format_dest(key: int) -> str:
+    """'a.b.c.d' para hosts (/32) e 'a.b.c.d/len' para os demais prefixos."""
+    if key >> 32 == 0:
+        return int_to_ip(key)
+    addr, length = split_key(key)
+    return f"{int_to_ip(addr)}/{length}"
+
+def parse_dest(text: str) -> int:
+    """'a.b.c.d' ou 'a.b.c.d/len' -> chave. Levanta ValueError se for inválido."""
+    ip, sep, length = text.partition("/")
+    try:
+        addr = ip_to_int(ip.strip())
+    except OSError:
+        raise ValueError(f"endereço IPv4 inválido: {ip!r}")
+    if not sep:
+        return addr
+    return prefix_key(addr, int(length))
+
+def is_binary_announcement(data: Union[bytes, bytearray, memoryview]) -> bool:
+    return len(data) > 0 and data[0] == BINARY_MAGIC
+
+def describe_datagram(data: Union[bytes, bytearray, memoryview]) -> str:
+    """Resumo para log de um datagrama em bytes, sem decodificá-lo."""
+    kind = "binário " if is_binary_announcement(data) else ""
+    return f"<{kind}{len(data)} bytes>"
+
+def _encode_binary(routes: List[Tuple[int, int]], delta: bool,
+                   generation: int = 0, seq: int = 0, total: int = 1) -> bytes:
+    count = len(routes)
+    prefixes = any(dest >> 32 for dest, _ in routes)
+    flags = FLAG_HELLO | (FLAG_DELTA if delta else 0) | (FLAG_PREFIX if prefixes else 0)
+    header = _BIN_HEADER.pack(BINARY_MAGIC, WIRE_VERSION, flags, count,
+                              generation & 0xFFFFFFFF, seq, total)
+    addrs = struct.pack(f"!{count}I", *[dest & 0xFFFFFFFF for dest, _ in routes])
+    metrics = bytes([min(metric, _MAX_BIN_METRIC) for _, metric in routes])
+    if not prefixes:
+        return header + addrs + metrics
+    lengths = bytes([HOST_PREFIX_LEN - (dest >> 32) for dest, _ in routes])
+    return header + addrs + metrics + lengths
+
+def _encode_binary_chunks(pairs: List[Tuple[int, int]], delta: bool, generation: int,
+                          max_size: int) -> List[bytes]:
+    # com a coluna de prefixos cada rota ocupa um byte a mais
+    route_size = _BIN_ROUTE_SIZE + 1 if any(dest >> 32 for dest, _ in pairs) else _BIN_ROUTE_SIZE
+    per_chunk = max(1, (max_size - _BIN_HEADER.size) // route_size)
+    slices = [pairs[i:i + per_chunk] for i in range(0, len(pairs), per_chunk)] or [[]]
+    if delta:
+        # fragmentos incrementais são independentes entre si
+        return [_encode_binary(part, True) for part in slices]
+    total = len(slices)
+    return [_encode_binary(part, False, generation, seq, total) for seq, part in enumerate(slices)]
+
+def _capabilities(advertise_binary: bool) -> str:
+    """Marcadores de capacidade anexados aos anúncios em texto."""
+    return (CAPABILITY_TOKEN if advertise_binary else "") + HELLO_CAPABILITY_TOKEN
+
+def _encode_text_chunks(pairs: List[Tuple[int, int]], delta: bool, generation: int,
+                        max_size: int, suffix: str) -> List[str]:
+    entries = [f"*{format_dest(dest)};{metric}" for dest, metric in pairs]
+    budget = max_size - len(suffix) - _TEXT_CHUNK_HEADER_MAX
+    groups: List[List[str]] = []
+    current: List[str] = []
+    size = 0
+    for entry in entries:
+        if current and size + len(entry) > budget:
+            groups.append(current)
+            current, size = [], 0
+        current.append(entry)
+        size += len(entry)
+    groups.append(current)
+    if delta:
+        return [DELTA_PREFIX + "".join(g) + suffix for g in groups]
+    if len(groups) == 1:
+        # cabe num datagrama: mesmo formato de sempre
+        return ["".join(groups[0]) + suffix]
+    total = len(groups)
+    return [f"{CHUNK_PREFIX}{generation & 0xFFFFFFFF};{seq};{total}" + "".join(g) + suffix
+            for seq, g in enumerate(groups)]
+
+def _routes_for_neighbor(routes: Iterable[RouteRow], neighbor_ip: str, self_ip: str,
+                         loop_prevention: str, infinity: int, delta: bool,
+                         via_alternate: Collection[int] = ()) -> List[Tuple[int, int]]:
+    self_key = ip_to_int(self_ip)
+    if loop_prevention == "none":
+        return [(dest, metric) for dest, metric, next_hop, origin in routes if dest != self_key]
+    # via_alternate: destinos em que neighbor_ip é um dos caminhos ECMP; contam
+    # como aprendidos dele, senão a rota volta para ele por outro next_hop
+    # num anúncio incremental, omitir não desfaz o que o vizinho já recebeu
+    # antes: com Split Horizon a rota vai como retirada
+    if loop_prevention == "poison" or delta:
+        return [(dest, infinity if origin == "learned" and (next_hop == neighbor_ip or dest in via_alternate)
+                 else metric)
+                for dest, metric, next_hop, origin in routes if dest != self_key]
+    return [(dest, metric) for dest, metric, next_hop, origin in routes
+            if dest != self_key and (origin != "learned" or (next_hop != neighbor_ip and dest not in via_alternate))]
+
+def summarize_routes(pairs: Iterable[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Junta prefixos irmãos (a.b.c.0/25 + a.b.c.128/25 -> a.b.c.0/24) com a
+    mesma métrica, repetidamente, do /32 para cima, e tira os prefixos cujo
+    menos específico mais próximo tem a mesma métrica. A junção só acontece se
+    o pai não existir ou já tiver a mesma métrica, então o longest-prefix match
+    do receptor dá a mesma métrica para qualquer endereço (sem cobrir endereços
+    a mais)."""
+    levels: Dict[int, Dict[int, int]] = {}
+    for dest, metric in pairs:
+        addr, length = split_key(dest)
+        levels.setdefault(length, {})[addr] = metric
+    for length in range(HOST_PREFIX_LEN, 0, -1):
+        level = levels.get(length)
+        if not level:
             continue
-        parts.append(f"*{dest};{metric}")
-    return "".join(parts)
+        bit = 1 << (HOST_PREFIX_LEN - length)
+        parent_level = levels.setdefault(length - 1, {})
+        for addr in list(level):
+            # cada par é tratado a partir do irmão de bit 0
+            if addr & bit:
+                continue
+            metric = level.get(addr)
+            if metric is None or level.get(addr | bit) != metric:
+                continue
+            if parent_level.get(addr, metric) != metric:
+                continue
+            del level[addr]
+            del level[addr | bit]
+            parent_level[addr] = metric
+    # prefixos cobertos por um menos específico de mesma métrica são redundantes
+    lengths = sorted((length for length, level in levels.items() if level), reverse=True)
+    res = []
+    for i, length in enumerate(lengths):
+        for addr, metric in levels[length].items():
+            covering = None
+            for shorter in lengths[i + 1:]:
+                host_bits = HOST_PREFIX_LEN - shorter
+                covering = levels[shorter].get((addr >> host_bits) << host_bits)
+                if covering is not None:
+                    break
+            if covering is None or covering != metric:
+                res.append((prefix_key(addr, length), metric))
+    return res
+
+def serialize_table_for_neighbor(routes: Iterable[RouteRow], neighbor_ip: str, self_ip: str,
+                                 binary: bool = False, generation: int = 0,
+                                 advertise_binary: bool = False,
+                                 max_size: int = MAX_DATAGRAM_PAYLOAD,
+                                 loop_prevention: str = "split",
+                                 infinity: int = INFINITY_METRIC,
+                                 summarize: bool = False,
+                                 via_alternate: Collection[int] = ()) -> List[Union[str, bytes]]:
+    """Serializa tabela conforme especificação '*IP;METRIC*IP;METRIC...'
+    (ou no formato binário, se binary=True). routes é um snapshot da tabela.
+    Retorna a lista de datagramas: se a tabela não couber em max_size bytes ela é
+    dividida em fragmentos da geração informada ('#GEN;SEQ;TOTAL...').
+    Os datagramas em texto levam HELLO_CAPABILITY_TOKEN e, com advertise_binary,
+    CAPABILITY_TOKEN. Não inclui a rota para self_ip. Rotas 'learned' cujo next_hop == neighbor_ip
+    seguem loop_prevention (ver LOOP_PREVENTION_MODES), assim como as dos destinos
+    em via_alternate (neighbor_ip é alternate ECMP); rotas 'local' sempre
+    podem ser anunciadas. summarize junta prefixos contíguos (summarize_routes).
+    """
+    pairs = _routes_for_neighbor(routes, neighbor_ip, self_ip, loop_prevention, infinity, False,
+                                 via_alternate)
+    if summarize:
+        pairs = summarize_routes(pairs)
+    if binary:
+        return _encode_binary_chunks(pairs, False, generation, max_size)
+    return _encode_text_chunks(pairs, False, generation, max_size, _capabilities(advertise_binary))
+
+def serialize_delta_for_neighbor(routes: Iterable[RouteRow], neighbor_ip: str, self_ip: str,
+                                 binary: bool = False, advertise_binary: bool = False,
+                                 max_size: int = MAX_DATAGRAM_PAYLOAD,
+                                 loop_prevention: str = "split",
+                                 infinity: int = INFINITY_METRIC,
+                                 via_alternate: Collection[int] = ()) -> List[Union[str, bytes]]:
+    """Serializa só os destinos alterados: '+*IP;METRIC...' (ou binário com FLAG_DELTA),
+    em quantos datagramas independentes forem necessários.
+    Destinos retirados da tabela devem vir com a métrica infinita. Com 'split' e
+    'poison', rotas aprendidas de neighbor_ip (ou com ele em via_alternate) vão
+    para ele como retirada.
+    Retorna lista vazia se não houver nada a anunciar para esse vizinho."""
+    pairs = _routes_for_neighbor(routes, neighbor_ip, self_ip, loop_prevention, infinity, True,
+                                 via_alternate)
+    if not pairs:
+        return []
+    if binary:
+        return _encode_binary_chunks(pairs, True, 0, max_size)
+    return _encode_text_chunks(pairs, True, 0, max_size, _capabilities(advertise_binary))
+
+def parse_chunk_header(msg: str) -> Optional[ChunkInfo]:
+    """Lê o cabeçalho '#GEN;SEQ;TOTAL' de um fragmento em texto (None se não houver).
+    Levanta ValueError se o cabeçalho for inválido."""
+    if not msg.startswith(CHUNK_PREFIX):
+        return None
+    end = msg.find("*")
+    head = msg[len(CHUNK_PREFIX):end if end >= 0 else len(msg)]
+    try:
+        generation, seq, total = (int(x) for x in head.split(";"))
+    except ValueError:
+        raise ValueError(f"cabeçalho de fragmento inválido: {head!r}")
+    if total < 1 or not 0 <= seq < total:
+        raise ValueError(f"fragmento {seq}/{total} inválido")
+    return generation, seq, total
+
+def format_hello(ip: str, interval: Optional[float] = None, request: bool = False) -> str:
+    """'@IP', com interval '@IP*IVL=SEGUNDOS' e com request '...*REQ'."""
+    msg = f"@{ip}" if interval is None else f"@{ip}{INTERVAL_TOKEN}{interval:g}"
+    return msg + REQUEST_TOKEN if request else msg
 
-def parse_route_announcement(msg: str) -> Dict[str, int]:
-    """Converte string '*IP;METRIC*IP;METRIC' em dict IP->metric."""
-    res: Dict[str, int] = {}
+def parse_hello(msg: str) -> Tuple[str, Optional[float], bool]:
+    """Separa o corpo de um hello (sem o '@') em (IP, intervalo ou None, pedido
+    de tabela). Intervalo inválido vira None; o IP não é validado aqui."""
+    request = msg.endswith(REQUEST_TOKEN)
+    if request:
+        msg = msg[:-len(REQUEST_TOKEN)]
+    ip, sep, interval = msg.partition(INTERVAL_TOKEN)
+    if not sep:
+        return ip, None, request
+    try:
+        value = float(interval)
+    except ValueError:
+        return ip, None, request
+    return ip, (value if 0 < value < float("inf") else None), request
+
+def parse_route_announcement(msg: str) -> Dict[int, int]:
+    """Converte string '*IP;METRIC*IP/LEN;METRIC' em dict destino->metric
+    (chaves de parse_dest)."""
+    res: Dict[int, int] = {}
     if not msg:
         return res
     chunks = [c for c in msg.split("*") if c]
     for c in chunks:
         try:
             ip, metric_s = c.split(";")
-            res[ip] = int(metric_s)
+            res[parse_dest(ip) if "/" in ip else ip_to_int(ip)] = int(metric_s)
         except Exception:
             continue
     return res
+
+def binary_hello_capable(data: Union[bytes, bytearray, memoryview]) -> bool:
+    """Se o anúncio binário traz FLAG_HELLO (sem decodificar o resto)."""
+    return len(data) > 2 and bool(data[2] & FLAG_HELLO)
+
+def parse_binary_announcement(data: Union[bytes, bytearray, memoryview]
+                              ) -> Tuple[bool, Optional[ChunkInfo], Dict[int, int]]:
+    """Decodifica um anúncio binário direto do buffer (sem passar por str).
+    Retorna (delta, fragmento ou None, dict destino->metric). Levanta ValueError
+    se o datagrama for inválido, de outra versão ou estiver truncado."""
+    view = memoryview(data)
+    if len(view) < 3:
+        raise ValueError("anúncio binário menor que o cabeçalho")
+    magic, version, flags = view[0], view[1], view[2]
+    if magic != BINARY_MAGIC:
+        raise ValueError("magic inválido")
+    if version != WIRE_VERSION:
+        raise ValueError(f"versão {version} não suportada")
+    if len(view) < _BIN_HEADER.size:
+        raise ValueError("anúncio binário menor que o cabeçalho")
+    _, _, _, count, generation, seq, total = _BIN_HEADER.unpack_from(view)
+    if total < 1 or seq >= total:
+        raise ValueError(f"fragmento {seq}/{total} inválido")
+    metrics_at = _BIN_HEADER.size + 4 * count
+    lengths_at = metrics_at + count
+    if len(view) < (lengths_at + count if flags & FLAG_PREFIX else lengths_at):
+        raise ValueError("anúncio binário truncado")
+    addrs = struct.unpack_from(f"!{count}I", view, _BIN_HEADER.size)
+    if flags & FLAG_PREFIX:
+        try:
+            addrs = [prefix_key(addr, length) for addr, length in zip(addrs, view[lengths_at:lengths_at + count])]
+        except ValueError as e:
+            raise ValueError(f"anúncio binário com prefixo inválido: {e}")
+    routes = dict(zip(addrs, view[metrics_at:metrics_at + count]))
+    chunk = (generation, seq, total) if total > 1 else None
+    return bool(flags & FLAG_DELTA), chunk, routes